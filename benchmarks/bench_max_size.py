@@ -0,0 +1,79 @@
+"""Benchmark measuring output sizes when stripping image-heavy notebooks.
+
+Compares the unbounded recursive `get_size` nbstripout used to call on every output with the bounded measurement
+`strip_output` now does, for the default `--max-size 0` and a small and a large threshold.
+
+    python benchmarks/bench_max_size.py [--cells N] [--image-size BYTES] [--repeat N]
+"""
+
+from argparse import ArgumentParser
+import base64
+import copy
+import os
+import timeit
+from typing import Any
+
+from nbstripout._utils import get_size
+
+
+def unbounded_get_size(item: Any) -> int:
+    """Previous implementation of `get_size`, always measuring everything."""
+    if isinstance(item, str):
+        return len(item)
+    elif isinstance(item, list):
+        return sum(unbounded_get_size(elem) for elem in item)
+    elif isinstance(item, dict):
+        return unbounded_get_size(list(item.values()))
+    else:
+        return len(str(item))
+
+
+def make_notebook(num_cells: int, image_size: int) -> dict:
+    """An nbformat 4 notebook with a PNG image split into lines and some text output in every cell."""
+    image = base64.encodebytes(os.urandom(image_size)).decode()
+    output = {
+        'output_type': 'display_data',
+        'data': {'image/png': image.splitlines(True), 'text/plain': ['<Figure size 640x480 with 1 Axes>']},
+        'metadata': {'needs_background': 'light'},
+    }
+    stream = {'output_type': 'stream', 'name': 'stdout', 'text': ['line\n'] * 20}
+    return {
+        'nbformat': 4,
+        'nbformat_minor': 5,
+        'metadata': {},
+        'cells': [
+            {
+                'cell_type': 'code',
+                'execution_count': i,
+                'id': str(i),
+                'metadata': {},
+                'source': ['plot()'],
+                'outputs': [copy.deepcopy(stream), copy.deepcopy(output)],
+            }
+            for i in range(num_cells)
+        ],
+    }
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cells', type=int, default=200, help='Number of cells (default: 200)')
+    parser.add_argument('--image-size', type=int, default=100_000, help='Size of each image in bytes (default: 100k)')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of repetitions, the best is reported')
+    args = parser.parse_args()
+
+    nb = make_notebook(args.cells, args.image_size)
+    outputs = [output for cell in nb['cells'] for output in cell['outputs']]
+    print(f'{args.cells} cells with {len(outputs)} outputs, {unbounded_get_size(nb) / 1e6:.1f} MB of strings')
+
+    def time(stmt) -> float:
+        return min(timeit.repeat(stmt, number=1, repeat=args.repeat))
+
+    for max_size in (0, 1000, 10**6):
+        before = time(lambda: [unbounded_get_size(output) <= max_size for output in outputs])
+        after = time(lambda: [max_size > 0 and get_size(output, limit=max_size) <= max_size for output in outputs])
+        print(f'max_size={max_size:>7}: measuring {before * 1e3:8.2f} ms before, {after * 1e3:8.2f} ms after')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""Benchmark suite timing nbstripout on a synthetic notebook corpus.
+
+Times `strip_output` on notebooks in memory, the full round trip through `process_jupyter_notebook` (reading,
+stripping and writing a notebook), the cold start of the command line interface and stripping a batch of files with
+the command line interface, and reports throughput and peak memory. Save the results of a commit with --save and
+compare another commit against them with --compare:
+
+    python benchmarks/bench_suite.py --save before.json
+    python benchmarks/bench_suite.py --compare before.json
+
+See `python benchmarks/corpus.py --help` for the options controlling the shape of the notebooks.
+"""
+
+from argparse import ArgumentParser
+import copy
+from dataclasses import asdict
+import io
+import json
+import os
+import platform
+from subprocess import DEVNULL, PIPE, check_output, run
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+from corpus import Shape, add_shape_arguments, dumps, make_notebook, shape_from_args, write_corpus
+
+from nbstripout import strip_output
+from nbstripout._nbstripout import (
+    DEFAULT_EXTRA_KEYS,
+    _build_parser,
+    process_jupyter_notebook,
+    process_zeppelin_notebook,
+)
+from nbstripout._utils import strip_zeppelin_output
+
+
+def best_of(repeat: int, setup: Callable[[], Any], run: Callable[[Any], None]) -> float:
+    """Best time of `repeat` runs of `run`, passing it a fresh result of `setup` which is not timed."""
+    # Warm up, e.g. import nbformat, which is imported on first use
+    run(setup())
+    times = []
+    for _ in range(repeat):
+        state = setup()
+        start = time.perf_counter()
+        run(state)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def peak_memory(setup: Callable[[], Any], run: Callable[[Any], None]) -> int:
+    """Peak memory allocated by `run` in bytes, as traced by tracemalloc."""
+    state = setup()
+    tracemalloc.start()
+    try:
+        run(state)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+# Runs nbstripout under tracemalloc and writes the peak memory it allocated to the file named by the first argument.
+# Resident memory can't be used, since children inherit the peak resident memory of this process on Linux
+_TRACED_MAIN = """
+import atexit, runpy, sys, tracemalloc
+path = sys.argv.pop(1)
+tracemalloc.start()
+atexit.register(lambda: open(path, 'w').write(str(tracemalloc.get_traced_memory()[1])))
+runpy.run_module('nbstripout', run_name='__main__', alter_sys=True)
+"""
+
+
+def run_cli(args: List[str], stdin: Optional[str] = None, trace: bool = False) -> Optional[int]:
+    """Run nbstripout, returning the peak memory it allocated in bytes if `trace` is set."""
+    with tempfile.NamedTemporaryFile('r', suffix='.peak') as peak, open(stdin or os.devnull, 'rb') as f:
+        command = ['-c', _TRACED_MAIN, peak.name] if trace else ['-m', 'nbstripout']
+        proc = run([sys.executable] + command + args, stdin=f, stdout=DEVNULL, stderr=PIPE)
+        if proc.returncode not in (0, 1):
+            raise RuntimeError(f'nbstripout {" ".join(args)} failed: {proc.stderr.decode()}')
+        return int(peak.read()) if trace else None
+
+
+def best_of_cli(repeat: int, args: List[str], stdin: Optional[str] = None) -> Dict[str, float]:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run_cli(args, stdin)
+        times.append(time.perf_counter() - start)
+    # Tracing slows nbstripout down, so memory is measured in a separate run
+    return {'seconds': min(times), 'peak_memory': run_cli(args, stdin, trace=True)}
+
+
+def result(seconds: float, num_bytes: int, num_notebooks: int, memory: Optional[int]) -> Dict[str, float]:
+    return {
+        'seconds': seconds,
+        'mb_per_second': num_bytes / 1e6 / seconds,
+        'notebooks_per_second': num_notebooks / seconds,
+        'peak_memory': memory,
+    }
+
+
+def run_suite(shape: Shape, count: int, repeat: int, jobs: str) -> Dict[str, Dict[str, float]]:
+    zeppelin = shape.format == 'zeppelin'
+    results = {}
+
+    with tempfile.TemporaryDirectory(prefix='nbstripout-bench-') as tmpdir:
+        paths = write_corpus(tmpdir, shape, count)
+        num_bytes = sum(os.path.getsize(p) for p in paths)
+        mode = ['--mode', 'zeppelin'] if zeppelin else []
+
+        cold = best_of_cli(repeat, ['--version'])
+        results['cli_version'] = result(cold['seconds'], 0, 0, cold['peak_memory'])
+        cold = best_of_cli(repeat, mode, stdin=paths[0])
+        results['cli_stdin'] = result(cold['seconds'], os.path.getsize(paths[0]), 1, cold['peak_memory'])
+        for batch_jobs in dict.fromkeys(['1', jobs]):
+            batch = best_of_cli(repeat, ['--dry-run', '--jobs', batch_jobs] + mode + paths)
+            results[f'cli_batch[jobs={batch_jobs}]'] = result(batch['seconds'], num_bytes, count, batch['peak_memory'])
+
+    notebooks = [make_notebook(shape, seed) for seed in range(count)]
+    texts = [dumps(nb) for nb in notebooks]
+
+    def strip_all(nbs):
+        for nb in nbs:
+            if zeppelin:
+                strip_zeppelin_output(nb)
+            else:
+                strip_output(nb, keep_output=None, keep_count=False, keep_id=False, extra_keys=DEFAULT_EXTRA_KEYS)
+
+    def copies():
+        return copy.deepcopy(notebooks)
+
+    seconds = best_of(repeat, copies, strip_all)
+    results['strip_output'] = result(seconds, num_bytes, count, peak_memory(copies, strip_all))
+
+    for engine in ('nbformat',) if zeppelin else ('json', 'nbformat'):
+        args = _build_parser().parse_args(['--engine', engine] + mode)
+        process = process_zeppelin_notebook if zeppelin else process_jupyter_notebook
+
+        def round_trip(_):
+            for text in texts:
+                process(io.StringIO(text), io.StringIO(), args, list(DEFAULT_EXTRA_KEYS))
+
+        seconds = best_of(repeat, lambda: None, round_trip)
+        name = 'round_trip' if zeppelin else f'round_trip[{engine}]'
+        results[name] = result(seconds, num_bytes, count, peak_memory(lambda: None, round_trip))
+    return results
+
+
+def _format_memory(memory: Optional[int]) -> str:
+    return '-' if memory is None else f'{memory / 1e6:.2f} MB'
+
+
+def print_results(results: Dict[str, Dict[str, float]], baseline: Optional[Dict[str, Dict[str, float]]] = None):
+    header = ('Benchmark', 'Time', 'MB/s', 'Notebooks/s', 'Peak memory') + (('vs. baseline',) if baseline else ())
+    rows = [header]
+    for name, res in results.items():
+        row = (
+            name,
+            f'{res["seconds"] * 1e3:.1f} ms',
+            f'{res["mb_per_second"]:.1f}' if res['mb_per_second'] else '-',
+            f'{res["notebooks_per_second"]:.1f}' if res['notebooks_per_second'] else '-',
+            _format_memory(res['peak_memory']),
+        )
+        if baseline:
+            # Ratios above 1 are speedups
+            row += (f'{baseline[name]["seconds"] / res["seconds"]:.2f}x' if name in baseline else '-',)
+        rows.append(row)
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    for row in rows:
+        print('  '.join([row[0].ljust(widths[0])] + [value.rjust(width) for value, width in zip(row[1:], widths[1:])]))
+
+
+def _commit() -> Optional[str]:
+    try:
+        return check_output(['git', 'rev-parse', 'HEAD'], stderr=DEVNULL, universal_newlines=True).strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=20, help='Number of notebooks (default: 20)')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of repetitions, the best is reported')
+    parser.add_argument('--jobs', default='auto', help='--jobs to strip the batch with, besides 1 (default: auto)')
+    parser.add_argument('--save', metavar='FILE', help='Save the results as JSON')
+    parser.add_argument('--compare', metavar='FILE', help='Compare against results saved with --save')
+    add_shape_arguments(parser)
+    args = parser.parse_args()
+
+    shape = shape_from_args(args)
+    print(f'{args.count} notebooks with {shape.describe()}')
+    results = run_suite(shape, args.count, args.repeat, args.jobs)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            saved = json.load(f)
+        if saved['shape'] != asdict(shape) or saved['count'] != args.count:
+            print(f'Warning: {args.compare} was recorded for a different corpus', file=sys.stderr)
+        baseline = saved['results']
+        print(f'Compared against {saved["commit"] or args.compare}')
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(
+                {
+                    'commit': _commit(),
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'shape': asdict(shape),
+                    'count': args.count,
+                    'results': results,
+                },
+                f,
+                indent=2,
+            )
+
+
+if __name__ == '__main__':
+    main()
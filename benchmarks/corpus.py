@@ -0,0 +1,240 @@
+"""Generate synthetic notebooks of a configurable shape.
+
+Notebooks are generated deterministically from a seed, such that benchmark results are comparable across commits and
+machines. Write a corpus to a directory with
+
+    python benchmarks/corpus.py DIRECTORY [--count N] [--format 4] [--cells N] [--outputs N] [--image-size BYTES]
+"""
+
+from argparse import ArgumentParser
+import base64
+from dataclasses import asdict, dataclass
+import json
+import os
+import random
+from typing import Any, Dict, List
+
+FORMATS = ('4', '3', 'zeppelin')
+
+
+@dataclass(frozen=True)
+class Shape:
+    """Shape of the generated notebooks."""
+
+    # nbformat 4 or 3 for Jupyter notebooks, or zeppelin
+    format: str = '4'
+    cells: int = 100
+    # Outputs of each code cell, cycling through stream, execute_result, display_data with an image and error, or the
+    # Zeppelin result types of the same kind
+    outputs: int = 3
+    # Size of each image before base64 encoding, in bytes
+    image_size: int = 20_000
+    # Size of the widget state in the notebook metadata, in bytes
+    widget_state_size: int = 0
+
+    def describe(self) -> str:
+        return ', '.join(f'{key}={value}' for key, value in asdict(self).items())
+
+
+def _lines(rng: random.Random, num_lines: int) -> List[str]:
+    words = ['x', 'df', 'plot', 'np.arange', '=', '+', '(', ')', 'print', 'import', 'model.fit', '42', 'for', 'in']
+    lines = [' '.join(rng.choice(words) for _ in range(rng.randint(2, 8))) + '\n' for _ in range(num_lines)]
+    lines[-1] = lines[-1].rstrip('\n')
+    return lines
+
+
+def _image(rng: random.Random, size: int) -> List[str]:
+    return base64.encodebytes(rng.randbytes(size)).decode().splitlines(True)
+
+
+def _v4_output(rng: random.Random, shape: Shape, kind: int, count: int) -> Dict[str, Any]:
+    if kind == 0:
+        return {'output_type': 'stream', 'name': 'stdout', 'text': _lines(rng, 10)}
+    if kind == 1:
+        return {
+            'output_type': 'execute_result',
+            'execution_count': count,
+            'metadata': {},
+            'data': {'text/plain': _lines(rng, 3), 'text/html': ['<table>\n'] + _lines(rng, 20) + ['</table>']},
+        }
+    if kind == 2:
+        return {
+            'output_type': 'display_data',
+            'metadata': {'needs_background': 'light'},
+            'data': {'image/png': _image(rng, shape.image_size), 'text/plain': ['<Figure size 640x480 with 1 Axes>']},
+        }
+    return {
+        'output_type': 'error',
+        'ename': 'ValueError',
+        'evalue': 'invalid value',
+        'traceback': _lines(rng, 8),
+    }
+
+
+def _v3_output(rng: random.Random, shape: Shape, kind: int, count: int) -> Dict[str, Any]:
+    if kind == 0:
+        return {'output_type': 'stream', 'stream': 'stdout', 'text': _lines(rng, 10), 'metadata': {}}
+    if kind == 1:
+        return {
+            'output_type': 'pyout',
+            'prompt_number': count,
+            'metadata': {},
+            'text': _lines(rng, 3),
+            'html': ['<table>\n'] + _lines(rng, 20) + ['</table>'],
+        }
+    if kind == 2:
+        return {
+            'output_type': 'display_data',
+            'metadata': {},
+            'png': ''.join(_image(rng, shape.image_size)),
+            'text': ['<Figure size 640x480 with 1 Axes>'],
+        }
+    return {'output_type': 'pyerr', 'ename': 'ValueError', 'evalue': 'invalid value', 'traceback': _lines(rng, 8)}
+
+
+def _zeppelin_result(rng: random.Random, shape: Shape, kind: int) -> Dict[str, Any]:
+    if kind == 0:
+        return {'type': 'TEXT', 'data': ''.join(_lines(rng, 10))}
+    if kind == 1:
+        return {'type': 'TABLE', 'data': 'x\ty\n' + ''.join(f'{i}\t{rng.random()}\n' for i in range(20))}
+    if kind == 2:
+        return {'type': 'IMG', 'data': ''.join(_image(rng, shape.image_size)).replace('\n', '')}
+    return {'type': 'TEXT', 'data': 'ValueError: invalid value\n' + ''.join(_lines(rng, 8))}
+
+
+def _widget_state(rng: random.Random, size: int) -> Dict[str, Any]:
+    state = {}
+    while size > 0:
+        model_id = '%032x' % rng.getrandbits(128)
+        value = ''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=min(size, 1000)))
+        state[model_id] = {
+            'model_module': '@jupyter-widgets/controls',
+            'model_name': 'HTMLModel',
+            'state': {'value': value},
+        }
+        size -= len(value)
+    return {'application/vnd.jupyter.widget-state+json': {'state': state, 'version_major': 2, 'version_minor': 0}}
+
+
+def make_notebook(shape: Shape, seed: int = 0) -> Dict[str, Any]:
+    """Generate a notebook of the given shape as it would be loaded from JSON."""
+    rng = random.Random(seed)
+    if shape.format == 'zeppelin':
+        return {
+            'paragraphs': [
+                {
+                    'text': '%python\n' + ''.join(_lines(rng, 5)),
+                    'config': {'editorMode': 'ace/mode/python'},
+                    'results': {
+                        'code': 'SUCCESS',
+                        'msg': [_zeppelin_result(rng, shape, kind % 4) for kind in range(shape.outputs)],
+                    }
+                    if shape.outputs
+                    else {},
+                    'id': f'paragraph_{i}',
+                    'status': 'FINISHED',
+                }
+                for i in range(shape.cells)
+            ],
+            'name': f'notebook {seed}',
+            'id': f'{seed:09d}',
+            'config': {'isZeppelinNotebookCronEnable': False},
+        }
+
+    v3 = shape.format == '3'
+    output = _v3_output if v3 else _v4_output
+    cells = []
+    count = 0
+    for i in range(shape.cells):
+        if i % 4 == 3:
+            cell = {'cell_type': 'markdown', 'metadata': {}, 'source': ['# Section\n'] + _lines(rng, 3)}
+        else:
+            count += 1
+            outputs = [output(rng, shape, kind % 4, count) for kind in range(shape.outputs)]
+            if v3:
+                cell = {
+                    'cell_type': 'code',
+                    'collapsed': False,
+                    'input': _lines(rng, 5),
+                    'language': 'python',
+                    'metadata': {},
+                    'outputs': outputs,
+                    'prompt_number': count,
+                }
+            else:
+                cell = {
+                    'cell_type': 'code',
+                    'execution_count': count,
+                    'metadata': {'collapsed': False, 'scrolled': True, 'ExecuteTime': {'end_time': '2024-01-01'}},
+                    'outputs': outputs,
+                    'source': _lines(rng, 5),
+                }
+        if not v3:
+            cell['id'] = '%08x' % rng.getrandbits(32)
+        cells.append(cell)
+
+    metadata = {
+        'kernelspec': {'display_name': 'Python 3', 'language': 'python', 'name': 'python3'},
+        'language_info': {'name': 'python', 'version': '3.11.7'},
+    }
+    if shape.widget_state_size:
+        metadata['widgets'] = _widget_state(rng, shape.widget_state_size)
+    if v3:
+        return {'metadata': metadata, 'nbformat': 3, 'nbformat_minor': 0, 'worksheets': [{'cells': cells}]}
+    return {'cells': cells, 'metadata': metadata, 'nbformat': 4, 'nbformat_minor': 5}
+
+
+def dumps(nb: Dict[str, Any]) -> str:
+    """Serialize a notebook the way Jupyter writes them."""
+    return json.dumps(nb, sort_keys=True, indent=1, ensure_ascii=False) + '\n'
+
+
+def extension(shape: Shape) -> str:
+    return '.zpln' if shape.format == 'zeppelin' else '.ipynb'
+
+
+def write_corpus(directory: str, shape: Shape, count: int) -> List[str]:
+    """Write `count` notebooks of the given shape to `directory`, returning their paths."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for seed in range(count):
+        paths.append(os.path.join(directory, f'notebook_{seed:04d}{extension(shape)}'))
+        with open(paths[-1], 'w', encoding='utf-8') as f:
+            f.write(dumps(make_notebook(shape, seed)))
+    return paths
+
+
+def add_shape_arguments(parser: ArgumentParser):
+    defaults = Shape()
+    parser.add_argument('--format', choices=FORMATS, default=defaults.format, help='nbformat 4 or 3, or zeppelin')
+    parser.add_argument('--cells', type=int, default=defaults.cells, help='Number of cells per notebook')
+    parser.add_argument('--outputs', type=int, default=defaults.outputs, help='Number of outputs per code cell')
+    parser.add_argument('--image-size', type=int, default=defaults.image_size, help='Size of each image in bytes')
+    parser.add_argument(
+        '--widget-state-size', type=int, default=defaults.widget_state_size, help='Size of the widget state in bytes'
+    )
+
+
+def shape_from_args(args) -> Shape:
+    return Shape(
+        format=args.format,
+        cells=args.cells,
+        outputs=args.outputs,
+        image_size=args.image_size,
+        widget_state_size=args.widget_state_size,
+    )
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory', help='Directory to write the notebooks to')
+    parser.add_argument('--count', type=int, default=10, help='Number of notebooks (default: 10)')
+    add_shape_arguments(parser)
+    args = parser.parse_args()
+    paths = write_corpus(args.directory, shape_from_args(args), args.count)
+    size = sum(os.path.getsize(p) for p in paths)
+    print(f'Wrote {len(paths)} notebooks ({size / 1e6:.1f} MB) to {args.directory}')
+
+
+if __name__ == '__main__':
+    main()
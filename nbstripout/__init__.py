@@ -1,5 +1,46 @@
-from ._nbstripout import install, uninstall, status, main, __doc__ as docstring
-from ._utils import pop_recursive, strip_output, MetadataError
+"""Strip output from Jupyter and IPython notebooks, see ``nbstripout --help``."""
 
-__all__ = ['install', 'uninstall', 'status', 'main', 'pop_recursive', 'strip_output', 'MetadataError']
-__doc__ = docstring
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from ._nbstripout import install, uninstall, status, main
+    from ._utils import pop_recursive, strip_output, MetadataError, StripPlan, StripReport
+
+__all__ = [
+    'install',
+    'uninstall',
+    'status',
+    'main',
+    'pop_recursive',
+    'strip_output',
+    'MetadataError',
+    'StripPlan',
+    'StripReport',
+]
+
+# Modules are only imported when one of their names is first used, such that the client (`nbstripout-client`) starts
+# quickly without importing nbformat
+_MODULES = {
+    'install': '_nbstripout',
+    'uninstall': '_nbstripout',
+    'status': '_nbstripout',
+    'main': '_nbstripout',
+    'pop_recursive': '_utils',
+    'strip_output': '_utils',
+    'MetadataError': '_utils',
+    'StripPlan': '_utils',
+    'StripReport': '_utils',
+}
+
+
+def __getattr__(name: str):
+    if name not in _MODULES:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(import_module(f'.{_MODULES[name]}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,229 @@
+"""Find out where the output bytes in notebooks are.
+
+Notebooks are analyzed independently of each other (possibly in worker processes) into compact records of their
+outputs, which are then aggregated into a report of output sizes by output type, MIME type, notebook and cell, and the
+savings of candidate stripping policies. Sizes are measured like `--max-size` does, with `get_size`.
+"""
+
+from collections import Counter, defaultdict
+import json
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from nbstripout._utils import MetadataError, determine_keep_output, get_size, match_output_type
+
+__all__ = ['OutputRecord', 'NotebookRecord', 'analyze_notebook', 'Report']
+
+# Thresholds for which the savings of `--max-size` are reported
+MAX_SIZE_CANDIDATES = {'1k': 10**3, '10k': 10**4, '100k': 10**5, '1M': 10**6}
+
+
+class OutputRecord(NamedTuple):
+    cell: int
+    output_type: str
+    name: Optional[str]
+    # Whether the output is kept by default due to cell metadata or tags
+    kept: bool
+    size: int
+    mime_sizes: Dict[str, int]
+
+    @property
+    def key(self) -> str:
+        """The output type in the format accepted by `--keep-output-type` and `--drop-output-type`."""
+        return f'{self.output_type}:{self.name}' if self.name else self.output_type
+
+    def matches(self, output_type: str) -> bool:
+        return match_output_type({'output_type': self.output_type, 'name': self.name}, output_type)
+
+
+class NotebookRecord(NamedTuple):
+    name: str
+    size: int
+    outputs: List[OutputRecord]
+
+
+def _iter_cells(nb: Dict[str, Any]) -> Iterable[Dict[str, Any]]:
+    if nb.get('nbformat', 4) < 4:
+        for ws in nb.get('worksheets', []):
+            yield from ws.get('cells', [])
+    else:
+        yield from nb.get('cells', [])
+
+
+def analyze_notebook(item: Tuple[str, bytes]) -> Optional[NotebookRecord]:
+    """Record the outputs of the notebook `(name, content)`, or return None if it isn't valid JSON."""
+    name, content = item
+    try:
+        nb = json.loads(content)
+    except ValueError:
+        return None
+    if not isinstance(nb, dict):
+        return None
+    outputs = []
+    for i, cell in enumerate(_iter_cells(nb)):
+        try:
+            kept = determine_keep_output(cell, default=False)
+        except MetadataError:
+            kept = False
+        for output in cell.get('outputs', []):
+            data = output.get('data', {})
+            outputs.append(
+                OutputRecord(
+                    cell=i,
+                    output_type=output.get('output_type', ''),
+                    name=output.get('name'),
+                    kept=kept,
+                    size=get_size(output),
+                    mime_sizes={mime: get_size(value) for mime, value in data.items()},
+                )
+            )
+    return NotebookRecord(name, len(content), outputs)
+
+
+def _format_size(size: int) -> str:
+    for unit in ('B', 'kB', 'MB'):
+        if size < 1000:
+            return f'{size} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1000
+    return f'{size:.1f} GB'
+
+
+class Report:
+    """Aggregate of the output sizes of many notebooks."""
+
+    def __init__(self, top: int = 10):
+        self.top = top
+        self.num_notebooks = 0
+        self.num_invalid = 0
+        self.total_size = 0
+        self.by_type = Counter()
+        self.count_by_type = Counter()
+        self.by_mime = Counter()
+        self.notebooks: List[Tuple[int, int, str]] = []
+        self.cells: List[Tuple[int, str, int]] = []
+        # Sizes of all outputs by type and whether they are kept by default, to evaluate policies
+        self._sizes = defaultdict(list)
+
+    def add(self, record: Optional[NotebookRecord]):
+        if record is None:
+            self.num_invalid += 1
+            return
+        self.num_notebooks += 1
+        self.total_size += record.size
+        cells = Counter()
+        for output in record.outputs:
+            self.by_type[output.key] += output.size
+            self.count_by_type[output.key] += 1
+            self.by_mime.update(output.mime_sizes)
+            cells[output.cell] += output.size
+            self._sizes[output.output_type, output.name, output.kept].append(output.size)
+        self.notebooks.append((sum(cells.values()), len(record.outputs), record.name))
+        self.cells.extend((size, record.name, cell) for cell, size in cells.items())
+        # Only keep the largest offenders
+        self.notebooks = sorted(self.notebooks, reverse=True)[: self.top]
+        self.cells = sorted(self.cells, reverse=True)[: self.top]
+
+    @property
+    def output_size(self) -> int:
+        return sum(self.by_type.values())
+
+    def _saved(self, drop: Callable[[OutputRecord], bool]) -> int:
+        """Total size of the outputs `drop` holds for."""
+        return sum(
+            sum(sizes)
+            for (output_type, name, kept), sizes in self._sizes.items()
+            if drop(OutputRecord(0, output_type, name, kept, 0, {}))
+        )
+
+    def policies(self) -> List[Tuple[str, int]]:
+        """The savings of candidate policies, compared to not stripping anything."""
+        policies = [('(default)', self._saved(lambda output: not output.kept))]
+        for label, max_size in MAX_SIZE_CANDIDATES.items():
+            saved = sum(
+                sum(size for size in sizes if size > max_size)
+                for (_, _, kept), sizes in self._sizes.items()
+                if not kept
+            )
+            policies.append((f'--max-size {label}', saved))
+        for output_type in sorted(self.by_type):
+            saved = self._saved(lambda output, ot=output_type: not output.kept and not output.matches(ot))
+            policies.append((f'--keep-output-type {output_type}', saved))
+        for output_type in sorted(self.by_type):
+            saved = self._saved(lambda output, ot=output_type: output.matches(ot))
+            policies.append((f'--keep-output --drop-output-type {output_type}', saved))
+        # Not counting the few bytes saved when outputs left without any representation are dropped as a whole
+        if 'text/plain' in self.by_mime:
+            saved = sum(self.by_mime.values()) - self.by_mime['text/plain']
+            policies.append(('--keep-output --keep-mime-type text/plain', saved))
+        for mime_type in sorted(self.by_mime):
+            policies.append((f'--keep-output --drop-mime-type {mime_type}', self.by_mime[mime_type]))
+        return policies
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'notebooks': self.num_notebooks,
+            'invalid_notebooks': self.num_invalid,
+            'total_size': self.total_size,
+            'output_size': self.output_size,
+            'output_types': {
+                key: {'outputs': self.count_by_type[key], 'size': size} for key, size in self.by_type.most_common()
+            },
+            'mime_types': dict(self.by_mime.most_common()),
+            'largest_notebooks': [
+                {'notebook': name, 'outputs': outputs, 'output_size': size} for size, outputs, name in self.notebooks
+            ],
+            'largest_cells': [{'notebook': name, 'cell': cell, 'output_size': size} for size, name, cell in self.cells],
+            'policies': [{'policy': policy, 'saved': saved} for policy, saved in self.policies()],
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_table(self) -> str:
+        lines = [
+            f'Analyzed {self.num_notebooks} notebooks ({_format_size(self.total_size)}), '
+            f'of which {_format_size(self.output_size)} are outputs'
+        ]
+        if self.num_invalid:
+            lines.append(f'Skipped {self.num_invalid} invalid notebooks')
+
+        def table(title: str, header: Tuple[str, ...], rows: List[Tuple[Any, ...]]):
+            rows = [header] + [tuple(str(value) for value in row) for row in rows]
+            widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+            lines.extend(['', title])
+            for row in rows:
+                # Left-align the first column, right-align numbers
+                cells = [row[0].ljust(widths[0])] + [value.rjust(width) for value, width in zip(row[1:], widths[1:])]
+                lines.append('  ' + '  '.join(cells).rstrip())
+
+        def share(size: int) -> str:
+            return f'{size / self.output_size:.1%}' if self.output_size else '-'
+
+        table(
+            'Output size by output type',
+            ('Output type', 'Outputs', 'Size', 'Share'),
+            [
+                (key, self.count_by_type[key], _format_size(size), share(size))
+                for key, size in self.by_type.most_common()
+            ],
+        )
+        table(
+            'Output size by MIME type',
+            ('MIME type', 'Size', 'Share'),
+            [(mime, _format_size(size), share(size)) for mime, size in self.by_mime.most_common()],
+        )
+        table(
+            'Largest notebooks by output size',
+            ('Notebook', 'Outputs', 'Size'),
+            [(name, outputs, _format_size(size)) for size, outputs, name in self.notebooks],
+        )
+        table(
+            'Largest cells by output size',
+            ('Notebook', 'Cell', 'Size'),
+            [(name, cell, _format_size(size)) for size, name, cell in self.cells],
+        )
+        table(
+            'Savings of stripping policies',
+            ('Policy', 'Saved', 'Share'),
+            [(policy, _format_size(saved), share(saved)) for policy, saved in self.policies()],
+        )
+        return '\n'.join(lines) + '\n'
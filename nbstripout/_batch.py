@@ -0,0 +1,141 @@
+"""Strip a stream of notebooks read from stdin, for services embedding nbstripout (`--batch`).
+
+Requests are JSON objects with the notebook and, optionally, an id echoed in the response, the mode (`auto`,
+`jupyter` or `zeppelin`) and options overriding those given on the command line, e.g.
+
+    {"id": "upload-1", "notebook": "<notebook JSON as a string>", "mode": "jupyter", "options": {"keep_count": true}}
+
+The notebook is either the content of the notebook file as a string, or the notebook as a JSON object, and is
+returned in the same form. Responses tell whether stripping changed the notebook, or why it could not be stripped:
+
+    {"id": "upload-1", "status": "ok", "changed": true, "notebook": "<stripped notebook>"}
+    {"id": "upload-2", "status": "error", "error": "Notebook does not appear to be JSON: ..."}
+
+Messages are framed either as NDJSON, i.e. one message per line, or length-prefixed, i.e. the length of the message
+in bytes as a decimal number followed by a newline, the message and another newline. Responses are written in the
+order of the requests, each as soon as it and all previous ones are done, such that a client can also wait for the
+response to each request before sending the next one.
+"""
+
+import json
+import queue
+import threading
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+__all__ = ['FRAMINGS', 'BatchError', 'read_frames', 'write_frame', 'handle_request', 'run_batch']
+
+FRAMINGS = ('ndjson', 'length')
+
+
+class BatchError(Exception):
+    pass
+
+
+def read_frames(stream: BinaryIO, framing: str) -> Iterator[bytes]:
+    """Read messages from `stream` until it is closed."""
+    while True:
+        line = stream.readline()
+        if not line:
+            return
+        if not line.strip():
+            continue
+        if framing == 'ndjson':
+            yield line
+            continue
+        try:
+            length = int(line)
+        except ValueError:
+            raise BatchError(f'Invalid message length {line[:20]!r}')
+        data = stream.read(length)
+        if len(data) < length:
+            raise BatchError(f'Truncated message: expected {length} bytes, got {len(data)}')
+        yield data
+
+
+def write_frame(stream: BinaryIO, data: bytes, framing: str):
+    if framing == 'length':
+        stream.write(b'%d\n' % len(data))
+    stream.write(data + b'\n')
+
+
+def _response(request_id: Any, **fields: Any) -> bytes:
+    # Newlines in strings are always escaped, so each response is a single line
+    return json.dumps({'id': request_id, **fields}).encode('utf-8')
+
+
+# Strips the notebook with the given mode and options
+StripDocument = Callable[[bytes, Optional[str], Dict[str, Any]], Tuple[bool, Optional[bytes]]]
+
+
+def handle_request(frame: bytes, strip: StripDocument) -> bytes:
+    """Handle a single request, possibly in a worker process, returning the encoded response.
+
+    `strip` takes the notebook, mode and options and returns whether stripping changed the notebook and the stripped
+    notebook, or None for a dry run."""
+    try:
+        request = json.loads(frame)
+    except ValueError as e:
+        return _response(None, status='error', error=f'Invalid request: {e}')
+    if not isinstance(request, dict) or 'notebook' not in request:
+        return _response(None, status='error', error='Invalid request: expected an object with a notebook')
+    request_id = request.get('id')
+    notebook = request['notebook']
+    options = request.get('options') or {}
+    if not isinstance(options, dict):
+        return _response(request_id, status='error', error='Invalid request: options must be an object')
+
+    as_string = isinstance(notebook, str)
+    content = notebook if as_string else json.dumps(notebook, ensure_ascii=False)
+    try:
+        changed, output = strip(content.encode('utf-8'), request.get('mode'), options)
+    except Exception as e:
+        return _response(request_id, status='error', error=str(e) or type(e).__name__)
+    response = {'status': 'ok', 'changed': changed}
+    if output is not None:
+        response['notebook'] = output.decode('utf-8') if as_string else json.loads(output)
+    return _response(request_id, **response)
+
+
+def run_batch(
+    handle: Callable[[bytes], bytes], input_stream: BinaryIO, output_stream: BinaryIO, framing: str, jobs: int = 1
+):
+    """Handle the requests read from `input_stream` with `jobs` processes, writing responses to `output_stream`."""
+    if jobs == 1:
+        for frame in read_frames(input_stream, framing):
+            write_frame(output_stream, handle(frame), framing)
+            output_stream.flush()
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Bounds the number of requests in flight, and hence the memory held by responses not written yet
+    pending = queue.Queue(maxsize=4 * jobs)
+    errors: List[BaseException] = []
+
+    def write_responses():
+        while True:
+            future = pending.get()
+            if future is None:
+                return
+            if errors:
+                # Keep draining, such that the reader isn't blocked forever
+                continue
+            try:
+                write_frame(output_stream, future.result(), framing)
+                output_stream.flush()
+            except BaseException as e:
+                errors.append(e)
+
+    writer = threading.Thread(target=write_responses, name='nbstripout-batch-writer')
+    writer.start()
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        try:
+            for frame in read_frames(input_stream, framing):
+                if errors:
+                    break
+                pending.put(executor.submit(handle, frame))
+        finally:
+            pending.put(None)
+            writer.join()
+    if errors:
+        raise errors[0]
@@ -0,0 +1,148 @@
+"""On-disk cache of stripped notebooks.
+
+Entries are keyed by a hash of the input bytes together with a fingerprint of every option affecting the result, such
+that a hit can be served without parsing the notebook. Each entry records whether stripping changed the notebook and
+the stripped bytes, which are omitted if identical to the input. Entries are written atomically, so several processes
+can share a cache. Once the cache grows beyond its size limit, the least recently used entries are evicted.
+"""
+
+from collections import Counter
+import hashlib
+import json
+import os
+import tempfile
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+__all__ = ['DEFAULT_MAX_SIZE', 'ResultCache', 'fingerprint']
+
+DEFAULT_MAX_SIZE = 256 * 10**6
+
+# Cumulative hit and miss counts of all runs using the cache
+_STATS_FILE = 'stats.json'
+# Header of entries for notebooks which stripping changes, or leaves alone
+_CHANGED = b'1\n'
+_UNCHANGED = b'0\n'
+
+
+def fingerprint(options: Dict[str, Any]) -> str:
+    """Hash the options a result depends on."""
+    return hashlib.sha256(json.dumps(options, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """Content-addressed cache of stripped notebooks in `directory`.
+
+    Hits, misses and writes are counted in `stats` until the next `flush`.
+    """
+
+    def __init__(self, directory: str, fingerprint: str, max_size: int = DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.fingerprint = fingerprint
+        self.max_size = max_size
+        self.stats = Counter()
+
+    def _path(self, content: bytes, mode: str) -> str:
+        key = hashlib.sha256(f'{self.fingerprint}\0{mode}\0'.encode('utf-8'))
+        key.update(content)
+        digest = key.hexdigest()
+        return os.path.join(self.directory, digest[:2], digest[2:])
+
+    def get(self, content: bytes, mode: str) -> Optional[Tuple[bool, bytes]]:
+        """Look up whether stripping `content` in `mode` changes it and the stripped bytes."""
+        entry = self._path(content, mode)
+        try:
+            with open(entry, 'rb') as f:
+                data = f.read()
+        except OSError:
+            self.stats['misses'] += 1
+            return None
+        header, output = data[:2], data[2:]
+        if header not in (_CHANGED, _UNCHANGED):
+            self.stats['misses'] += 1
+            return None
+        try:
+            # Entries are evicted least recently used first
+            os.utime(entry)
+        except OSError:
+            pass
+        self.stats['hits'] += 1
+        return header == _CHANGED, output or content
+
+    def put(self, content: bytes, mode: str, any_change: bool, output: bytes):
+        """Store the result of stripping `content` in `mode`."""
+        entry = self._path(content, mode)
+        data = (_CHANGED if any_change else _UNCHANGED) + (b'' if output == content else output)
+        try:
+            os.makedirs(os.path.dirname(entry), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(entry), prefix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, entry)
+        except OSError:
+            # A cache which can't be written to only costs performance
+            return
+        self.stats['writes'] += 1
+
+    def _entries(self) -> Iterator[Tuple[os.stat_result, str]]:
+        try:
+            subdirs = [subdir.path for subdir in os.scandir(self.directory) if subdir.is_dir()]
+        except OSError:
+            return
+        for subdir in subdirs:
+            try:
+                entries = [entry for entry in os.scandir(subdir) if not entry.name.startswith('.tmp')]
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    yield entry.stat(), entry.path
+                except OSError:
+                    # Removed by a concurrent eviction
+                    continue
+
+    def usage(self) -> Tuple[int, int]:
+        """Return the number of entries and their total size in bytes."""
+        num_entries = total_size = 0
+        for stat, _ in self._entries():
+            num_entries += 1
+            total_size += stat.st_size
+        return num_entries, total_size
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits its size limit."""
+        entries = list(self._entries())
+        total_size = sum(stat.st_size for stat, _ in entries)
+        for stat, entry in sorted(entries, key=lambda e: e[0].st_mtime):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(entry)
+            except OSError:
+                continue
+            total_size -= stat.st_size
+
+    def load_stats(self) -> Counter:
+        """Return the cumulative stats of all runs flushed to the cache."""
+        try:
+            with open(os.path.join(self.directory, _STATS_FILE), 'r') as f:
+                return Counter(json.load(f))
+        except (OSError, ValueError):
+            return Counter()
+
+    def flush(self):
+        """Evict entries if anything was written and add `stats` to the cumulative stats."""
+        if not self.stats:
+            return
+        if self.stats['writes']:
+            self.evict()
+        stats = self.load_stats()
+        stats.update(self.stats)
+        self.stats.clear()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump(dict(stats), f)
+            os.replace(tmp, os.path.join(self.directory, _STATS_FILE))
+        except OSError:
+            pass
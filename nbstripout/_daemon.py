@@ -0,0 +1,201 @@
+"""Keep nbstripout warm in a local daemon, which a thin client forwards invocations to.
+
+`nbstripout --serve` listens on a per-user Unix domain socket. For every connection, the daemon forks a child with all
+modules already imported, which runs nbstripout with the client's arguments, working directory, environment and
+standard streams, and reports its exit status back. The client passes its standard streams as file descriptors, so
+input and output are never copied through the daemon. It only imports a few lightweight modules and runs nbstripout
+in-process if no daemon is running, so it can replace `nbstripout` wherever it is started many times, e.g. as textconv
+command during `git log -p`.
+"""
+
+import importlib
+import json
+import os
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import traceback
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+__all__ = ['SUPPORTED', 'default_socket_path', 'forward', 'serve', 'client_main']
+
+# Requests are a length-prefixed JSON object, responses the exit status
+_LENGTH = struct.Struct('!I')
+_STATUS = struct.Struct('!i')
+# Status telling the client to run nbstripout in-process, e.g. because the daemon runs different code
+_FALLBACK = -1
+# Passing file descriptors and forking a child per connection requires a Unix system
+SUPPORTED = hasattr(socket, 'send_fds') and hasattr(socketserver, 'ForkingMixIn')
+
+
+def default_socket_path() -> str:
+    """The socket of the current user's daemon, `$NBSTRIPOUT_SOCKET` if set."""
+    if 'NBSTRIPOUT_SOCKET' in os.environ:
+        return os.environ['NBSTRIPOUT_SOCKET']
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'nbstripout', 'daemon.sock')
+    return os.path.join(os.environ.get('TMPDIR', '/tmp'), f'nbstripout-{os.getuid()}', 'daemon.sock')
+
+
+def _code_id() -> str:
+    """Identify the installed code, such that clients don't use a daemon started before an upgrade."""
+    package = os.path.dirname(os.path.abspath(__file__))
+    modules = [entry for entry in os.scandir(package) if entry.name.endswith('.py')]
+    return f'{package}:{max(entry.stat().st_mtime_ns for entry in modules)}'
+
+
+def _check_private(directory: str):
+    """Make sure no other user can access the socket in `directory`."""
+    stat = os.stat(directory)
+    if stat.st_uid != os.getuid() or stat.st_mode & 0o077:
+        raise PermissionError(f'{directory} must be owned by and only accessible to the current user')
+
+
+def _recv_exactly(sock: socket.socket, size: int, data: bytes = b'') -> bytes:
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError('Connection closed unexpectedly')
+        data += chunk
+    return data
+
+
+def forward(argv: List[str], socket_path: Optional[str] = None) -> Optional[int]:
+    """Run nbstripout with `argv` in the daemon, returning its exit status, or None if no daemon can run it."""
+    if not SUPPORTED:
+        return None
+    socket_path = socket_path or default_socket_path()
+    request = json.dumps({'argv': argv, 'cwd': os.getcwd(), 'env': dict(os.environ), 'code': _code_id()}).encode()
+    data = _LENGTH.pack(len(request)) + request
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            _check_private(os.path.dirname(socket_path))
+            sock.connect(socket_path)
+            sent = socket.send_fds(sock, [data], [0, 1, 2])
+        except OSError:
+            return None
+        try:
+            sock.sendall(data[sent:])
+            status = _STATUS.unpack(_recv_exactly(sock, _STATUS.size))[0]
+        except OSError as e:
+            # The daemon may have consumed stdin already, so it's too late to fall back
+            print(f'nbstripout daemon failed: {e}', file=sys.stderr)
+            return 1
+    return None if status == _FALLBACK else status
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    # Set by `serve`
+    run: Callable[[], None]
+
+    def _receive(self) -> Optional[Tuple[Dict, List[int]]]:
+        data, fds, _, _ = socket.recv_fds(self.request, 1 << 16, 3)
+        if not data:
+            # Connected to find out whether the daemon is running
+            return None
+        if len(data) < _LENGTH.size:
+            data = _recv_exactly(self.request, _LENGTH.size, data)
+        length = _LENGTH.unpack(data[: _LENGTH.size])[0]
+        data = _recv_exactly(self.request, _LENGTH.size + length, data)
+        return json.loads(data[_LENGTH.size :]), fds
+
+    def handle(self):
+        # Runs in a child forked for this connection, which can freely change the process state
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        received = self._receive()
+        if received is None:
+            return
+        request, fds = received
+        if request.get('code') != _code_id() or len(fds) != 3:
+            self.request.sendall(_STATUS.pack(_FALLBACK))
+            return
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        sys.stdin = os.fdopen(0, 'r', closefd=False)
+        sys.stdout = os.fdopen(1, 'w', closefd=False)
+        sys.stderr = os.fdopen(2, 'w', buffering=1, closefd=False)
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request['env'])
+        sys.argv = ['nbstripout'] + request['argv']
+
+        try:
+            self.run()
+            status = 0
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                status = e.code or 0
+            else:
+                print(e.code, file=sys.stderr)
+                status = 1
+        except Exception:
+            traceback.print_exc()
+            status = 1
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                # nbstripout may have closed the stream by wrapping it, which leaves the file descriptor open
+                if not stream.closed:
+                    stream.flush()
+            except BrokenPipeError:
+                pass
+        self.request.sendall(_STATUS.pack(status))
+
+
+def serve(run: Callable[[], None], socket_path: Optional[str] = None, preload: Sequence[str] = ()) -> int:
+    """Run `run` for every client connecting to `socket_path` until interrupted.
+
+    The modules named in `preload` are imported before serving, such that the children forked for each client inherit
+    them rather than importing them anew."""
+    if not SUPPORTED:
+        print('--serve is not supported on this platform', file=sys.stderr)
+        return 1
+    socket_path = socket_path or default_socket_path()
+    directory = os.path.dirname(socket_path)
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    _check_private(directory)
+    if os.path.exists(socket_path):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(socket_path)
+            except OSError:
+                # Left behind by a daemon which didn't shut down cleanly
+                os.remove(socket_path)
+            else:
+                print(f'nbstripout is already serving on {socket_path}', file=sys.stderr)
+                return 1
+
+    for module in preload:
+        importlib.import_module(module)
+
+    # Remove the socket when terminated
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    handler = type('Handler', (_Handler,), {'run': staticmethod(run)})
+    server_class = type('Server', (socketserver.ForkingMixIn, socketserver.UnixStreamServer), {})
+    with server_class(socket_path, handler) as server:
+        print(f'Serving on {socket_path}', file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(socket_path)
+    return 0
+
+
+def client_main():
+    """Entry point of `nbstripout-client`, which takes the same arguments as `nbstripout`."""
+    status = forward(sys.argv[1:])
+    if status is None:
+        from nbstripout._nbstripout import main
+
+        main()
+    else:
+        raise SystemExit(status)
+
+
+if __name__ == '__main__':
+    client_main()
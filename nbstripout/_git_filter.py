@@ -0,0 +1,145 @@
+"""Git long-running filter process protocol.
+
+Implements the server side of the pkt-line based protocol git uses to talk to
+a ``filter.<driver>.process`` command, such that a single warm process can
+clean every file git touches instead of spawning one interpreter per file.
+See "Long Running Filter Process" in gitattributes(5).
+"""
+
+import sys
+from typing import BinaryIO, Callable, Dict, List, Optional
+
+__all__ = ['ProtocolError', 'run_filter_process']
+
+# Maximum packet length is 65520 bytes, including the 4 byte length header
+MAX_PACKET_CONTENT_SIZE = 65516
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def read_packet(stream: BinaryIO) -> Optional[bytes]:
+    """Read a single pkt-line from `stream`, returning None for a flush packet.
+
+    Raises EOFError if the stream is closed before a new packet starts.
+    """
+    header = stream.read(4)
+    if not header:
+        raise EOFError
+    if len(header) != 4:
+        raise ProtocolError(f'Truncated packet header {header!r}')
+    try:
+        length = int(header, 16)
+    except ValueError:
+        raise ProtocolError(f'Invalid packet header {header!r}')
+    if length == 0:
+        return None
+    if length < 4:
+        raise ProtocolError(f'Invalid packet length {length}')
+    data = stream.read(length - 4)
+    if len(data) != length - 4:
+        raise ProtocolError('Truncated packet')
+    return data
+
+
+def read_text_list(stream: BinaryIO) -> List[str]:
+    """Read text packets up to the next flush packet."""
+    lines = []
+    while True:
+        packet = read_packet(stream)
+        if packet is None:
+            return lines
+        lines.append(packet.decode('utf-8').rstrip('\n'))
+
+
+def read_content(stream: BinaryIO) -> bytes:
+    """Read binary packets up to the next flush packet and join them."""
+    chunks = []
+    while True:
+        packet = read_packet(stream)
+        if packet is None:
+            return b''.join(chunks)
+        chunks.append(packet)
+
+
+def write_packet(stream: BinaryIO, data: bytes):
+    stream.write(b'%04x' % (len(data) + 4))
+    stream.write(data)
+
+
+def write_flush(stream: BinaryIO):
+    stream.write(b'0000')
+
+
+def write_text_list(stream: BinaryIO, lines: List[str]):
+    for line in lines:
+        write_packet(stream, f'{line}\n'.encode('utf-8'))
+    write_flush(stream)
+
+
+def write_content(stream: BinaryIO, data: bytes):
+    for start in range(0, len(data), MAX_PACKET_CONTENT_SIZE):
+        write_packet(stream, data[start : start + MAX_PACKET_CONTENT_SIZE])
+    write_flush(stream)
+
+
+def _handshake(stdin: BinaryIO, stdout: BinaryIO):
+    welcome = read_text_list(stdin)
+    if not welcome or welcome[0] != 'git-filter-client' or 'version=2' not in welcome[1:]:
+        raise ProtocolError(f'Unsupported filter client {welcome!r}')
+    write_text_list(stdout, ['git-filter-server', 'version=2'])
+    stdout.flush()
+
+    capabilities = read_text_list(stdin)
+    # Smudging is the identity, so we only ask git to send us files to clean. Not advertising the `smudge`
+    # capability spares git from piping every checked out file through this process.
+    if 'capability=clean' not in capabilities:
+        raise ProtocolError('Filter client does not support the clean capability')
+    write_text_list(stdout, ['capability=clean'])
+    stdout.flush()
+
+
+def run_filter_process(
+    clean: Callable[[str, bytes], bytes], stdin: Optional[BinaryIO] = None, stdout: Optional[BinaryIO] = None
+) -> int:
+    """Serve clean requests from git until it closes the pipe.
+
+    `clean` is called with the pathname and content of each file and returns the cleaned content. Exceptions raised
+    by `clean` are reported to stderr and signalled to git as an error status for that file only.
+    """
+    stdin = stdin or sys.stdin.buffer
+    stdout = stdout or sys.stdout.buffer
+
+    _handshake(stdin, stdout)
+    while True:
+        try:
+            headers = read_text_list(stdin)
+        except EOFError:
+            return 0
+        meta: Dict[str, str] = dict(line.split('=', maxsplit=1) for line in headers if '=' in line)
+        content = read_content(stdin)
+        command = meta.get('command')
+        pathname = meta.get('pathname', '')
+
+        if command == 'clean':
+            try:
+                result = clean(pathname, content)
+            except Exception as e:
+                print(f"Could not strip '{pathname}': {e}", file=sys.stderr)
+                write_text_list(stdout, ['status=error'])
+                stdout.flush()
+                continue
+        elif command == 'smudge':
+            result = content
+        else:
+            print(f'Unsupported filter command {command!r}', file=sys.stderr)
+            write_text_list(stdout, ['status=error'])
+            stdout.flush()
+            continue
+
+        write_text_list(stdout, ['status=success'])
+        write_content(stdout, result)
+        # An empty list keeps the status reported above
+        write_flush(stdout)
+        stdout.flush()
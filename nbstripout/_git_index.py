@@ -0,0 +1,96 @@
+"""Read and write blobs in the git index in bulk.
+
+Each function spawns a single git process regardless of the number of files, such that stripping all staged notebooks
+costs a handful of git calls rather than a few per notebook.
+"""
+
+import os
+from subprocess import PIPE, CalledProcessError, Popen, check_output, run
+import tempfile
+from typing import Iterator, List, NamedTuple, Sequence, Tuple
+
+__all__ = ['IndexEntry', 'staged_entries', 'read_blobs', 'write_blobs', 'update_index']
+
+# Regular and executable files, as opposed to symlinks and submodules
+_FILE_MODES = ('100644', '100755')
+
+
+class IndexEntry(NamedTuple):
+    mode: str
+    sha: str
+    path: str
+
+
+def staged_entries(pathspecs: Sequence[str] = ()) -> List[IndexEntry]:
+    """List files added or modified in the index compared to HEAD, or all files in the index before the first commit."""
+    try:
+        check_output(['git', 'rev-parse', '--verify', '--quiet', 'HEAD'])
+    except CalledProcessError:
+        output = check_output(['git', 'ls-files', '-z', '--stage', '--full-name', '--'] + list(pathspecs))
+        entries = []
+        for record in output.split(b'\0'):
+            if record:
+                info, path = record.split(b'\t', maxsplit=1)
+                mode, sha, stage = info.decode().split()
+                if stage == '0' and mode in _FILE_MODES:
+                    entries.append(IndexEntry(mode, sha, os.fsdecode(path)))
+        return entries
+
+    output = check_output(
+        ['git', 'diff-index', '-z', '--cached', '--no-renames', '--diff-filter=AMT', 'HEAD', '--'] + list(pathspecs)
+    )
+    # Raw records are `:<old mode> <new mode> <old sha> <new sha> <status>\0<path>\0`
+    fields = output.split(b'\0')
+    entries = []
+    for info, path in zip(fields[0::2], fields[1::2]):
+        _, mode, _, sha, _ = info.decode().split()
+        if mode in _FILE_MODES:
+            entries.append(IndexEntry(mode, sha, os.fsdecode(path)))
+    return entries
+
+
+def read_blobs(shas: Sequence[str]) -> Iterator[Tuple[str, bytes]]:
+    """Read blobs through a single `git cat-file --batch` process, yielding their ids and contents."""
+    if not shas:
+        return
+    with Popen(['git', 'cat-file', '--batch'], stdin=PIPE, stdout=PIPE) as proc:
+        try:
+            for sha in shas:
+                # Request one blob at a time, such that neither side blocks on a full pipe
+                proc.stdin.write(f'{sha}\n'.encode())
+                proc.stdin.flush()
+                header = proc.stdout.readline().decode().split()
+                if len(header) != 3 or header[1] != 'blob':
+                    raise ValueError(f'Could not read blob {sha}: {" ".join(header)}')
+                content = proc.stdout.read(int(header[2]))
+                proc.stdout.read(1)
+                yield sha, content
+        finally:
+            proc.stdin.close()
+
+
+def write_blobs(contents: Sequence[bytes]) -> List[str]:
+    """Write blobs to the object database through a single `git hash-object` process, returning their ids."""
+    if not contents:
+        return []
+    with tempfile.TemporaryDirectory(prefix='nbstripout-') as tmpdir:
+        paths = []
+        for i, content in enumerate(contents):
+            paths.append(os.path.join(tmpdir, str(i)))
+            with open(paths[-1], 'wb') as f:
+                f.write(content)
+        # Content is stored as is, filters configured for the temporary paths must not apply
+        output = run(
+            ['git', 'hash-object', '-w', '--no-filters', '--stdin-paths'],
+            input='\n'.join(paths).encode(),
+            stdout=PIPE,
+            check=True,
+        ).stdout
+    return output.decode().split()
+
+
+def update_index(entries: Sequence[IndexEntry]):
+    """Point index entries at new blobs through a single `git update-index` process."""
+    if entries:
+        info = b''.join(f'{entry.mode} {entry.sha}\t'.encode() + os.fsencode(entry.path) + b'\0' for entry in entries)
+        run(['git', 'update-index', '-z', '--index-info'], input=info, check=True)
@@ -0,0 +1,90 @@
+"""Rewrite the history of a git repository with `git fast-export` and `git fast-import`.
+
+The history is exported without blob contents, such that file changes refer to existing blobs by their id. This lets
+us find every unique notebook blob in the history up front, strip each of them exactly once and then replay the
+history with the ids of the stripped blobs substituted.
+"""
+
+from subprocess import PIPE, CalledProcessError, Popen, check_call, check_output
+from typing import BinaryIO, Callable, Dict, Iterator, List, Tuple
+
+__all__ = ['export_history', 'scan_history', 'import_history', 'reachable_blobs']
+
+# Regular and executable files, as opposed to symlinks and submodules
+_FILE_MODES = (b'100644', b'100755')
+
+
+def export_history(output: BinaryIO):
+    """Export all refs without blob contents to `output`."""
+    check_call(['git', 'fast-export', '--all', '--no-data', '--signed-tags=strip'], stdout=output)
+
+
+def _records(stream: BinaryIO) -> Iterator[bytes]:
+    """Yield the lines of a fast-export stream, with `data` commands joined with their payload."""
+    while True:
+        line = stream.readline()
+        if not line:
+            return
+        if line.startswith(b'data '):
+            # fast-export always uses the exact byte count format
+            line += stream.read(int(line[5:]))
+        yield line
+
+
+def _filemodify(record: bytes) -> Tuple[bytes, bytes, bytes]:
+    """Split a `M <mode> <blob id> <path>` record into its mode, blob id and path."""
+    _, mode, blob, path = record.rstrip(b'\n').split(b' ', maxsplit=3)
+    if path.startswith(b'"'):
+        # Quoted paths are C-style escaped, which doesn't affect the extension
+        path = path[1:-1]
+    return mode, blob, path
+
+
+def scan_history(export: BinaryIO, is_notebook: Callable[[str], bool]) -> Tuple[int, Dict[str, str]]:
+    """Find the notebook blobs in an exported history.
+
+    Returns the number of commits and the ids of all unique notebook blobs, mapped to a path they were committed at.
+    """
+    num_commits = 0
+    blobs = {}
+    for record in _records(export):
+        if record.startswith(b'commit '):
+            num_commits += 1
+        elif record.startswith(b'M '):
+            mode, blob, path = _filemodify(record)
+            if mode in _FILE_MODES and is_notebook(path.decode('utf-8', 'surrogateescape')):
+                blobs.setdefault(blob.decode(), path.decode('utf-8', 'replace'))
+    return num_commits, blobs
+
+
+def import_history(export: BinaryIO, replacements: Dict[str, str], is_notebook: Callable[[str], bool]):
+    """Import an exported history, replacing notebook blobs according to `replacements`, and force-update all refs."""
+    with Popen(['git', 'fast-import', '--force', '--quiet'], stdin=PIPE) as proc:
+        try:
+            for record in _records(export):
+                if record.startswith(b'M '):
+                    mode, blob, path = _filemodify(record)
+                    replacement = replacements.get(blob.decode())
+                    if replacement and is_notebook(path.decode('utf-8', 'surrogateescape')):
+                        record = record.replace(blob, replacement.encode(), 1)
+                proc.stdin.write(record)
+        finally:
+            proc.stdin.close()
+    if proc.returncode:
+        raise CalledProcessError(proc.returncode, proc.args)
+
+
+def reachable_blobs(is_notebook: Callable[[str], bool]) -> List[Tuple[str, str]]:
+    """List the ids of all notebook blobs reachable from any ref, together with a path they were committed at."""
+    with Popen(['git', 'rev-list', '--objects', '--all'], stdout=PIPE) as rev_list:
+        output = check_output(
+            ['git', 'cat-file', '--batch-check=%(objecttype) %(objectname) %(rest)'], stdin=rev_list.stdout
+        )
+    if rev_list.returncode:
+        raise CalledProcessError(rev_list.returncode, rev_list.args)
+    blobs = []
+    for line in output.decode('utf-8', 'surrogateescape').splitlines():
+        object_type, sha, path = (line.split(' ', maxsplit=2) + [''])[:3]
+        if object_type == 'blob' and is_notebook(path):
+            blobs.append((sha, path))
+    return blobs
@@ -24,7 +24,8 @@ process other files us the '-f' flag to force the application.
 
     nbstripout -f <file.ipynb.bak>
 
-For using Zeppelin mode while processing files with other extensions use:
+Files with other extensions and stdin are stripped as Jupyter or Zeppelin
+notebooks depending on their content, unless the mode is given explicitly:
     nbstripout -m zeppelin -f <file.ext>
 
 Use as part of a shell pipeline: ::
@@ -37,6 +38,11 @@ instructions below: ::
 
     nbstripout --install
 
+Set up the git filter as a long-running process, which strips all files git
+touches in a single warm process (requires git 2.11 or newer): ::
+
+    nbstripout --install --process
+
 Set up the git filter using ``.gitattributes`` ::
 
     nbstripout --install --attributes .gitattributes
@@ -80,6 +86,44 @@ Do a dry run and only list which files would have been stripped: ::
 
     nbstripout --dry-run FILE.ipynb [FILE2.ipynb ...]
 
+Strip the notebooks staged in the git index without touching the working tree,
+e.g. in a pre-commit hook: ::
+
+    nbstripout --staged
+
+Strip the notebooks in the entire history of the current repository,
+rewriting all branches and tags, using all CPUs: ::
+
+    nbstripout --rewrite-history --jobs auto
+
+Find out where the output bytes are in the notebooks in the current directory,
+or in the entire history of the current repository: ::
+
+    nbstripout --analyze worktree .
+    nbstripout --analyze history --json
+
+Strip many files in parallel, using all CPUs: ::
+
+    nbstripout --jobs auto FILE.ipynb [FILE2.ipynb ...]
+
+Cache stripped notebooks in ``.git/nbstripout-cache``, such that notebooks
+which were already stripped or verified with the same options are not parsed
+again, and show how well the cache works: ::
+
+    nbstripout --cache --verify FILE.ipynb [FILE2.ipynb ...]
+    nbstripout --cache-stats
+
+Keep nbstripout warm in a daemon, and strip a notebook in the daemon if it is
+running, or in-process otherwise: ::
+
+    nbstripout --serve
+    nbstripout-client FILE.ipynb
+
+Strip a stream of NDJSON requests such as {"id": 1, "notebook": "..."} read
+from stdin, writing a response with the stripped notebook for each: ::
+
+    nbstripout --batch --jobs auto < requests.ndjson
+
 Print the version: ::
 
     nbstripout --version
@@ -96,6 +140,10 @@ Set up a git filter using nbstripout as follows: ::
     git config filter.nbstripout.clean '/path/to/nbstripout'
     git config filter.nbstripout.smudge cat
 
+or alternatively as a long-running filter process: ::
+
+    git config filter.nbstripout.process '/path/to/nbstripout --process'
+
 Create a file ``.gitattributes`` or ``.git/info/attributes`` with: ::
 
     *.ipynb filter=nbstripout
@@ -109,22 +157,50 @@ In file ``.gitattributes`` or ``.git/info/attributes`` add: ::
     *.ipynb diff=ipynb
 """
 
-from argparse import ArgumentParser, RawDescriptionHelpFormatter, Namespace
-import collections
-import copy
+from argparse import ArgumentParser, ArgumentTypeError, RawDescriptionHelpFormatter, Namespace
+from contextlib import ExitStack, redirect_stderr
+from dataclasses import asdict
+from functools import lru_cache, partial
+from itertools import islice
 import io
 import json
-from os import devnull, environ, makedirs, path
+from os import cpu_count, devnull, environ, makedirs, path, walk
 from pathlib import PureWindowsPath
 import re
-from subprocess import call, check_call, check_output, CalledProcessError, STDOUT
-from typing import List, Optional
+import shlex
+import shutil
+from subprocess import call, check_call, check_output, CalledProcessError, DEVNULL, STDOUT
+from typing import TYPE_CHECKING, Any, Callable, Counter, Dict, Iterator, List, Optional, Tuple, Union
 import sys
+import tempfile
 import warnings
 
-import nbformat
-
-from nbstripout._utils import strip_output, strip_zeppelin_output
+from nbstripout import _json_engine, _stats
+from nbstripout._cache import DEFAULT_MAX_SIZE, ResultCache, fingerprint
+from nbstripout._git_filter import run_filter_process
+from nbstripout._utils import DEFAULT_EXTRA_KEYS, StripPlan, StripReport
+
+# nbformat, multiprocessing and the modules implementing optional modes are only imported where they are needed, such
+# that starting nbstripout takes as little time as possible, in particular when using the json engine
+if TYPE_CHECKING:
+    import nbformat
+
+    from nbstripout._verify import FileResult
+
+# The modules imported where they are needed, which --serve imports up front, such that the children it forks for each
+# client don't import them again
+_DEFERRED_MODULES = (
+    'nbformat',
+    'concurrent.futures',
+    'multiprocessing',
+    'nbstripout._analyze',
+    'nbstripout._batch',
+    'nbstripout._git_index',
+    'nbstripout._history',
+    'nbstripout._png',
+    'nbstripout._streaming',
+    'nbstripout._verify',
+)
 
 __all__ = ['install', 'uninstall', 'status', 'main']
 __version__ = '0.9.1'
@@ -134,6 +210,52 @@ INSTALL_LOCATION_LOCAL = 'local'
 INSTALL_LOCATION_GLOBAL = 'global'
 INSTALL_LOCATION_SYSTEM = 'system'
 
+# Where git caches the output of the diff driver with diff.ipynb.cachetextconv, keyed by blob id
+TEXTCONV_CACHE_REF = 'refs/notes/textconv/ipynb'
+
+# Options the result of stripping a notebook depends on, which are part of the cache key
+CACHE_OPTIONS = (
+    'keep_count',
+    'keep_output',
+    'keep_id',
+    'drop_output_type',
+    'keep_output_type',
+    'drop_empty_cells',
+    'drop_tagged_cells',
+    'strip_init_cells',
+    'max_size',
+    'keep_mime_type',
+    'drop_mime_type',
+    'max_mime_size',
+    'keep_smallest_mime_type',
+    'truncate_lines',
+    'truncate_size',
+    'recompress_images',
+    'unix_newlines',
+)
+
+# Options each document in a --batch stream can override, named like the command line options
+BATCH_OPTIONS = (
+    'keep_count',
+    'keep_output',
+    'keep_id',
+    'drop_output_type',
+    'keep_output_type',
+    'drop_empty_cells',
+    'drop_tagged_cells',
+    'strip_init_cells',
+    'max_size',
+    'keep_mime_type',
+    'drop_mime_type',
+    'max_mime_size',
+    'keep_smallest_mime_type',
+    'truncate_lines',
+    'truncate_size',
+    'recompress_images',
+    'extra_keys',
+    'keep_metadata_keys',
+)
+
 
 def _get_system_gitconfig_folder() -> str:
     try:
@@ -201,19 +323,59 @@ def _parse_size(num_str: str) -> int:
     raise ValueError(f'Unknown size identifier {num_str[-1]}')
 
 
+def _split_mime_size(rule: str) -> Tuple[str, int]:
+    """Split a `MIME=SIZE` rule of --max-mime-size, e.g. `image/*=100K`."""
+    mime_type, _, size = rule.rpartition('=')
+    try:
+        if not mime_type:
+            raise ValueError(rule)
+        return mime_type, _parse_size(size)
+    except (ValueError, IndexError):
+        raise ValueError(f"invalid MIME size '{rule}', expected MIME=SIZE, e.g. 'image/*=100K'")
+
+
+def _parse_mime_size(rule: str) -> str:
+    try:
+        _split_mime_size(rule)
+    except ValueError as e:
+        raise ArgumentTypeError(str(e))
+    return rule
+
+
 def install(
     git_config: str,
     install_location: str = INSTALL_LOCATION_LOCAL,
     python: Optional[str] = None,
     attrfile: Optional[str] = None,
+    process: bool = False,
+    cache: Optional[str] = None,
 ) -> int:
-    """Install the git filter and set the git attributes."""
+    """Install the git filter and set the git attributes.
+
+    With `process`, configure a long-running filter process instead of a clean/smudge filter pair. With `cache`, the
+    filter and diff driver use the result cache in that directory, or the default one if empty."""
     try:
         filepath = f'"{PureWindowsPath(python or sys.executable).as_posix()}" -m nbstripout'
-        check_call(git_config + ['filter.nbstripout.clean', filepath])
-        check_call(git_config + ['filter.nbstripout.smudge', 'cat'])
+        if cache is not None:
+            filepath += ' --cache'
+            if cache:
+                filepath += f' --cache-dir "{PureWindowsPath(path.abspath(cache)).as_posix()}"'
+        if process:
+            check_call(git_config + ['filter.nbstripout.process', filepath + ' --process'])
+            for key in ('filter.nbstripout.clean', 'filter.nbstripout.smudge'):
+                call(git_config + ['--unset', key], stdout=open(devnull, 'w'), stderr=STDOUT)
+        else:
+            check_call(git_config + ['filter.nbstripout.clean', filepath])
+            check_call(git_config + ['filter.nbstripout.smudge', 'cat'])
+            call(git_config + ['--unset', 'filter.nbstripout.process'], stdout=open(devnull, 'w'), stderr=STDOUT)
         check_call(git_config + ['filter.nbstripout.required', 'true'])
         check_call(git_config + ['diff.ipynb.textconv', filepath + ' -t'])
+        if cache is not None:
+            # Diffs of notebooks git has seen before don't start nbstripout at all
+            check_call(git_config + ['diff.ipynb.cachetextconv', 'true'])
+        else:
+            call(git_config + ['--unset', 'diff.ipynb.cachetextconv'], stdout=open(devnull, 'w'), stderr=STDOUT)
+        _drop_textconv_cache(install_location)
         attrfile = _get_attrfile(git_config, install_location, attrfile)
     except FileNotFoundError:
         print('Installation failed: git is not on path!', file=sys.stderr)
@@ -259,13 +421,26 @@ def install(
         return 1
 
 
+def _drop_textconv_cache(install_location: str):
+    """Drop the diffs git cached for the current repository, if any, when (un)installing nbstripout in it.
+
+    git only invalidates cached diffs when the textconv command changes, not when nbstripout is upgraded or its options
+    in the git config change. Dropping them whenever nbstripout is (re)installed gives a way to refresh them. Installing
+    globally or system-wide doesn't touch the repository, if any, nbstripout happens to be run in."""
+    if install_location != INSTALL_LOCATION_LOCAL:
+        return
+    call(['git', 'update-ref', '-d', TEXTCONV_CACHE_REF], stdout=open(devnull, 'w'), stderr=STDOUT)
+
+
 def uninstall(git_config: str, install_location: str = INSTALL_LOCATION_LOCAL, attrfile: Optional[str] = None) -> int:
     """Uninstall the git filter and unset the git attributes."""
     try:
         call(git_config + ['--unset', 'filter.nbstripout.clean'], stdout=open(devnull, 'w'), stderr=STDOUT)
         call(git_config + ['--unset', 'filter.nbstripout.smudge'], stdout=open(devnull, 'w'), stderr=STDOUT)
+        call(git_config + ['--unset', 'filter.nbstripout.process'], stdout=open(devnull, 'w'), stderr=STDOUT)
         call(git_config + ['--unset', 'filter.nbstripout.required'], stdout=open(devnull, 'w'), stderr=STDOUT)
         call(git_config + ['--remove-section', 'diff.ipynb'], stdout=open(devnull, 'w'), stderr=STDOUT)
+        _drop_textconv_cache(install_location)
         attrfile = _get_attrfile(git_config, install_location, attrfile)
     except FileNotFoundError:
         print('Uninstall failed: git is not on path!', file=sys.stderr)
@@ -298,9 +473,18 @@ def status(git_config: str, install_location: str = INSTALL_LOCATION_LOCAL, verb
             )
             location = f"in repository '{git_dir}'"
 
-        clean = check_output(git_config + ['filter.nbstripout.clean'], universal_newlines=True).strip()
-        smudge = check_output(git_config + ['filter.nbstripout.smudge'], universal_newlines=True).strip()
+        try:
+            process = check_output(git_config + ['filter.nbstripout.process'], universal_newlines=True).strip()
+        except CalledProcessError:
+            process = ''
+        if not process:
+            clean = check_output(git_config + ['filter.nbstripout.clean'], universal_newlines=True).strip()
+            smudge = check_output(git_config + ['filter.nbstripout.smudge'], universal_newlines=True).strip()
         diff = check_output(git_config + ['diff.ipynb.textconv'], universal_newlines=True).strip()
+        try:
+            cache_textconv = check_output(git_config + ['diff.ipynb.cachetextconv'], universal_newlines=True).strip()
+        except CalledProcessError:
+            cache_textconv = ''
 
         if install_location in {INSTALL_LOCATION_SYSTEM, INSTALL_LOCATION_GLOBAL}:
             attrfile = _get_attrfile(git_config, install_location)
@@ -332,12 +516,20 @@ def status(git_config: str, install_location: str = INSTALL_LOCATION_LOCAL, verb
         if verbose:
             print('nbstripout is installed', location)
             print('\nFilter:')
-            print('  clean =', clean)
-            print('  smudge =', smudge)
+            if process:
+                print('  process =', process)
+            else:
+                print('  clean =', clean)
+                print('  smudge =', smudge)
             print('  diff=', diff)
+            if cache_textconv:
+                print('  cachetextconv=', cache_textconv)
             print('  extrakeys=', extra_keys)
             print('\nAttributes:\n ', attributes)
             print('\nDiff Attributes:\n ', diff_attributes)
+            cache = _installed_cache(process or clean, diff)
+            if cache is not None:
+                _print_cache_status(cache, cache_textconv == 'true')
 
         return 0
     except FileNotFoundError:
@@ -351,33 +543,250 @@ def status(git_config: str, install_location: str = INSTALL_LOCATION_LOCAL, verb
         return 1
 
 
+def _installed_cache(*commands: str) -> Optional[ResultCache]:
+    """The result cache used by the first of the installed filter and diff `commands` using one, if any."""
+    for command in commands:
+        args = shlex.split(command)
+        if '--cache' not in args:
+            continue
+        options = dict(zip(args, args[1:]))
+        try:
+            directory = options.get('--cache-dir') or _default_cache_dir()
+        except CalledProcessError:
+            # The default cache directory is per repository
+            return None
+        max_size = _parse_size(options['--cache-size']) if '--cache-size' in options else DEFAULT_MAX_SIZE
+        return ResultCache(path.abspath(directory), '', max_size=max_size)
+    return None
+
+
+def _print_cache_status(cache: ResultCache, cache_textconv: bool):
+    """Print how well the result cache of the installed filter and diff driver works."""
+    print('\nCache:')
+    print('  directory =', cache.directory)
+    for line in _cache_usage(cache):
+        print(' ', line)
+    if cache_textconv:
+        notes = check_output(['git', 'notes', '--ref', TEXTCONV_CACHE_REF, 'list'], universal_newlines=True)
+        print('  Diffs cached by git:', len(notes.splitlines()))
+
+
+def _read_filter_config(git_config: List[str]) -> Dict[str, str]:
+    """Read all `filter.nbstripout.*` settings with a single git call, mapping their lower-case names to values."""
+    try:
+        with _stats.phase('git'):
+            output = check_output(
+                git_config + ['-z', '--get-regexp', r'^filter\.nbstripout\.'], universal_newlines=True, stderr=DEVNULL
+            )
+    except (CalledProcessError, FileNotFoundError):
+        # Not a git repository, or none of the settings are set
+        return {}
+    config = {}
+    # Entries are `<name>\n<value>\0`, where the last value of a name set several times takes precedence
+    for entry in output.split('\0'):
+        if entry:
+            name, _, value = entry.partition('\n')
+            config[name] = value
+    return config
+
+
+def _read_notebook(input_stream: io.IOBase, engine: str) -> Tuple[Union[dict, 'nbformat.NotebookNode'], str]:
+    """Read a notebook, returning it together with the engine to write it back with.
+
+    The json engine is only used for nbformat 4 notebooks. With engine 'auto', it is only used if nbformat would not
+    modify the notebook when reading it, i.e. there are no cell ids to repair.
+    """
+    if engine != 'nbformat':
+        s = input_stream.read()
+        nb = _json_engine.parse(s)
+        if isinstance(nb, dict) and (
+            _json_engine.is_safe(nb) if engine == 'auto' else nb.get('nbformat') == 4 and 'cells' in nb
+        ):
+            return _json_engine.from_dict(nb), 'json'
+        input_stream = io.StringIO(s)
+
+    import nbformat
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=UserWarning)
+        try:
+            return nbformat.read(input_stream, as_version=nbformat.NO_CONVERT), 'nbformat'
+        except nbformat.reader.NotJSONError as e:
+            raise _json_engine.NotJSONError(str(e)) from e
+
+
+def _write_notebook(nb: Union[dict, 'nbformat.NotebookNode'], output_stream: io.IOBase, engine: str):
+    if engine == 'json':
+        output_stream.write(_json_engine.writes(nb))
+        return
+    import nbformat
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=UserWarning)
+        nbformat.write(nb, output_stream)
+
+
+# Plans are keyed by the options of each document in a --batch stream, so bound how many a long-running process keeps
+@lru_cache(maxsize=64)
+def _cached_strip_plan(
+    keep_output: Optional[bool],
+    keep_count: bool,
+    keep_id: bool,
+    extra_keys: Tuple[str, ...],
+    drop_empty_cells: bool,
+    drop_tagged_cells: str,
+    strip_init_cells: bool,
+    drop_output_types: Tuple[str, ...],
+    keep_output_types: Tuple[str, ...],
+    max_size: str,
+    keep_mime_types: Tuple[str, ...] = (),
+    drop_mime_types: Tuple[str, ...] = (),
+    max_mime_sizes: Tuple[str, ...] = (),
+    keep_smallest_mime_type: bool = False,
+    truncate_lines: int = 0,
+    truncate_size: str = '0',
+    recompress_images: bool = False,
+) -> StripPlan:
+    return StripPlan.from_options(
+        keep_output=keep_output,
+        keep_count=keep_count,
+        keep_id=keep_id,
+        extra_keys=extra_keys,
+        drop_empty_cells=drop_empty_cells,
+        drop_tagged_cells=drop_tagged_cells.split(),
+        strip_init_cells=strip_init_cells,
+        drop_output_types=set(drop_output_types),
+        keep_output_types=set(keep_output_types),
+        max_size=_parse_size(max_size),
+        keep_mime_types=keep_mime_types,
+        drop_mime_types=drop_mime_types,
+        max_mime_sizes=dict(_split_mime_size(rule) for rule in max_mime_sizes),
+        keep_smallest_mime_type=keep_smallest_mime_type,
+        truncate_lines=truncate_lines,
+        truncate_size=_parse_size(truncate_size),
+        recompress_images=recompress_images,
+    )
+
+
+def _strip_plan(args: Namespace, extra_keys: List[str]) -> StripPlan:
+    """The strip plan for the options in `args`, compiled once per process rather than once per notebook."""
+    return _cached_strip_plan(
+        args.keep_output,
+        args.keep_count,
+        args.keep_id,
+        tuple(extra_keys),
+        args.drop_empty_cells,
+        args.drop_tagged_cells,
+        args.strip_init_cells,
+        tuple(args.drop_output_type),
+        tuple(args.keep_output_type),
+        args.max_size,
+        tuple(args.keep_mime_type),
+        tuple(args.drop_mime_type),
+        tuple(args.max_mime_size),
+        args.keep_smallest_mime_type,
+        args.truncate_lines,
+        args.truncate_size,
+        args.recompress_images,
+    )
+
+
 def process_jupyter_notebook(
     input_stream: io.IOBase,
     output_stream: io.IOBase,
     args: Namespace,
     extra_keys: List[str],
     filename: str = 'input from stdin',
+    report: Optional[StripReport] = None,
 ) -> bool:
-    with warnings.catch_warnings():
-        warnings.simplefilter('ignore', category=UserWarning)
-        nb = nbformat.read(input_stream, as_version=nbformat.NO_CONVERT)
-
-    nb_orig = copy.deepcopy(nb)
-    nb_stripped = strip_output(
-        nb=nb,
-        keep_output=args.keep_output,
-        keep_count=args.keep_count,
-        keep_id=args.keep_id,
-        extra_keys=extra_keys,
-        drop_empty_cells=args.drop_empty_cells,
-        drop_tagged_cells=args.drop_tagged_cells.split(),
-        strip_init_cells=args.strip_init_cells,
-        drop_output_types=set(args.drop_output_type),
-        keep_output_types=set(args.keep_output_type),
-        max_size=_parse_size(args.max_size),
-    )
+    """Strip a Jupyter notebook, returning whether it changed. What changed is recorded in `report`, if given."""
+    if args.stream:
+        return _process_jupyter_notebook_streaming(input_stream, output_stream, args, extra_keys, filename, report)
+    return _process_jupyter_notebook(input_stream, output_stream, args, extra_keys, filename, report)
+
 
-    any_change = nb_orig != nb_stripped
+def _process_jupyter_notebook_streaming(
+    input_stream: io.IOBase,
+    output_stream: io.IOBase,
+    args: Namespace,
+    extra_keys: List[str],
+    filename: str,
+    report: Optional[StripReport] = None,
+) -> bool:
+    from nbstripout._streaming import strip_jupyter_stream
+
+    in_place = output_stream is input_stream
+    with ExitStack() as stack:
+        if not input_stream.seekable():
+            # The notebook is scanned twice, so spool non-seekable input (i.e. stdin) to disk
+            spool = stack.enter_context(tempfile.TemporaryFile('w+', encoding='utf-8', newline=''))
+            with _stats.phase('read'):
+                shutil.copyfileobj(input_stream, spool)
+            spool.seek(0)
+            input_stream = spool
+
+        if args.dry_run:
+            target = stack.enter_context(open(devnull, 'w', encoding='utf-8'))
+        elif in_place:
+            # Don't overwrite the input while reading it, and only write it back if anything changes
+            target = stack.enter_context(tempfile.TemporaryFile('w+', encoding='utf-8', newline=''))
+        else:
+            target = output_stream
+            if output_stream.seekable():
+                output_stream.seek(0)
+                output_stream.truncate()
+
+        if report is None:
+            report = StripReport()
+        start = input_stream.tell()
+        with _stats.phase('stream'):
+            streamed = strip_jupyter_stream(input_stream, target, _strip_plan(args, extra_keys), report=report)
+        if not streamed:
+            input_stream.seek(start)
+            return _process_jupyter_notebook(
+                input_stream, input_stream if in_place else output_stream, args, extra_keys, filename, report
+            )
+
+        any_change = bool(report)
+        if args.dry_run:
+            if any_change:
+                output_stream.write(f'Dry run: would have stripped {filename}\n')
+            return any_change
+
+        if in_place:
+            if any_change:
+                target.seek(0)
+                output_stream.seek(0)
+                output_stream.truncate()
+                shutil.copyfileobj(target, output_stream)
+                output_stream.flush()
+            return any_change
+
+    try:
+        output_stream.flush()
+    except BrokenPipeError:
+        # Receiver closed their end of the pipe after reading the data
+        pass
+    return any_change
+
+
+def _process_jupyter_notebook(
+    input_stream: io.IOBase,
+    output_stream: io.IOBase,
+    args: Namespace,
+    extra_keys: List[str],
+    filename: str = 'input from stdin',
+    report: Optional[StripReport] = None,
+) -> bool:
+    with _stats.phase('read'):
+        nb, engine = _read_notebook(input_stream, args.engine)
+
+    if report is None:
+        report = StripReport()
+    with _stats.phase('strip'):
+        nb_stripped = _strip_plan(args, extra_keys).apply(nb, report=report)
+
+    any_change = bool(report)
     # Early exit when writing in-place and nothing changes.
     if not any_change and output_stream is input_stream:
         return any_change
@@ -390,9 +799,8 @@ def process_jupyter_notebook(
     if output_stream.seekable():
         output_stream.seek(0)
         output_stream.truncate()
-    with warnings.catch_warnings():
-        warnings.simplefilter('ignore', category=UserWarning)
-        nbformat.write(nb_stripped, output_stream)
+    with _stats.phase('write'):
+        _write_notebook(nb_stripped, output_stream, engine)
     try:
         output_stream.flush()
     except BrokenPipeError:
@@ -407,12 +815,17 @@ def process_zeppelin_notebook(
     args: Namespace,
     extra_keys: List[str],
     filename: str = 'input from stdin',
-):
-    nb = json.load(input_stream, object_pairs_hook=collections.OrderedDict)
-    nb_orig = copy.deepcopy(nb)
-    nb_stripped = strip_zeppelin_output(nb)
-
-    any_change = nb_orig != nb_stripped
+    report: Optional[StripReport] = None,
+) -> bool:
+    """Strip a Zeppelin notebook, returning whether it changed. What changed is recorded in `report`, if given."""
+    with _stats.phase('read'):
+        nb = json.load(input_stream)
+    if report is None:
+        report = StripReport()
+    with _stats.phase('strip'):
+        nb_stripped = _strip_plan(args, extra_keys).apply_zeppelin(nb, report=report)
+
+    any_change = bool(report)
     # Early exit when writing in-place and nothing changes.
     if not any_change and output_stream is input_stream:
         return any_change
@@ -425,13 +838,628 @@ def process_zeppelin_notebook(
     if output_stream.seekable():
         output_stream.seek(0)
         output_stream.truncate()
-    json.dump(nb_stripped, output_stream, indent=2)
-    output_stream.write('\n')
+    with _stats.phase('write'):
+        # A single write of the whole notebook is much faster than the many small writes of json.dump
+        output_stream.write(json.dumps(nb_stripped, indent=2) + '\n')
     output_stream.flush()
     return any_change
 
 
-def main():
+# The first top-level key of Jupyter notebooks is "cells" ("worksheets" for nbformat 3) and of Zeppelin notes
+# "paragraphs", and quotes are escaped within strings, so the first of these keys tells them apart
+_NOTEBOOK_KEY = re.compile(r'"(cells|worksheets|paragraphs)"\s*:')
+# How much of a notebook is read to tell Jupyter from Zeppelin notebooks
+_SNIFF_SIZE = 4096
+
+
+def _sniff_mode(head: str) -> str:
+    """Whether `head`, the beginning of a notebook, is that of a Jupyter or a Zeppelin notebook."""
+    match = _NOTEBOOK_KEY.search(head)
+    return 'zeppelin' if match is not None and match.group(1) == 'paragraphs' else 'jupyter'
+
+
+class _PrefixedStream(io.TextIOBase):
+    """The text `prefix` followed by the rest of `stream`, to put back what was read from a stream which can't seek."""
+
+    def __init__(self, prefix: str, stream: io.TextIOBase):
+        self._prefix = prefix
+        self._stream = stream
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: Optional[int] = -1) -> str:
+        if size is None or size < 0:
+            text, self._prefix = self._prefix + self._stream.read(), ''
+            return text
+        if self._prefix:
+            text, self._prefix = self._prefix[:size], self._prefix[size:]
+            return text
+        return self._stream.read(size)
+
+
+def process_notebook_auto(
+    input_stream: io.IOBase,
+    output_stream: io.IOBase,
+    args: Namespace,
+    extra_keys: List[str],
+    filename: str = 'input from stdin',
+    report: Optional[StripReport] = None,
+) -> bool:
+    """Strip a Jupyter or Zeppelin notebook, told apart by the extension of `filename` or else by its content."""
+    if filename.endswith('.zpln'):
+        mode = 'zeppelin'
+    elif filename.endswith('.ipynb'):
+        mode = 'jupyter'
+    elif input_stream.seekable():
+        start = input_stream.tell()
+        mode = _sniff_mode(input_stream.read(_SNIFF_SIZE))
+        input_stream.seek(start)
+    else:
+        # Only read the head of e.g. stdin, such that --stream keeps memory use bounded
+        head = input_stream.read(_SNIFF_SIZE)
+        mode = _sniff_mode(head)
+        input_stream = _PrefixedStream(head, input_stream)
+    process = process_zeppelin_notebook if mode == 'zeppelin' else process_jupyter_notebook
+    return process(input_stream, output_stream, args, extra_keys, filename, report)
+
+
+# The function stripping notebooks in each --mode. Every code path dispatches through this, such that an explicit mode
+# applies to all notebooks, whatever their extension
+_PROCESSORS: Dict[str, Callable[..., bool]] = {
+    'auto': process_notebook_auto,
+    'jupyter': process_jupyter_notebook,
+    'zeppelin': process_zeppelin_notebook,
+}
+
+
+def _process_blob(
+    content: bytes,
+    process_notebook: Callable[..., bool],
+    args: Namespace,
+    extra_keys: List[str],
+    filename: str,
+    newline: Optional[str] = None,
+    report: Optional[StripReport] = None,
+) -> Tuple[bool, bytes]:
+    """Strip a notebook held in memory, mimicking how files are read and written from disk.
+
+    Returns whether the notebook was changed and the stripped notebook."""
+    input_stream = io.TextIOWrapper(io.BytesIO(content), encoding='utf-8', newline=newline)
+    output_buffer = io.BytesIO()
+    output_stream = io.TextIOWrapper(output_buffer, encoding='utf-8', newline=newline)
+    any_change = process_notebook(
+        input_stream=input_stream,
+        output_stream=output_stream,
+        args=args,
+        extra_keys=extra_keys,
+        filename=filename,
+        report=report,
+    )
+    output_stream.flush()
+    return any_change, output_buffer.getvalue()
+
+
+def _strip_cached(
+    content: bytes,
+    cache: ResultCache,
+    process_notebook: Callable[..., bool],
+    args: Namespace,
+    extra_keys: List[str],
+    filename: str,
+    newline: Optional[str] = None,
+) -> Tuple[bool, bytes]:
+    """Like `_process_blob`, but look up the result in `cache` first and store it there on a miss."""
+    mode = process_notebook.__name__
+    with _stats.phase('cache'):
+        result = cache.get(content, mode)
+    if result is None:
+        # Cache the stripped notebook even for dry runs, such that it can be served for any later run
+        args = Namespace(**{**vars(args), 'dry_run': False})
+        result = _process_blob(content, process_notebook, args, extra_keys, filename, newline)
+        with _stats.phase('cache'):
+            cache.put(content, mode, *result)
+    return result
+
+
+def _document_options(options: Dict[str, Any], args: Namespace, extra_keys: List[str]) -> Tuple[Namespace, List[str]]:
+    """The arguments and extra keys for a document in a --batch stream, overriding those of the command line."""
+    unknown = sorted(set(options) - set(BATCH_OPTIONS))
+    if unknown:
+        raise ValueError(f'Unknown options: {", ".join(unknown)}')
+
+    def words(value: Union[str, List[str]]) -> List[str]:
+        return value.split() if isinstance(value, str) else [str(word) for word in value]
+
+    overrides = {}
+    for name, value in options.items():
+        if name in ('extra_keys', 'keep_metadata_keys'):
+            continue
+        if name in ('drop_output_type', 'keep_output_type', 'keep_mime_type', 'drop_mime_type', 'max_mime_size'):
+            value = words(value)
+        elif name == 'drop_tagged_cells':
+            value = ' '.join(words(value))
+        elif name in ('max_size', 'truncate_size'):
+            value = str(value)
+        elif name == 'truncate_lines':
+            value = int(value)
+        elif name == 'keep_output' and value is not None and not isinstance(value, bool):
+            raise ValueError(f'Option keep_output must be true, false or null, not {json.dumps(value)}')
+        elif name != 'keep_output' and not isinstance(value, bool):
+            raise ValueError(f'Option {name} must be true or false, not {json.dumps(value)}')
+        overrides[name] = value
+    keep_metadata_keys = set(words(options.get('keep_metadata_keys', '')))
+    extra_keys = [key for key in (*extra_keys, *words(options.get('extra_keys', ''))) if key not in keep_metadata_keys]
+    return Namespace(**{**vars(args), **overrides, 'dry_run': False}), extra_keys
+
+
+def _strip_document(
+    content: bytes, mode: Optional[str], options: Dict[str, Any], args: Namespace, extra_keys: List[str]
+) -> Tuple[bool, Optional[bytes]]:
+    """Strip a document read by --batch, returning whether it changed and the stripped document, unless a dry run."""
+    mode = mode or args.mode
+    if mode not in _PROCESSORS:
+        raise ValueError(f"Unknown mode '{mode}', expected 'auto', 'jupyter' or 'zeppelin'")
+    document_args, document_extra_keys = _document_options(options, args, extra_keys)
+    with _stats.notebook('document', len(content)):
+        any_change, output = _process_blob(
+            content, _PROCESSORS[mode], document_args, document_extra_keys, filename='document', newline=''
+        )
+    return any_change, None if args.dry_run else output
+
+
+def _decode_output(output: bytes) -> str:
+    """Decode a stripped notebook to be written to a text stream, which translates newlines itself."""
+    return io.TextIOWrapper(io.BytesIO(output), encoding='utf-8').read()
+
+
+def _write_result(any_change: bool, output: bytes, args: Namespace, output_stream: io.IOBase, filename: str):
+    """Write a cached result to `output_stream` the way `process_notebook` does, or report it for a dry run."""
+    if args.dry_run:
+        if any_change:
+            output_stream.write(f'Dry run: would have stripped {filename}\n')
+    else:
+        output_stream.write(_decode_output(output))
+
+
+def _default_cache_dir() -> str:
+    """The cache directory of the current git repository, shared by all its worktrees."""
+    git_dir = check_output(['git', 'rev-parse', '--git-common-dir'], universal_newlines=True, stderr=STDOUT)
+    return path.abspath(path.join(git_dir.strip(), 'nbstripout-cache'))
+
+
+def _open_cache(args: Namespace, extra_keys: List[str]) -> Optional[ResultCache]:
+    """Set up the result cache requested with --cache, if any."""
+    if not args.cache and not args.cache_stats:
+        return None
+    directory = args.cache_dir
+    if not directory:
+        try:
+            with _stats.phase('git'):
+                directory = _default_cache_dir()
+        except (CalledProcessError, FileNotFoundError):
+            print('Not using a cache: not a git repository, pass a cache directory instead', file=sys.stderr)
+            return None
+    from importlib.metadata import version
+
+    options = {option: getattr(args, option) for option in CACHE_OPTIONS}
+    options.update(
+        extra_keys=sorted(set(extra_keys)),
+        nbstripout=__version__,
+        nbformat=version('nbformat'),
+    )
+    return ResultCache(path.abspath(directory), fingerprint(options), max_size=_parse_size(args.cache_size))
+
+
+def _cache_usage(cache: ResultCache) -> List[str]:
+    """The size and cumulative hit rate of the cache."""
+    num_entries, total_size = cache.usage()
+    stats = cache.load_stats()
+    lookups = stats['hits'] + stats['misses']
+    hit_rate = f' ({stats["hits"] / lookups:.1%} hit rate)' if lookups else ''
+    return [
+        f'Entries: {num_entries} ({total_size} bytes, limit {cache.max_size} bytes)',
+        f'Hits: {stats["hits"]}, misses: {stats["misses"]}{hit_rate}',
+    ]
+
+
+def _cache_stats(cache: ResultCache) -> int:
+    """Print the size and cumulative hit rate of the cache."""
+    print(f'Cache directory: {cache.directory}')
+    for line in _cache_usage(cache):
+        print(line)
+    return 0
+
+
+def _strip_file(
+    filename: str,
+    process_notebook: Callable[..., bool],
+    args: Namespace,
+    extra_keys: List[str],
+    newline: Optional[str],
+    output_stream: io.IOBase,
+    cache: Optional[ResultCache] = None,
+) -> bool:
+    with _stats.notebook(filename, path.getsize(filename) if _stats.current() else None):
+        if cache is not None:
+            with _stats.phase('read'):
+                with open(filename, 'rb') as f:
+                    content = f.read()
+            any_change, output = _strip_cached(content, cache, process_notebook, args, extra_keys, filename, newline)
+            with _stats.phase('write'):
+                if args.textconv or args.dry_run:
+                    _write_result(any_change, output, args, output_stream, filename)
+                elif any_change:
+                    with open(filename, 'wb') as f:
+                        f.write(output)
+            return any_change
+
+        with io.open(filename, 'r+', encoding='utf8', newline=newline) as f:
+            out = output_stream if args.textconv or args.dry_run else f
+            return process_notebook(
+                input_stream=f, output_stream=out, args=args, extra_keys=extra_keys, filename=filename
+            )
+
+
+def _strip_file_job(
+    filename: str,
+    process_notebook: Callable[..., bool],
+    args: Namespace,
+    extra_keys: List[str],
+    newline: Optional[str],
+    cache: Optional[ResultCache] = None,
+) -> Tuple[bool, str, str, Optional[Counter], Optional[List[Dict]]]:
+    """Strip a file in a worker process.
+
+    Returns whether it changed, what was written to stdout and stderr and the cache stats and statistics (see --stats)
+    to be merged by the caller."""
+    stdout = io.StringIO()
+    if cache is not None:
+        cache.stats.clear()
+    with ExitStack() as stack:
+        stats = stack.enter_context(_stats.collecting(_stats.Stats(memory=args.stats[1]))) if args.stats else None
+        stderr = stack.enter_context(redirect_stderr(io.StringIO()))
+        any_change = _strip_file(filename, process_notebook, args, extra_keys, newline, stdout, cache)
+    return (
+        any_change,
+        stdout.getvalue(),
+        stderr.getvalue(),
+        cache.stats if cache is not None else None,
+        stats.notebooks if stats is not None else None,
+    )
+
+
+def _verify_file(
+    filename: str,
+    process_notebook: Callable[..., bool],
+    args: Namespace,
+    extra_keys: List[str],
+    newline: Optional[str],
+) -> 'FileResult':
+    """Check whether a file is stripped without changing it, possibly in a worker process."""
+    from nbstripout._verify import CLEAN, DIRTY, ERROR, FileResult
+
+    report = StripReport()
+    try:
+        with open(filename, 'rb') as f:
+            content = f.read()
+        with _stats.notebook(filename, len(content)):
+            any_change, output = _process_blob(content, process_notebook, args, extra_keys, filename, newline, report)
+    except FileNotFoundError:
+        return FileResult(filename, ERROR, error=f"Could not strip '{filename}': file not found")
+    except _json_engine.NotJSONError:
+        return FileResult(filename, ERROR, error=f"No valid notebook detected in '{filename}'")
+    except Exception as e:
+        return FileResult(filename, ERROR, error=f"Could not strip '{filename}': {e}")
+    if not any_change:
+        return FileResult(filename, CLEAN, len(content), len(content))
+    changes = {name: count for name, count in asdict(report).items() if count}
+    return FileResult(filename, DIRTY, len(content), len(output), changes)
+
+
+def _verify(
+    filenames: List[str],
+    process_notebook: Callable[..., bool],
+    args: Namespace,
+    extra_keys: List[str],
+    newline: Optional[str],
+    output_stream: io.IOBase,
+) -> bool:
+    """Check the files without changing them using `args.jobs` processes, and write the reports requested.
+
+    Returns whether the check failed, i.e. any file could not be checked or, with --verify, would be changed."""
+    from nbstripout._verify import DIRTY, ERROR, SKIPPED, FileResult, to_json, to_junit
+
+    check = partial(
+        _verify_file,
+        process_notebook=process_notebook,
+        args=Namespace(**{**vars(args), 'dry_run': False}),
+        extra_keys=extra_keys,
+        newline=newline,
+    )
+    failures = (DIRTY, ERROR) if args.verify else (ERROR,)
+    results = []
+    executor = None
+    if args.jobs > 1 and len(filenames) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        jobs = min(args.jobs, len(filenames))
+        executor = ProcessPoolExecutor(max_workers=jobs)
+        # Small chunks, such that --fail-fast doesn't wait for many files after the first failure
+        chunksize = 1 if args.fail_fast else max(1, len(filenames) // (4 * jobs))
+        checked = executor.map(check, filenames, chunksize=chunksize)
+    else:
+        checked = map(check, filenames)
+    try:
+        # Results are collected in the order of the files given, such that output is deterministic
+        for result in checked:
+            results.append(result)
+            if result.status == DIRTY:
+                output_stream.write(f'Dry run: would have stripped {result.file}\n')
+            elif result.status == ERROR:
+                print(result.error, file=sys.stderr)
+            if args.fail_fast and result.status in failures:
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    results.extend(FileResult(filename, SKIPPED) for filename in filenames[len(results) :])
+
+    for filename, to_report in ((args.report, to_json), (args.junit, to_junit)):
+        if filename:
+            with open(filename, 'w', encoding='utf-8') as f:
+                f.write(to_report(results) + '\n')
+    return any(result.status in failures for result in results)
+
+
+def _strip_staged(
+    pathspecs: List[str],
+    process_notebook: Callable[..., bool],
+    args: Namespace,
+    extra_keys: List[str],
+    newline: Optional[str],
+    output_stream: io.IOBase,
+    cache: Optional[ResultCache] = None,
+) -> bool:
+    """Strip the notebooks staged in the git index, leaving the working tree alone unless `args.worktree` is set.
+
+    Blobs are read and written and the index is updated in bulk, such that any number of notebooks takes a few git
+    calls. Returns whether any notebook was changed."""
+    from nbstripout._git_index import read_blobs, staged_entries, update_index, write_blobs
+
+    with _stats.phase('git'):
+        entries = [
+            entry
+            for entry in staged_entries(pathspecs)
+            if args.force or entry.path.endswith('.ipynb') or entry.path.endswith('.zpln')
+        ]
+    strip_args = Namespace(**{**vars(args), 'dry_run': False})
+    any_change = False
+    changed = []
+    contents = []
+    outputs = []
+    for entry, (_, content) in zip(entries, read_blobs([entry.sha for entry in entries])):
+        try:
+            with _stats.notebook(entry.path, len(content)):
+                if cache is not None:
+                    file_changed, output = _strip_cached(
+                        content, cache, process_notebook, strip_args, extra_keys, entry.path, ''
+                    )
+                else:
+                    file_changed, output = _process_blob(
+                        content, process_notebook, strip_args, extra_keys, entry.path, ''
+                    )
+        except _json_engine.NotJSONError:
+            print(f"No valid notebook detected in '{entry.path}'", file=sys.stderr)
+            raise SystemExit(1)
+        except Exception:
+            print(f"Could not strip '{entry.path}'", file=sys.stderr)
+            raise
+        if not file_changed:
+            continue
+        any_change = True
+        if args.dry_run:
+            output_stream.write(f'Dry run: would have stripped {entry.path}\n')
+            continue
+        changed.append(entry)
+        contents.append(content)
+        outputs.append(output)
+
+    with _stats.phase('git'):
+        update_index([entry._replace(sha=sha) for entry, sha in zip(changed, write_blobs(outputs))])
+
+    if args.worktree and changed:
+        toplevel = check_output(['git', 'rev-parse', '--show-toplevel'], universal_newlines=True).strip()
+        for entry, content, output in zip(changed, contents, outputs):
+            filename = path.join(toplevel, entry.path)
+            try:
+                with open(filename, 'rb') as f:
+                    unstaged_changes = f.read() != content
+            except FileNotFoundError:
+                unstaged_changes = True
+            if unstaged_changes:
+                print(f"Not stripping '{entry.path}' in the working tree: it has unstaged changes", file=sys.stderr)
+                continue
+            with open(filename, 'w', encoding='utf-8', newline=newline) as f:
+                f.write(_decode_output(output))
+    return any_change
+
+
+def _is_notebook_path(pathname: str) -> bool:
+    return pathname.endswith('.ipynb') or pathname.endswith('.zpln')
+
+
+def _strip_history_blob(
+    blob: Tuple[str, str, bytes], process_notebook: Callable[..., bool], args: Namespace, extra_keys: List[str]
+) -> Tuple[Optional[bytes], str]:
+    """Strip a notebook blob from the history, possibly in a worker process.
+
+    Returns the stripped blob, or None if it is unchanged, and an error message if it could not be stripped."""
+    sha, pathname, content = blob
+    try:
+        any_change, output = _process_blob(content, process_notebook, args, extra_keys, pathname, '')
+    except Exception as e:
+        return None, f"Could not strip '{pathname}' (blob {sha}), leaving it unchanged: {e}"
+    return (output if any_change else None), ''
+
+
+def _rewrite_history(
+    process_notebook: Callable[..., bool], args: Namespace, extra_keys: List[str], output_stream: io.IOBase
+) -> bool:
+    """Strip the notebooks in all commits of the repository and rewrite all refs.
+
+    Each unique notebook blob is stripped exactly once, using `args.jobs` processes. Returns whether any notebook
+    was changed."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    from nbstripout._git_index import read_blobs, write_blobs
+    from nbstripout._history import export_history, import_history, scan_history
+
+    if not args.dry_run and check_output(['git', 'status', '--porcelain', '--untracked-files=no']):
+        print('Could not rewrite history: commit or stash your changes first', file=sys.stderr)
+        raise SystemExit(1)
+
+    strip_args = Namespace(**{**vars(args), 'dry_run': False})
+    strip = partial(_strip_history_blob, process_notebook=process_notebook, args=strip_args, extra_keys=extra_keys)
+    replacements = {}
+    bytes_saved = 0
+    executor = None
+    with tempfile.TemporaryFile() as export:
+        export_history(export)
+        export.seek(0)
+        num_commits, blobs = scan_history(export, _is_notebook_path)
+
+        try:
+            # Only started once the history is exported, such that failing to export it leaves no workers behind
+            if args.jobs > 1:
+                executor = ProcessPoolExecutor(max_workers=args.jobs)
+            contents = read_blobs(list(blobs))
+            # Strip blobs in batches, such that only a bounded number of them are held in memory
+            while True:
+                batch = [(sha, blobs[sha], content) for sha, content in islice(contents, 64 * args.jobs)]
+                if not batch:
+                    break
+                results = executor.map(strip, batch) if executor is not None else map(strip, batch)
+                stripped = []
+                for (sha, _, content), (output, error) in zip(batch, results):
+                    if error:
+                        print(error, file=sys.stderr)
+                    elif output is not None:
+                        stripped.append((sha, output))
+                        bytes_saved += len(content) - len(output)
+                if args.dry_run:
+                    replacements.update((sha, '') for sha, _ in stripped)
+                else:
+                    new_shas = write_blobs([output for _, output in stripped])
+                    replacements.update((sha, new_sha) for (sha, _), new_sha in zip(stripped, new_shas))
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        output_stream.write(
+            f'{"Would have stripped" if args.dry_run else "Stripped"} {len(replacements)} of {len(blobs)} unique '
+            f'notebook blobs in {num_commits} commits, saving {bytes_saved} bytes\n'
+        )
+        if args.dry_run or not replacements:
+            return bool(replacements)
+
+        export.seek(0)
+        import_history(export, replacements, _is_notebook_path)
+
+    if check_output(['git', 'rev-parse', '--is-bare-repository'], universal_newlines=True).strip() == 'false':
+        # Point the index at the rewritten HEAD, leaving the working tree alone
+        check_call(['git', 'reset', '--quiet'])
+    output_stream.write(
+        'Run `git reflog expire --expire=now --all && git gc --prune=now` to remove the unstripped notebooks\n'
+    )
+    return True
+
+
+def _expand_globs(paths: List[str]) -> Iterator[str]:
+    """Expand glob patterns such as `**/*.ipynb` in `paths`, unless they name an existing file."""
+    import glob
+
+    for p in paths:
+        if path.exists(p) or not re.search(r'[*?[]', p):
+            yield p
+            continue
+        matches = sorted(glob.glob(p, recursive=True))
+        if not matches:
+            print(f"No files match '{p}'", file=sys.stderr)
+        yield from matches
+
+
+def _find_notebooks(paths: List[str]) -> Iterator[str]:
+    """Find the Jupyter notebooks in `paths`, recursing into directories."""
+    for p in paths:
+        if not path.isdir(p):
+            yield p
+            continue
+        for root, dirs, files in walk(p):
+            dirs[:] = sorted(d for d in dirs if d not in ('.git', '.ipynb_checkpoints'))
+            for name in sorted(files):
+                if name.endswith('.ipynb'):
+                    yield path.join(root, name)
+
+
+def _read_file(filename: str) -> Tuple[str, bytes]:
+    with open(filename, 'rb') as f:
+        return filename, f.read()
+
+
+def _analyze(args: Namespace, output_stream: io.IOBase):
+    """Report where the output bytes are in the notebooks in the working tree or the history."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    from nbstripout._analyze import Report, analyze_notebook
+    from nbstripout._git_index import read_blobs
+    from nbstripout._history import reachable_blobs
+
+    if args.analyze == 'history':
+        blobs = reachable_blobs(lambda pathname: pathname.endswith('.ipynb'))
+        names = {sha: f'{pathname}@{sha[:10]}' for sha, pathname in blobs}
+        items = ((names[sha], content) for sha, content in read_blobs([sha for sha, _ in blobs]))
+    else:
+        items = (_read_file(filename) for filename in _find_notebooks(args.files or ['.']))
+
+    report = Report()
+    executor = ProcessPoolExecutor(max_workers=args.jobs) if args.jobs > 1 else None
+    try:
+        # Analyze notebooks in batches, such that only a bounded number of them are held in memory
+        while True:
+            batch = list(islice(items, 64 * args.jobs))
+            if not batch:
+                break
+            for record in (
+                executor.map(analyze_notebook, batch) if executor is not None else map(analyze_notebook, batch)
+            ):
+                report.add(record)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    output_stream.write(report.to_json() + '\n' if args.json else report.to_table())
+
+
+def _parse_jobs(jobs: str) -> int:
+    if jobs == 'auto':
+        return cpu_count() or 1
+    try:
+        num_jobs = int(jobs)
+    except ValueError:
+        num_jobs = 0
+    if num_jobs < 1:
+        raise ArgumentTypeError(f"invalid number of jobs '{jobs}', expected a positive integer or 'auto'")
+    return num_jobs
+
+
+def _parse_stats(options: str) -> Tuple[str, bool]:
+    try:
+        return _stats.parse_options(options)
+    except ValueError as e:
+        raise ArgumentTypeError(str(e))
+
+
+def _build_parser() -> ArgumentParser:
     parser = ArgumentParser(epilog=__doc__, formatter_class=RawDescriptionHelpFormatter)
     task = parser.add_mutually_exclusive_group()
     task.add_argument('--dry-run', action='store_true', help='Print which notebooks would have been stripped')
@@ -454,9 +1482,39 @@ def main():
         help='Print status of nbstripout installation in current repository and configuration summary if installed',
     )
     task.add_argument('--version', action='store_true', help='Print version')
+    task.add_argument(
+        '--cache-stats',
+        action='store_true',
+        help='Print the size and hit rate of the result cache (see --cache)',
+    )
+    task.add_argument(
+        '--serve',
+        action='store_true',
+        help='Serve nbstripout-client invocations from a warm process listening on a per-user Unix domain socket',
+    )
+    parser.add_argument(
+        '--socket',
+        metavar='PATH',
+        help='Socket to --serve on (default: $NBSTRIPOUT_SOCKET, or nbstripout/daemon.sock in $XDG_RUNTIME_DIR)',
+    )
     parser.add_argument(
         '--verify', action='store_true', help='Return a non-zero exit code if any files were changed, Implies --dry-run'
     )
+    parser.add_argument(
+        '--report',
+        metavar='FILE',
+        help='Write a JSON report listing each file checked, what stripping would change and how many bytes it would '
+        'save. Implies --dry-run',
+    )
+    parser.add_argument(
+        '--junit', metavar='FILE', help='Write a JUnit XML report with a test case per file checked. Implies --dry-run'
+    )
+    parser.add_argument(
+        '--fail-fast',
+        action='store_true',
+        help='Stop checking files after the first one which could not be checked or, with --verify, is not stripped. '
+        'Implies --dry-run',
+    )
     parser.add_argument('--keep-count', action='store_true', help='Do not strip the execution count/prompt number')
     parser.add_argument('--keep-output', action='store_true', help='Do not strip output', default=None)
     parser.add_argument(
@@ -471,6 +1529,57 @@ def main():
         nargs='+',
         default=[],
     )
+    parser.add_argument(
+        '--keep-mime-type',
+        metavar='MIME',
+        help='MIME types to keep in the data of outputs which are kept, dropping all other representations, e.g. '
+        '"text/plain" or "text/*"',
+        nargs='+',
+        default=[],
+    )
+    parser.add_argument(
+        '--drop-mime-type',
+        metavar='MIME',
+        help='MIME types to drop from the data of outputs which are kept, e.g. "image/*". Outputs left without any '
+        'representation are dropped',
+        nargs='+',
+        default=[],
+    )
+    parser.add_argument(
+        '--max-mime-size',
+        metavar='MIME=SIZE',
+        type=_parse_mime_size,
+        help='Drop representations of a MIME type larger than SIZE from the data of outputs which are kept, e.g. '
+        '"image/*=100K"',
+        nargs='+',
+        default=[],
+    )
+    parser.add_argument(
+        '--keep-smallest-mime-type',
+        action='store_true',
+        help='Keep only the smallest representation in the data of outputs which are kept',
+    )
+    parser.add_argument(
+        '--truncate-lines',
+        metavar='N',
+        type=int,
+        default=0,
+        help='Keep only the first and last N lines of the stream text, tracebacks and text/plain data of outputs which '
+        'are kept, replacing the lines in between with a note of how many were elided',
+    )
+    parser.add_argument(
+        '--truncate-size',
+        metavar='SIZE',
+        default='0',
+        help='Keep only the first and last SIZE characters of the stream text, tracebacks and text/plain data of '
+        'outputs which are kept, like --truncate-lines',
+    )
+    parser.add_argument(
+        '--recompress-images',
+        action='store_true',
+        help='Re-compress PNG images in outputs which are kept at the highest zlib level, keeping the result only if '
+        'it is smaller. Pixels are left unchanged',
+    )
     parser.add_argument(
         '--keep-id',
         action='store_true',
@@ -479,7 +1588,8 @@ def main():
     parser.add_argument(
         '--extra-keys',
         default='',
-        help='Space separated list of extra keys to strip from metadata, e.g. metadata.foo cell.metadata.bar',
+        help='Space separated list of extra keys to strip from metadata, e.g. metadata.foo cell.metadata.bar, or '
+        'note.foo paragraph.bar for Zeppelin notebooks',
     )
     parser.add_argument(
         '--keep-metadata-keys',
@@ -524,12 +1634,74 @@ def main():
     parser.add_argument(
         '--mode',
         '-m',
-        default='jupyter',
-        choices=['jupyter', 'zeppelin'],
-        help='Specify mode between [jupyter (default) | zeppelin] (to be used in combination with -f)',
+        default='auto',
+        choices=['auto', 'jupyter', 'zeppelin'],
+        help='Specify mode between [auto (default) | jupyter | zeppelin]. auto strips .ipynb files as Jupyter and '
+        '.zpln files as Zeppelin notebooks, and tells other files and stdin apart by their content',
+    )
+
+    parser.add_argument(
+        '--engine',
+        default='auto',
+        choices=['auto', 'json', 'nbformat'],
+        help='How to read and write Jupyter notebooks: json uses the stdlib json module for nbformat 4 notebooks, '
+        'skipping nbformat validation; nbformat always uses nbformat; auto (default) uses json whenever nbformat '
+        'would not modify the notebook when reading it',
+    )
+
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help='Strip Jupyter notebooks incrementally without loading them into memory as a whole, for very large '
+        'notebooks. Outputs which are stripped are never loaded',
     )
 
     parser.add_argument('--textconv', '-t', action='store_true', help='Prints stripped files to STDOUT')
+    parser.add_argument(
+        '--process',
+        action='store_true',
+        help='Run as a long-running git filter process. In combination with --install, '
+        'set up filter.nbstripout.process instead of a clean/smudge filter',
+    )
+    parser.add_argument(
+        '--batch',
+        nargs='?',
+        const='ndjson',
+        choices=['ndjson', 'length'],
+        help='Strip a stream of notebook documents read from stdin, each optionally with its own mode and options, '
+        'and write the stripped documents and their status to stdout. Messages are JSON objects framed as NDJSON '
+        '(the default) or prefixed with their length (length). Use --jobs to strip documents in parallel',
+    )
+
+    parser.add_argument(
+        '--staged',
+        action='store_true',
+        help='Strip the notebooks staged in the git index instead of files, restricted to the paths given if any. '
+        'The working tree is left alone unless --worktree is given',
+    )
+    parser.add_argument(
+        '--worktree',
+        action='store_true',
+        help='With --staged, also strip the notebooks in the working tree, unless they have unstaged changes',
+    )
+
+    parser.add_argument(
+        '--rewrite-history',
+        action='store_true',
+        help='Strip the notebooks in all commits of the current repository, rewriting all branches and tags. '
+        'Each unique notebook is stripped once, use --jobs to strip them in parallel',
+    )
+
+    parser.add_argument(
+        '--analyze',
+        nargs='?',
+        const='worktree',
+        choices=['worktree', 'history'],
+        help='Report the size of outputs by output type, MIME type, notebook and cell, and how much candidate '
+        'policies would save, for the notebooks in the files and directories given (worktree, the default) or all '
+        'notebooks reachable in the history of the current repository (history). Use --jobs to analyze in parallel',
+    )
+    parser.add_argument('--json', action='store_true', help='Print the --analyze report as JSON')
 
     parser.add_argument(
         '--unix-newlines',
@@ -537,11 +1709,84 @@ def main():
         help='Force UNIX line endings in output (if unset, normalize to os.linesep)',
     )
 
-    parser.add_argument('files', nargs='*', help='Files to strip output from')
-    args = parser.parse_args()
+    parser.add_argument(
+        '--jobs',
+        '-j',
+        metavar='N',
+        type=_parse_jobs,
+        default=1,
+        help="Number of files to strip in parallel, or 'auto' to use all CPUs (default: 1)",
+    )
+
+    parser.add_argument(
+        '--cache',
+        action='store_true',
+        help='Cache stripped notebooks by content and options, such that unchanged notebooks are not parsed again. '
+        'In combination with --install, set up the filter and diff driver to use the cache',
+    )
+    parser.add_argument(
+        '--cache-dir',
+        metavar='DIR',
+        help='Directory of the result cache (default: .git/nbstripout-cache of the current repository)',
+    )
+    parser.add_argument(
+        '--cache-size',
+        metavar='SIZE',
+        default='256M',
+        help='Evict the least recently used entries when the cache grows beyond SIZE (default: 256M)',
+    )
+
+    parser.add_argument(
+        '--stats',
+        nargs='?',
+        const='text',
+        metavar='OPTIONS',
+        type=_parse_stats,
+        help='Print how long reading, stripping and writing each notebook and calling git took to stderr. OPTIONS is '
+        'a comma separated list of json, to print JSON lines, and memory, to trace peak memory with tracemalloc, '
+        'e.g. --stats=json,memory (default: $NBSTRIPOUT_STATS, e.g. NBSTRIPOUT_STATS=1 to enable it for git filters)',
+    )
+    parser.add_argument(
+        '--profile',
+        metavar='FILE',
+        help='Write cProfile statistics of this invocation to FILE, where {pid} is replaced with the process id '
+        '(default: $NBSTRIPOUT_PROFILE)',
+    )
+
+    parser.add_argument(
+        'files',
+        nargs='*',
+        help='Files to strip output from. Glob patterns, e.g. "**/*.ipynb", are expanded if the shell does not',
+    )
+    return parser
+
+
+def main():
+    args = _build_parser().parse_args()
+    if args.stats is None and environ.get('NBSTRIPOUT_STATS'):
+        # Git filters can't easily be given extra arguments, so statistics can also be enabled from the environment
+        try:
+            args.stats = _stats.parse_options(environ['NBSTRIPOUT_STATS'])
+        except ValueError as e:
+            print(f'Ignoring NBSTRIPOUT_STATS: {e}', file=sys.stderr)
+    profile = args.profile or environ.get('NBSTRIPOUT_PROFILE')
+
+    with ExitStack() as stack:
+        if profile:
+            stack.enter_context(_stats.profiling(profile))
+        if args.stats:
+            output_format, memory = args.stats
+            stats = _stats.Stats(memory=memory)
+            # Written once collecting has finished, also when exiting with SystemExit
+            stack.callback(stats.write, sys.stderr, output_format)
+            stack.enter_context(_stats.collecting(stats))
+        _main(args)
+
+
+def _main(args: Namespace):
     git_config = ['git', 'config']
 
-    if args.verify and not args.dry_run:
+    if (args.verify or args.report or args.junit or args.fail_fast) and not args.dry_run:
         args.dry_run = True
 
     if args._system:
@@ -555,7 +1800,16 @@ def main():
         install_location = INSTALL_LOCATION_LOCAL
 
     if args.install:
-        raise SystemExit(install(git_config, install_location, python=args._python, attrfile=args.attributes))
+        raise SystemExit(
+            install(
+                git_config,
+                install_location,
+                python=args._python,
+                attrfile=args.attributes,
+                process=args.process,
+                cache=(args.cache_dir or '') if args.cache else None,
+            )
+        )
     if args.uninstall:
         raise SystemExit(uninstall(git_config, install_location, attrfile=args.attributes))
     if args.is_installed:
@@ -565,47 +1819,25 @@ def main():
     if args.version:
         print(__version__)
         raise SystemExit(0)
+    if args.serve:
+        from nbstripout._daemon import serve
 
-    extra_keys = [
-        'metadata.signature',
-        'metadata.widgets',
-        'cell.metadata.collapsed',
-        'cell.metadata.ExecuteTime',
-        'cell.metadata.execution',
-        'cell.metadata.heading_collapsed',
-        'cell.metadata.hidden',
-        'cell.metadata.scrolled',
-    ]
+        raise SystemExit(serve(main, args.socket, preload=_DEFERRED_MODULES))
 
-    try:
-        extra_keys.extend(
-            check_output(
-                (git_config if args._system or args._global else ['git', 'config']) + ['filter.nbstripout.extrakeys'],
-                universal_newlines=True,
-            )
-            .strip()
-            .split()
-        )
-    except (CalledProcessError, FileNotFoundError):
-        pass
+    extra_keys = list(DEFAULT_EXTRA_KEYS)
 
+    filter_config = _read_filter_config(git_config if args._system or args._global else ['git', 'config'])
+    extra_keys.extend(filter_config.get('filter.nbstripout.extrakeys', '').split())
     extra_keys.extend(args.extra_keys.split())
 
-    try:
-        keep_metadata_keys = (
-            check_output(
-                (git_config if args._system or args._global else ['git', 'config'])
-                + ['filter.nbstripout.keepmetadatakeys'],
-                universal_newlines=True,
-            )
-            .strip()
-            .split()
-        )
-    except (CalledProcessError, FileNotFoundError):
-        keep_metadata_keys = []
+    keep_metadata_keys = filter_config.get('filter.nbstripout.keepmetadatakeys', '').split()
     keep_metadata_keys.extend(args.keep_metadata_keys.split())
     extra_keys = [i for i in extra_keys if i not in keep_metadata_keys]
 
+    cache = _open_cache(args, extra_keys)
+    if args.cache_stats:
+        raise SystemExit(1 if cache is None else _cache_stats(cache))
+
     # Note that we can't actually preserve newlines from the input file: nbformat implicitly converts all newlines to \n
     # and setting newline='' disables normalization of newlines on output, so the output will always use \n as newlines.
     newline = '' if args.unix_newlines else None
@@ -615,38 +1847,156 @@ def main():
     input_stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8') if sys.stdin else None
     output_stream = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', newline=newline)
 
-    process_notebook = {'jupyter': process_jupyter_notebook, 'zeppelin': process_zeppelin_notebook}[args.mode]
-    any_change = False
-    for filename in args.files:
-        if not (args.force or filename.endswith('.ipynb') or filename.endswith('.zpln')):
-            continue
+    process_notebook = _PROCESSORS[args.mode]
+
+    if args.process:
+
+        def clean(pathname: str, content: bytes) -> bytes:
+            with _stats.notebook(pathname, len(content)):
+                if cache is not None:
+                    return _strip_cached(content, cache, process_notebook, args, extra_keys, pathname, newline)[1]
+                return _process_blob(content, process_notebook, args, extra_keys, filename=pathname, newline=newline)[1]
 
         try:
-            with io.open(filename, 'r+', encoding='utf8', newline=newline) as f:
-                out = output_stream if args.textconv or args.dry_run else f
-                if process_notebook(
-                    input_stream=f, output_stream=out, args=args, extra_keys=extra_keys, filename=filename
-                ):
-                    any_change = True
+            raise SystemExit(run_filter_process(clean))
+        finally:
+            if cache is not None:
+                cache.flush()
+
+    if args.batch:
+        from nbstripout._batch import BatchError, handle_request, run_batch
 
-        except nbformat.reader.NotJSONError:
-            print(f"No valid notebook detected in '{filename}'", file=sys.stderr)
+        strip = partial(_strip_document, args=args, extra_keys=extra_keys)
+        try:
+            run_batch(partial(handle_request, strip=strip), sys.stdin.buffer, sys.stdout.buffer, args.batch, args.jobs)
+        except BatchError as e:
+            print(f'Could not read batch: {e}', file=sys.stderr)
             raise SystemExit(1)
-        except FileNotFoundError:
-            print(f"Could not strip '{filename}': file not found", file=sys.stderr)
+        raise SystemExit(0)
+
+    if args.staged:
+        try:
+            any_change = _strip_staged(args.files, process_notebook, args, extra_keys, newline, output_stream, cache)
+        except (CalledProcessError, FileNotFoundError):
+            print('Could not strip staged notebooks: not a git repository or git is not on path!', file=sys.stderr)
             raise SystemExit(1)
-        except Exception:
-            # Ignore exceptions for non-notebook files.
-            print(f"Could not strip '{filename}'", file=sys.stderr)
-            raise
+        finally:
+            if cache is not None:
+                cache.flush()
+        output_stream.flush()
+        raise SystemExit(1 if args.verify and any_change else 0)
+
+    if args.analyze:
+        try:
+            _analyze(args, output_stream)
+        except (CalledProcessError, FileNotFoundError) as e:
+            print(f'Could not analyze notebooks: {e}', file=sys.stderr)
+            raise SystemExit(1)
+        output_stream.flush()
+        raise SystemExit(0)
+
+    if args.rewrite_history:
+        try:
+            any_change = _rewrite_history(process_notebook, args, extra_keys, output_stream)
+        except (CalledProcessError, FileNotFoundError):
+            print('Could not rewrite history: not a git repository or git is not on path!', file=sys.stderr)
+            raise SystemExit(1)
+        output_stream.flush()
+        raise SystemExit(1 if args.verify and any_change else 0)
+
+    any_change = False
+    filenames = [f for f in _expand_globs(args.files) if args.force or f.endswith('.ipynb') or f.endswith('.zpln')]
+    if args.report or args.junit or args.fail_fast:
+        failed = _verify(filenames, process_notebook, args, extra_keys, newline, output_stream)
+        output_stream.flush()
+        raise SystemExit(1 if failed else 0)
+
+    executor = None
+    if args.jobs > 1 and len(filenames) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        jobs = min(args.jobs, len(filenames))
+        executor = ProcessPoolExecutor(max_workers=jobs)
+        # Results are collected in the order of the files given, such that output is deterministic
+        results = executor.map(
+            partial(
+                _strip_file_job,
+                process_notebook=process_notebook,
+                args=args,
+                extra_keys=extra_keys,
+                newline=newline,
+                cache=cache,
+            ),
+            filenames,
+            chunksize=max(1, len(filenames) // (4 * jobs)),
+        )
+    else:
+        results = (
+            (
+                _strip_file(filename, process_notebook, args, extra_keys, newline, output_stream, cache),
+                '',
+                '',
+                None,
+                None,
+            )
+            for filename in filenames
+        )
+
+    try:
+        for filename in filenames:
+            try:
+                file_changed, stdout, stderr, cache_stats, notebook_stats = next(results)
+                output_stream.write(stdout)
+                sys.stderr.write(stderr)
+                if cache_stats:
+                    cache.stats.update(cache_stats)
+                if notebook_stats:
+                    _stats.current().add_notebooks(notebook_stats)
+                if file_changed:
+                    any_change = True
+
+            except _json_engine.NotJSONError:
+                print(f"No valid notebook detected in '{filename}'", file=sys.stderr)
+                raise SystemExit(1)
+            except FileNotFoundError:
+                print(f"Could not strip '{filename}': file not found", file=sys.stderr)
+                raise SystemExit(1)
+            except Exception:
+                # Ignore exceptions for non-notebook files.
+                print(f"Could not strip '{filename}'", file=sys.stderr)
+                raise
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+            try:
+                output_stream.flush()
+            except BrokenPipeError:
+                pass
+        if cache is not None:
+            cache.flush()
 
     if not args.files and input_stream:
         try:
-            if process_notebook(input_stream, output_stream, args, extra_keys):
-                any_change = True
-        except nbformat.reader.NotJSONError:
+            with _stats.notebook('input from stdin'):
+                if cache is not None:
+                    with _stats.phase('read'):
+                        content = input_stream.buffer.read()
+                    file_changed, output = _strip_cached(
+                        content, cache, process_notebook, args, extra_keys, 'input from stdin', newline
+                    )
+                    with _stats.phase('write'):
+                        _write_result(file_changed, output, args, output_stream, 'input from stdin')
+                        output_stream.flush()
+                    if file_changed:
+                        any_change = True
+                elif process_notebook(input_stream, output_stream, args, extra_keys):
+                    any_change = True
+        except _json_engine.NotJSONError:
             print('No valid notebook detected on stdin', file=sys.stderr)
             raise SystemExit(1)
+        finally:
+            if cache is not None:
+                cache.flush()
 
     if args.verify and any_change:
         raise SystemExit(1)
@@ -0,0 +1,91 @@
+"""Lossless re-compression of PNG images, using nothing but zlib.
+
+The image data of a PNG is a single zlib stream split across its IDAT chunks. It is decompressed and compressed again
+at the highest level, and written back as a single IDAT chunk if that makes the image smaller. The decompressed data,
+and hence every pixel, stays the same, as do all other chunks. Compression is deterministic, so compressing an image
+which was re-compressed already doesn't make it any smaller, and leaves it unchanged.
+"""
+
+import base64
+import binascii
+import struct
+from typing import List, Optional, Tuple
+import zlib
+
+__all__ = ['recompress_png', 'recompress_base64_png']
+
+_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def _chunks(data: bytes) -> Optional[List[Tuple[bytes, bytes]]]:
+    """Split a PNG into its chunk types and data, or return None if it isn't a well-formed PNG."""
+    if not data.startswith(_SIGNATURE):
+        return None
+    chunks = []
+    offset = len(_SIGNATURE)
+    while offset < len(data):
+        if offset + 12 > len(data):
+            return None
+        length, chunk_type = struct.unpack_from('>I4s', data, offset)
+        end = offset + 12 + length
+        if end > len(data):
+            return None
+        chunks.append((chunk_type, data[offset + 8 : end - 4]))
+        offset = end
+    if not chunks or chunks[-1][0] != b'IEND':
+        return None
+    return chunks
+
+
+def _chunk(chunk_type: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data))
+
+
+def _deflate(raw: bytes) -> bytes:
+    """Compress `raw` as small as zlib gets it with the strategies suited to image data."""
+    candidates = []
+    for strategy in (zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED):
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 15, 9, strategy)
+        candidates.append(compressor.compress(raw) + compressor.flush())
+    return min(candidates, key=len)
+
+
+def recompress_png(data: bytes) -> Optional[bytes]:
+    """Re-compress the PNG `data`, returning the smaller image, or None if it can't be made smaller."""
+    chunks = _chunks(data)
+    if chunks is None:
+        return None
+    idat = [i for i, (chunk_type, _) in enumerate(chunks) if chunk_type == b'IDAT']
+    # IDAT chunks must be consecutive
+    if not idat or idat[-1] - idat[0] + 1 != len(idat):
+        return None
+    decompressor = zlib.decompressobj()
+    try:
+        raw = decompressor.decompress(b''.join(chunk_data for _, chunk_data in chunks[idat[0] : idat[-1] + 1]))
+    except zlib.error:
+        return None
+    if not decompressor.eof or decompressor.unused_data:
+        return None
+
+    recompressed = b''.join(
+        [
+            _SIGNATURE,
+            *(_chunk(chunk_type, chunk_data) for chunk_type, chunk_data in chunks[: idat[0]]),
+            _chunk(b'IDAT', _deflate(raw)),
+            *(_chunk(chunk_type, chunk_data) for chunk_type, chunk_data in chunks[idat[-1] + 1 :]),
+        ]
+    )
+    return recompressed if len(recompressed) < len(data) else None
+
+
+def recompress_base64_png(value: str) -> Optional[str]:
+    """Like `recompress_png` for a base64 encoded PNG, as found in the outputs of notebooks."""
+    try:
+        data = base64.b64decode(value)
+    except (binascii.Error, ValueError):
+        return None
+    recompressed = recompress_png(data)
+    if recompressed is None:
+        return None
+    # Jupyter ends base64 encoded images with a newline
+    return base64.b64encode(recompressed).decode('ascii') + ('\n' if value.endswith('\n') else '')
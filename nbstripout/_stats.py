@@ -0,0 +1,191 @@
+"""Per-phase timing and memory statistics, collected with --stats or $NBSTRIPOUT_STATS.
+
+Code paths time their phases with `phase` and the work on each notebook with `notebook`. Both are no-ops unless
+statistics are being collected, so they can be used on hot paths. Phases are timed exclusively, i.e. the time of a
+phase nested in another one only counts towards the inner phase. Time outside of any phase is reported as `other`.
+"""
+
+from contextlib import contextmanager, nullcontext
+import json
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+__all__ = ['Stats', 'parse_options', 'collecting', 'current', 'phase', 'notebook', 'profiling']
+
+_NO_OP = nullcontext()
+# Statistics being collected by this process, if any
+_current: Optional['Stats'] = None
+
+
+def parse_options(value: str) -> Tuple[str, bool]:
+    """Parse a comma separated list of options into the output format (text or json) and whether to trace memory."""
+    output_format = 'text'
+    memory = False
+    for option in value.lower().split(','):
+        option = option.strip()
+        if option in ('text', 'json'):
+            output_format = option
+        elif option == 'memory':
+            memory = True
+        elif option not in ('', '1', 'true', 'yes', 'on'):
+            raise ValueError(
+                f"invalid stats option '{option}', expected a comma separated list of text, json or memory"
+            )
+    return output_format, memory
+
+
+def _format_seconds(seconds: float) -> str:
+    return f'{seconds * 1e3:.1f} ms'
+
+
+def _format_phases(phases: Dict[str, float]) -> str:
+    return ', '.join(f'{name} {_format_seconds(seconds)}' for name, seconds in phases.items())
+
+
+class Stats:
+    """Time spent in each phase and peak memory, in total and per notebook.
+
+    With `memory`, peak memory is traced with tracemalloc, which slows nbstripout down noticeably.
+    """
+
+    def __init__(self, memory: bool = False):
+        self.memory = memory
+        self.phases: Dict[str, float] = {}
+        self.notebooks: List[Dict[str, Any]] = []
+        self.seconds = 0.0
+        self.peak_memory: Optional[int] = None
+        # Time spent in phases nested in each of the phases currently entered
+        self._nested: List[float] = []
+        self._notebook: Optional[Dict[str, Any]] = None
+
+    def _add_phase(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+        if self._notebook is not None:
+            phases = self._notebook['phases']
+            phases[name] = phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        self._nested.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            nested = self._nested.pop()
+            if self._nested:
+                self._nested[-1] += seconds
+            self._add_phase(name, seconds - nested)
+
+    @contextmanager
+    def notebook(self, name: str, size: Optional[int] = None) -> Iterator[None]:
+        import tracemalloc
+
+        record = {'notebook': name, 'bytes': size, 'seconds': 0.0, 'phases': {}}
+        self._notebook = record
+        if self.memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            if self.memory:
+                record['peak_memory'] = tracemalloc.get_traced_memory()[1]
+                self.peak_memory = max(self.peak_memory or 0, record['peak_memory'])
+            self._notebook = None
+            self.notebooks.append(record)
+
+    def add_notebooks(self, records: List[Dict[str, Any]]):
+        """Add the notebook records of another process, e.g. a worker stripping files in parallel."""
+        for record in records:
+            self.notebooks.append(record)
+            for name, seconds in record['phases'].items():
+                self.phases[name] = self.phases.get(name, 0.0) + seconds
+            if record.get('peak_memory') is not None:
+                self.peak_memory = max(self.peak_memory or 0, record['peak_memory'])
+
+    def summary(self) -> Dict[str, Any]:
+        sizes = [record['bytes'] for record in self.notebooks if record['bytes'] is not None]
+        # Phases of notebooks stripped in parallel can add up to more than the total
+        other = max(0.0, self.seconds - sum(self.phases.values()))
+        return {
+            'notebooks': len(self.notebooks),
+            'bytes': sum(sizes) if sizes else None,
+            'seconds': self.seconds,
+            'phases': {**self.phases, 'other': other},
+            'peak_memory': self.peak_memory,
+        }
+
+    def write(self, stream: TextIO, output_format: str = 'text'):
+        """Write a line per notebook and a summary line, either human readable or as JSON lines."""
+        summary = self.summary()
+        if output_format == 'json':
+            for record in self.notebooks:
+                stream.write(json.dumps(record) + '\n')
+            stream.write(json.dumps({'total': summary}) + '\n')
+            return
+
+        def describe(record: Dict[str, Any]) -> str:
+            size = '' if record['bytes'] is None else f'{record["bytes"]} bytes in '
+            memory = '' if record.get('peak_memory') is None else f', peak memory {record["peak_memory"] / 1e6:.2f} MB'
+            return f'{size}{_format_seconds(record["seconds"])} ({_format_phases(record["phases"])}){memory}'
+
+        for record in self.notebooks:
+            stream.write(f'nbstripout stats: {record["notebook"]}: {describe(record)}\n')
+        stream.write(f'nbstripout stats: {summary["notebooks"]} notebooks: {describe(summary)}\n')
+
+
+@contextmanager
+def collecting(stats: Stats) -> Iterator[Stats]:
+    """Collect statistics in `stats` while in this context."""
+    import tracemalloc
+
+    global _current
+    previous = _current
+    _current = stats
+    started_tracing = stats.memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        stats.seconds = time.perf_counter() - start
+        if stats.memory:
+            stats.peak_memory = max(stats.peak_memory or 0, tracemalloc.get_traced_memory()[1])
+        if started_tracing:
+            tracemalloc.stop()
+        _current = previous
+
+
+def current() -> Optional[Stats]:
+    return _current
+
+
+def phase(name: str):
+    """Context timing a phase, if statistics are being collected."""
+    return _NO_OP if _current is None else _current.phase(name)
+
+
+def notebook(name: str, size: Optional[int] = None):
+    """Context recording the work on a notebook of `size` bytes, if statistics are being collected."""
+    return _NO_OP if _current is None else _current.notebook(name, size)
+
+
+@contextmanager
+def profiling(filename: str) -> Iterator[None]:
+    """Profile the code in this context with cProfile, writing the statistics to `filename`.
+
+    `{pid}` in `filename` is replaced with the process id, such that every invocation of a git filter can be
+    profiled."""
+    import cProfile
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(filename.replace('{pid}', str(os.getpid())))
@@ -0,0 +1,292 @@
+"""Strip nbformat 4 notebooks with bounded memory.
+
+The notebook is tokenized incrementally and written out one cell at a time. Values which are going to be stripped
+anyway (outputs of cells whose output is not kept, `metadata.widgets` and other top-level notebook metadata keys to be
+stripped) are skipped over without ever being materialized, so memory use is bounded by the largest cell kept rather
+than the size of the notebook. The output is identical to that of the json engine.
+"""
+
+import json
+import re
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+from nbstripout._json_engine import TRANSIENT_METADATA_KEYS, NotJSONError, dumps, rejoin_cell, split_cell
+from nbstripout._utils import StripPlan, StripReport, _KeyTrie, determine_keep_output
+
+__all__ = ['strip_jupyter_stream']
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_STRUCTURAL = re.compile(r'["\[\]{}]')
+_STRING_BODY = re.compile(r'[^"\\]*')
+_SCALAR = re.compile(r'[^,:\[\]{}" \t\n\r]*')
+
+# Number of characters read from the input at a time
+CHUNK_SIZE = 1 << 20
+
+
+class _Tokenizer:
+    """Pull tokenizer reading JSON from a text stream in chunks."""
+
+    def __init__(self, stream: TextIO):
+        self._stream = stream
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+        # Chunks of raw text consumed while materializing a value
+        self._capture: Optional[List[str]] = None
+        self._capture_start = 0
+
+    def _error(self, message: str) -> NotJSONError:
+        return NotJSONError(f'Notebook does not appear to be JSON: {message}')
+
+    def _fill(self) -> bool:
+        """Read the next chunk, dropping consumed input. Returns False at the end of the input."""
+        if self._eof:
+            return False
+        chunk = self._stream.read(CHUNK_SIZE)
+        if not chunk:
+            self._eof = True
+            return False
+        if self._capture is not None:
+            self._capture.append(self._buf[self._capture_start : self._pos])
+            self._capture_start = 0
+        self._buf = self._buf[self._pos :] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character without consuming it, or '' at the end of the input."""
+        while True:
+            self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, chars: str) -> str:
+        """Consume the next character, which must be one of `chars`."""
+        char = self.peek()
+        if not char or char not in chars:
+            raise self._error(f'expected one of {chars!r}, got {char!r}')
+        self._pos += 1
+        return char
+
+    def _skip_string(self):
+        """Skip the rest of a string whose opening quote has been consumed."""
+        while True:
+            self._pos = _STRING_BODY.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                if self._buf[self._pos] == '"':
+                    self._pos += 1
+                    return
+                # Skip the backslash together with the escaped character, unless that is in the next chunk
+                if self._pos + 1 < len(self._buf):
+                    self._pos += 2
+                    continue
+            if not self._fill():
+                raise self._error('unterminated string')
+
+    def skip_value(self):
+        """Skip over the next value without materializing it."""
+        char = self.peek()
+        if char == '"':
+            self._pos += 1
+            self._skip_string()
+        elif char in ('[', '{'):
+            self._pos += 1
+            depth = 1
+            while depth:
+                match = _STRUCTURAL.search(self._buf, self._pos)
+                if match is None:
+                    self._pos = len(self._buf)
+                    if not self._fill():
+                        raise self._error('unexpected end of input')
+                    continue
+                self._pos = match.end()
+                char = match.group()
+                if char == '"':
+                    self._skip_string()
+                elif char in ('[', '{'):
+                    depth += 1
+                else:
+                    depth -= 1
+        elif char:
+            while True:
+                self._pos = _SCALAR.match(self._buf, self._pos).end()
+                if self._pos < len(self._buf) or not self._fill():
+                    break
+        else:
+            raise self._error('unexpected end of input')
+
+    def read_value(self) -> Any:
+        """Read and materialize the next value."""
+        self.peek()
+        self._capture = []
+        self._capture_start = self._pos
+        try:
+            self.skip_value()
+            self._capture.append(self._buf[self._capture_start : self._pos])
+            text = ''.join(self._capture)
+        finally:
+            self._capture = None
+        try:
+            return json.loads(text)
+        except ValueError as e:
+            raise self._error(str(e)) from e
+
+    def iter_object(self) -> Iterator[str]:
+        """Consume an object, yielding its keys. Each value must be consumed before advancing."""
+        self.expect('{')
+        if self.peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            if self.peek() != '"':
+                raise self._error('expected an object key')
+            key = self.read_value()
+            self.expect(':')
+            yield key
+            if self.expect(',}') == '}':
+                return
+
+    def iter_array(self) -> Iterator[None]:
+        """Consume an array, yielding once per element. Each element must be consumed before advancing."""
+        self.expect('[')
+        if self.peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield
+            if self.expect(',]') == ']':
+                return
+
+    def expect_end(self):
+        if self.peek():
+            raise self._error('extra data after the notebook')
+
+
+def _prescan(stream: TextIO) -> Tuple[List[str], Any, Any, Dict[str, Any]]:
+    """Scan the top level of a notebook without materializing any cells.
+
+    Returns the top-level keys, the nbformat major and minor version and the notebook metadata relevant to stripping,
+    i.e. `keep_output`.
+    """
+    tokenizer = _Tokenizer(stream)
+    keys = []
+    major = minor = None
+    metadata = {}
+    for key in tokenizer.iter_object():
+        keys.append(key)
+        if key == 'nbformat':
+            major = tokenizer.read_value()
+        elif key == 'nbformat_minor':
+            minor = tokenizer.read_value()
+        elif key == 'metadata' and tokenizer.peek() == '{':
+            for metadata_key in tokenizer.iter_object():
+                if metadata_key == 'keep_output':
+                    metadata[metadata_key] = tokenizer.read_value()
+                else:
+                    tokenizer.skip_value()
+        else:
+            tokenizer.skip_value()
+    tokenizer.expect_end()
+    return keys, major, minor, metadata
+
+
+def _read_metadata(tokenizer: _Tokenizer, metadata_keys: _KeyTrie, report: StripReport) -> Any:
+    """Read the notebook metadata, skipping over top-level keys to be stripped."""
+    if tokenizer.peek() != '{':
+        return tokenizer.read_value()
+    metadata = {}
+    stripped = set()
+    for key in tokenizer.iter_object():
+        if key in TRANSIENT_METADATA_KEYS:
+            tokenizer.skip_value()
+        elif key in metadata_keys.keys:
+            tokenizer.skip_value()
+            stripped.add(key)
+            report.keys_removed += 1
+        else:
+            metadata[key] = tokenizer.read_value()
+    metadata_keys.pop(metadata, report, skip=frozenset(stripped))
+    return metadata
+
+
+def _indent(text: str, prefix: str) -> str:
+    """Indent all but the first line of `text`."""
+    return text.replace('\n', '\n' + prefix)
+
+
+def strip_jupyter_stream(
+    input_stream: TextIO, output_stream: TextIO, plan: StripPlan, report: Optional[StripReport] = None
+) -> bool:
+    """Strip a notebook read from the seekable `input_stream` according to `plan` and write it to `output_stream`.
+
+    Returns False without writing anything if the notebook can't be streamed, i.e. it is not an nbformat 4 notebook or
+    has unusual top-level keys; `input_stream` then needs to be rewound and processed by other means.
+    """
+    if report is None:
+        report = StripReport()
+
+    start = input_stream.tell()
+    keys, major, minor, notebook_metadata = _prescan(input_stream)
+    # The output has sorted keys, so cells are written first and anything sorted before them can't be streamed
+    if major != 4 or 'cells' not in keys or 'metadata' not in keys or any(key < 'cells' for key in keys):
+        return False
+    input_stream.seek(start)
+
+    keep_output = plan.notebook_keep_output(notebook_metadata)
+    # nbformat assigns random ids to cells missing one, which are then made sequential
+    add_missing_ids = not plan.keep_id and isinstance(minor, int) and minor >= 5
+    drop_all_outputs = not plan.keep_output_types and plan.max_size == 0
+
+    tokenizer = _Tokenizer(input_stream)
+    rest = {}
+    num_cells = 0
+    output_stream.write('{\n "cells": [')
+    for key in tokenizer.iter_object():
+        if key == 'metadata':
+            rest[key] = _read_metadata(tokenizer, plan.metadata_keys, report)
+        elif key != 'cells':
+            rest[key] = tokenizer.read_value()
+        elif tokenizer.peek() != '[':
+            raise NotJSONError('Notebook cells are not a list')
+        else:
+            for _ in tokenizer.iter_array():
+                cell = {}
+                num_skipped = 0
+                for cell_key in tokenizer.iter_object():
+                    # Sorted cells have their metadata before their outputs, which allows us to decide whether the
+                    # outputs are going to be dropped before reading them
+                    if (
+                        cell_key == 'outputs'
+                        and drop_all_outputs
+                        and 'metadata' in cell
+                        and tokenizer.peek() == '['
+                        and not determine_keep_output(cell, default=keep_output, strip_init_cells=plan.strip_init_cells)
+                    ):
+                        for _ in tokenizer.iter_array():
+                            tokenizer.skip_value()
+                            num_skipped += 1
+                        cell[cell_key] = []
+                    else:
+                        cell[cell_key] = tokenizer.read_value()
+
+                rejoin_cell(cell)
+                if not plan.keep_cell(cell):
+                    report.cells_dropped += 1
+                    continue
+                report.outputs_removed += num_skipped
+                if add_missing_ids and 'id' not in cell:
+                    cell['id'] = None
+                plan.strip_cell(cell, num_cells, keep_output, report)
+                split_cell(cell)
+                output_stream.write((',\n  ' if num_cells else '\n  ') + _indent(dumps(cell), '  '))
+                num_cells += 1
+    tokenizer.expect_end()
+
+    output_stream.write('\n ]' if num_cells else ']')
+    for key in sorted(rest):
+        output_stream.write(f',\n {dumps(key)}: {_indent(dumps(rest[key]), " ")}')
+    output_stream.write('\n}\n')
+    return True
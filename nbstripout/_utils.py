@@ -1,17 +1,68 @@
 from collections import defaultdict
+from dataclasses import dataclass, field, fields
+from fnmatch import fnmatchcase
+import os
 import sys
-from typing import Any, Callable, Iterator, List, Optional, Set, Dict
+from typing import TYPE_CHECKING, Any, Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple
 
-from nbformat import NotebookNode
+if TYPE_CHECKING:
+    from nbformat import NotebookNode
 
-__all__ = ['pop_recursive', 'strip_output', 'strip_zeppelin_output', 'MetadataError']
+__all__ = ['pop_recursive', 'strip_output', 'strip_zeppelin_output', 'MetadataError', 'StripPlan', 'StripReport']
+
+# Sentinel to tell a popped `None` value apart from a missing key
+_MISSING = object()
+
+# Metadata keys stripped in addition to those configured or given with --extra-keys, unless kept explicitly
+DEFAULT_EXTRA_KEYS = (
+    'metadata.signature',
+    'metadata.widgets',
+    'cell.metadata.collapsed',
+    'cell.metadata.ExecuteTime',
+    'cell.metadata.execution',
+    'cell.metadata.heading_collapsed',
+    'cell.metadata.hidden',
+    'cell.metadata.scrolled',
+)
+
+# Namespaces of extra keys: Jupyter notebook and cell metadata, and Zeppelin note and paragraph keys
+_EXTRA_KEY_NAMESPACES = ('cell', 'metadata', 'note', 'paragraph')
+
+
+# Upper bound of the length of the marker replacing the middle of text truncated to a size, such that text truncated
+# once is never truncated again
+_TRUNCATION_MARKER_SIZE = 64
 
 
 class MetadataError(Exception):
     pass
 
 
-def pop_recursive(d: dict, key: str, default: Optional[NotebookNode] = None) -> NotebookNode:
+@dataclass
+class StripReport:
+    """Record of the changes made by `strip_output` or `strip_zeppelin_output`.
+
+    A report is truthy if and only if the notebook was modified.
+    """
+
+    cells_dropped: int = 0
+    # For Zeppelin notebooks, the number of results removed from paragraphs
+    outputs_removed: int = 0
+    counts_cleared: int = 0
+    ids_renumbered: int = 0
+    keys_removed: int = 0
+    # Representations removed from the MIME bundles of outputs, e.g. an `image/png` next to a `text/plain`
+    mime_types_removed: int = 0
+    # Texts of outputs truncated to their head and tail
+    texts_truncated: int = 0
+    # PNG images re-compressed losslessly to fewer bytes
+    images_recompressed: int = 0
+
+    def __bool__(self) -> bool:
+        return any(getattr(self, field.name) for field in fields(self))
+
+
+def pop_recursive(d: dict, key: str, default: Optional['NotebookNode'] = None) -> 'NotebookNode':
     """dict.pop(key) where `key` is a `.`-delimited list of nested keys.
 
     >>> d = {'a': {'b': 1, 'c': 2}}
@@ -32,47 +83,50 @@ def pop_recursive(d: dict, key: str, default: Optional[NotebookNode] = None) ->
     return default
 
 
-def _cells(nb: NotebookNode, conditionals: Callable[[NotebookNode], bool]) -> Iterator[NotebookNode]:
-    """Remove cells not satisfying any conditional in conditionals and yield all other cells."""
-    if hasattr(nb, 'nbformat') and nb.nbformat < 4:
-        for ws in nb.worksheets:
-            for conditional in conditionals:
-                ws.cells = list(filter(conditional, ws.cells))
-            for cell in ws.cells:
-                yield cell
-    else:
-        for conditional in conditionals:
-            nb.cells = list(filter(conditional, nb.cells))
-        for cell in nb.cells:
-            yield cell
-
-
-def get_size(item: Any) -> int:
-    """Recursively sums length of all strings in `item`"""
-    if isinstance(item, str):
-        return len(item)
-    elif isinstance(item, list):
-        return sum(get_size(elem) for elem in item)
-    elif isinstance(item, dict):
-        return get_size(list(item.values()))
-    else:
-        return len(str(item))
+def get_size(item: Any, limit: Optional[int] = None) -> int:
+    """Recursively sums length of all strings in `item`
+
+    With `limit`, stop measuring as soon as the sum exceeds `limit`, in which case the result is some number larger
+    than `limit`."""
+    if limit is None:
+        limit = float('inf')
+    size = 0
+    stack = [item]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, (list, dict)):
+            # Strings are summed up directly, as most containers are lists of lines or dicts of strings
+            for elem in item.values() if isinstance(item, dict) else item:
+                if isinstance(elem, str):
+                    size += len(elem)
+                    if size > limit:
+                        return size
+                else:
+                    stack.append(elem)
+        elif isinstance(item, str):
+            size += len(item)
+        else:
+            size += len(str(item))
+        if size > limit:
+            break
+    return size
 
 
-def determine_keep_output(cell: NotebookNode, default: bool, strip_init_cells: bool = False):
+def determine_keep_output(cell: 'NotebookNode', default: bool, strip_init_cells: bool = False):
     """Given a cell, determine whether output should be kept
 
     Based on whether the metadata has "init_cell": true,
     "keep_output": true, or the tags contain "keep_output" """
     if 'metadata' not in cell:
         return default
-    if 'init_cell' in cell.metadata:
-        return bool(cell.metadata.init_cell) and not strip_init_cells
+    metadata = cell['metadata']
+    if 'init_cell' in metadata:
+        return bool(metadata['init_cell']) and not strip_init_cells
 
-    has_keep_output_metadata = 'keep_output' in cell.metadata
-    keep_output_metadata = bool(cell.metadata.get('keep_output', False))
+    has_keep_output_metadata = 'keep_output' in metadata
+    keep_output_metadata = bool(metadata.get('keep_output', False))
 
-    has_keep_output_tag = 'keep_output' in cell.metadata.get('tags', [])
+    has_keep_output_tag = 'keep_output' in metadata.get('tags', [])
 
     # keep_output between metadata and tags should not contradict each other
     if has_keep_output_metadata and has_keep_output_tag and not keep_output_metadata:
@@ -83,18 +137,28 @@ def determine_keep_output(cell: NotebookNode, default: bool, strip_init_cells: b
     return default
 
 
+def truncate_text(text: str, max_lines: int = 0, max_size: int = 0) -> str:
+    """Keep the first and last `max_lines` lines and `max_size` characters of `text`, marking what was elided.
+
+    Truncating text which was truncated with the same limits already leaves it unchanged."""
+    if max_lines > 0:
+        lines = text.splitlines(True)
+        # Replacing a single line with the marker wouldn't save anything
+        if len(lines) > 2 * max_lines + 1:
+            elided = len(lines) - 2 * max_lines
+            text = ''.join(lines[:max_lines]) + f'[... {elided} lines elided ...]\n' + ''.join(lines[-max_lines:])
+    if max_size > 0 and len(text) > 2 * max_size + _TRUNCATION_MARKER_SIZE:
+        # The marker doesn't add line breaks, so the lines of the result are within `max_lines` still
+        elided = len(text) - 2 * max_size
+        text = text[:max_size] + f'[... {elided} characters elided ...]' + text[-max_size:]
+    return text
+
+
 def _zeppelin_cells(nb: dict) -> Iterator[dict]:
     for pg in nb['paragraphs']:
         yield pg
 
 
-def strip_zeppelin_output(nb: dict) -> dict:
-    for cell in _zeppelin_cells(nb):
-        if 'results' in cell:
-            cell['results'] = {}
-    return nb
-
-
 def match_output_type(output: Dict, output_type: str) -> bool:
     """
     Take the `output_type` string, and return whether the output matches.
@@ -114,89 +178,481 @@ def match_output_type(output: Dict, output_type: str) -> bool:
     return output.get('output_type') == output_type and (name is None or output.get('name') == name)
 
 
-def strip_output(
-    nb: NotebookNode,
-    keep_output: bool,
-    keep_count: bool,
-    keep_id: bool,
-    extra_keys: List[str] = [],
-    drop_empty_cells: bool = False,
-    drop_tagged_cells: List[str] = [],
-    strip_init_cells: bool = False,
-    drop_output_types: Set[str] = None,
-    keep_output_types: Set[str] = None,
-    max_size: int = 0,
-) -> NotebookNode:
-    """
-    Strip the outputs, execution count/prompt number and miscellaneous
-    metadata from a notebook object, unless specified to keep either the outputs
-    or counts.
+def _parse_output_types(output_types: Iterable[str]) -> Tuple[Tuple[str, Optional[str]], ...]:
+    """Split output types given as `output_type:name` or `output_type` like `match_output_type` does."""
+    matchers = []
+    for output_type in output_types:
+        name = None
+        if ':' in output_type:
+            output_type, name = output_type.split(':')
+        matchers.append((output_type, name))
+    return tuple(matchers)
 
-    `extra_keys` could be 'metadata.foo cell.metadata.bar metadata.baz'
-    """
 
-    # Replace mutable defaults
-    drop_output_types = drop_output_types or set()
-    keep_output_types = keep_output_types or set()
+def _match_output_types(output: Dict, matchers: Tuple[Tuple[str, Optional[str]], ...]) -> bool:
+    """Whether the output matches any of the pre-split output types."""
+    output_type = output.get('output_type')
+    return any(output_type == ot and (name is None or output.get('name') == name) for ot, name in matchers)
 
-    if keep_output is None and 'keep_output' in nb.metadata:
-        keep_output = bool(nb.metadata['keep_output'])
 
-    keys = defaultdict(list)
-    for key in extra_keys:
-        if '.' not in key or key.split('.')[0] not in ['cell', 'metadata']:
-            sys.stderr.write(f'Ignoring invalid extra key `{key}`\n')
-        else:
-            namespace, subkey = key.split('.', maxsplit=1)
-            keys[namespace].append(subkey)
+def _match_result_types(result: Dict, matchers: Tuple[Tuple[str, Optional[str]], ...]) -> bool:
+    """Whether the result of a Zeppelin paragraph, e.g. of type `TEXT` or `IMG`, matches any of the output types.
+
+    Result types are matched regardless of case, and output types with a name never match."""
+    result_type = str(result.get('type', '')).lower()
+    return any(result_type == ot.lower() and name is None for ot, name in matchers)
+
+
+class _KeyTrie:
+    """Trie of `.`-delimited keys, popping all of them in one walk like calling `pop_recursive` for each would."""
+
+    __slots__ = ('keys', 'children')
+
+    def __init__(self, keys: Iterable[str] = ()):
+        self.keys = tuple(dict.fromkeys(keys))
+        tails = defaultdict(list)
+        for key in self.keys:
+            if '.' in key:
+                key_head, key_tail = key.split('.', maxsplit=1)
+                tails[key_head].append(key_tail)
+        self.children = {key_head: _KeyTrie(key_tails) for key_head, key_tails in tails.items()}
 
-    for field in keys['metadata']:
-        pop_recursive(nb.metadata, key=field)
+    def __bool__(self) -> bool:
+        return bool(self.keys)
 
-    conditionals = []
-    # Keep cells if they have any `source` line that contains non-whitespace
-    if drop_empty_cells:
-        conditionals.append(lambda c: any(line.strip() for line in c.get('source', [])))
-    for tag_to_drop in drop_tagged_cells:
-        conditionals.append(lambda c: tag_to_drop not in c.get('metadata', {}).get('tags', []))
+    def pop(self, d: Any, report: StripReport, skip: FrozenSet[str] = frozenset()):
+        """Pop all keys but those in `skip` from `d`, counting them in `report`.
 
-    for i, cell in enumerate(_cells(nb, conditionals)):
-        keep_output_this_cell = determine_keep_output(cell=cell, default=keep_output, strip_init_cells=strip_init_cells)
+        Keys nested in a key which is removed as a whole are not counted separately."""
+        if not isinstance(d, dict):
+            return
+        # Like `pop_recursive`, keys present as is are not looked up in nested dicts
+        done = skip
+        for key in self.keys:
+            if key not in skip and key in d:
+                del d[key]
+                report.keys_removed += 1
+                done = done | {key}
+        for key_head, child in self.children.items():
+            if key_head in d:
+                prefix = key_head + '.'
+                child.pop(d[key_head], report, frozenset(key[len(prefix) :] for key in done if key.startswith(prefix)))
+
+
+def _recompress_pngs(bundles: List[Dict], report: StripReport):
+    """Re-compress the `image/png` of each MIME bundle in `bundles`, in parallel if there are several."""
+    from nbstripout._png import recompress_base64_png
+
+    values = [bundle['image/png'] for bundle in bundles]
+    if len(values) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+
+        # zlib releases the GIL while (de)compressing, so threads use all CPUs
+        with ThreadPoolExecutor(max_workers=min(len(values), os.cpu_count() or 1)) as executor:
+            results = list(executor.map(recompress_base64_png, values))
+    else:
+        results = [recompress_base64_png(value) for value in values]
+    for bundle, result in zip(bundles, results):
+        if result is not None:
+            bundle['image/png'] = result
+            report.images_recompressed += 1
+
+
+@dataclass(frozen=True)
+class StripPlan:
+    """The options of `strip_output`, compiled once to strip any number of notebooks.
+
+    Use `StripPlan.from_options`, which takes the same options as `strip_output`, to build a plan and `apply` to strip a
+    notebook.
+    """
+
+    keep_output: Optional[bool]
+    keep_count: bool
+    keep_id: bool
+    metadata_keys: _KeyTrie
+    cell_keys: _KeyTrie
+    drop_empty_cells: bool
+    drop_tagged_cells: FrozenSet[str]
+    strip_init_cells: bool
+    drop_output_types: Tuple[Tuple[str, Optional[str]], ...]
+    keep_output_types: Tuple[Tuple[str, Optional[str]], ...]
+    max_size: int
+    keep_mime_types: Tuple[str, ...] = ()
+    drop_mime_types: Tuple[str, ...] = ()
+    max_mime_sizes: Tuple[Tuple[str, int], ...] = ()
+    keep_smallest_mime_type: bool = False
+    truncate_lines: int = 0
+    truncate_size: int = 0
+    recompress_images: bool = False
+    note_keys: _KeyTrie = field(default_factory=_KeyTrie)
+    paragraph_keys: _KeyTrie = field(default_factory=_KeyTrie)
+
+    @classmethod
+    def from_options(
+        cls,
+        keep_output: Optional[bool],
+        keep_count: bool,
+        keep_id: bool,
+        extra_keys: Iterable[str] = (),
+        drop_empty_cells: bool = False,
+        drop_tagged_cells: Iterable[str] = (),
+        strip_init_cells: bool = False,
+        drop_output_types: Optional[Set[str]] = None,
+        keep_output_types: Optional[Set[str]] = None,
+        max_size: int = 0,
+        keep_mime_types: Iterable[str] = (),
+        drop_mime_types: Iterable[str] = (),
+        max_mime_sizes: Optional[Dict[str, int]] = None,
+        keep_smallest_mime_type: bool = False,
+        truncate_lines: int = 0,
+        truncate_size: int = 0,
+        recompress_images: bool = False,
+    ) -> 'StripPlan':
+        keys = defaultdict(list)
+        for key in extra_keys:
+            if '.' not in key or key.split('.')[0] not in _EXTRA_KEY_NAMESPACES:
+                sys.stderr.write(f'Ignoring invalid extra key `{key}`\n')
+            else:
+                namespace, subkey = key.split('.', maxsplit=1)
+                keys[namespace].append(subkey)
+        return cls(
+            keep_output=keep_output,
+            keep_count=keep_count,
+            keep_id=keep_id,
+            metadata_keys=_KeyTrie(keys['metadata']),
+            cell_keys=_KeyTrie(keys['cell']),
+            drop_empty_cells=drop_empty_cells,
+            drop_tagged_cells=frozenset(drop_tagged_cells),
+            strip_init_cells=strip_init_cells,
+            drop_output_types=_parse_output_types(sorted(drop_output_types or ())),
+            keep_output_types=_parse_output_types(sorted(keep_output_types or ())),
+            max_size=max_size,
+            keep_mime_types=tuple(sorted(set(keep_mime_types))),
+            drop_mime_types=tuple(sorted(set(drop_mime_types))),
+            max_mime_sizes=tuple(sorted((max_mime_sizes or {}).items())),
+            keep_smallest_mime_type=keep_smallest_mime_type,
+            truncate_lines=truncate_lines,
+            truncate_size=truncate_size,
+            recompress_images=recompress_images,
+            note_keys=_KeyTrie(keys['note']),
+            paragraph_keys=_KeyTrie(keys['paragraph']),
+        )
+
+    @property
+    def prunes_mime_types(self) -> bool:
+        """Whether representations are removed from the MIME bundles of the outputs which are kept."""
+        return bool(self.keep_mime_types or self.drop_mime_types or self.max_mime_sizes or self.keep_smallest_mime_type)
+
+    def keep_mime_type(self, mime_type: str, value: Any) -> bool:
+        """Whether to keep the representation `value` of type `mime_type` in an output's MIME bundle."""
+        if self.keep_mime_types and not any(fnmatchcase(mime_type, pattern) for pattern in self.keep_mime_types):
+            return False
+        if any(fnmatchcase(mime_type, pattern) for pattern in self.drop_mime_types):
+            return False
+        for pattern, max_size in self.max_mime_sizes:
+            if fnmatchcase(mime_type, pattern) and get_size(value, limit=max_size) > max_size:
+                return False
+        return True
+
+    def prune_mime_types(self, output: Dict, report: StripReport) -> bool:
+        """Remove representations from the MIME bundle of `output`, returning whether the output is worth keeping.
+
+        Outputs without a MIME bundle, such as streams and errors, are left alone. An output is not worth keeping once
+        all representations are removed from its bundle."""
+        data = output.get('data')
+        if not isinstance(data, dict) or not data:
+            return True
+        kept = [mime_type for mime_type, value in data.items() if self.keep_mime_type(mime_type, value)]
+        if self.keep_smallest_mime_type and len(kept) > 1:
+            kept = [min(kept, key=lambda mime_type: get_size(data[mime_type]))]
+        if len(kept) == len(data):
+            return True
+        metadata = output.get('metadata')
+        for mime_type in [mime_type for mime_type in data if mime_type not in kept]:
+            del data[mime_type]
+            # Output metadata such as the size of an image is keyed by MIME type
+            if isinstance(metadata, dict):
+                metadata.pop(mime_type, None)
+            report.mime_types_removed += 1
+        return bool(kept)
+
+    @property
+    def truncates(self) -> bool:
+        """Whether the texts of the outputs which are kept are truncated."""
+        return self.truncate_lines > 0 or self.truncate_size > 0
+
+    def _truncate(self, value: Any, separator: str) -> Any:
+        """Truncate text, which is either a string or a list of lines to be joined with `separator`."""
+        if isinstance(value, str):
+            return truncate_text(value, self.truncate_lines, self.truncate_size)
+        if not isinstance(value, list) or not all(isinstance(line, str) for line in value):
+            return value
+        text = separator.join(value)
+        truncated = truncate_text(text, self.truncate_lines, self.truncate_size)
+        if truncated == text:
+            return value
+        return truncated.split('\n') if separator else truncated.splitlines(True)
+
+    def truncate_output(self, output: Dict, report: StripReport):
+        """Truncate the stream text, traceback and `text/plain` data of `output` to their head and tail."""
+        texts = [(output, 'text', '')] if output.get('output_type') == 'stream' else []
+        if output.get('output_type') == 'error':
+            # Traceback entries are displayed joined with newlines
+            texts.append((output, 'traceback', '\n'))
+        if isinstance(output.get('data'), dict):
+            texts.append((output['data'], 'text/plain', ''))
+        for container, key, separator in texts:
+            if key not in container:
+                continue
+            value = self._truncate(container[key], separator)
+            if value is not container[key]:
+                container[key] = value
+                report.texts_truncated += 1
+
+    def notebook_keep_output(self, metadata: Dict) -> Optional[bool]:
+        """Whether to keep outputs by default, which notebook metadata can override."""
+        if self.keep_output is None and 'keep_output' in metadata:
+            return bool(metadata['keep_output'])
+        return self.keep_output
+
+    def keep_cell(self, cell: 'NotebookNode') -> bool:
+        """Whether a cell is kept rather than dropped entirely."""
+        # Keep cells if they have any `source` line that contains non-whitespace
+        if self.drop_empty_cells and not any(line.strip() for line in cell.get('source', [])):
+            return False
+        if self.drop_tagged_cells and not self.drop_tagged_cells.isdisjoint(cell.get('metadata', {}).get('tags', [])):
+            return False
+        return True
+
+    def strip_cell(
+        self,
+        cell: 'NotebookNode',
+        index: int,
+        keep_output: Optional[bool],
+        report: StripReport,
+        images: Optional[List[Dict]] = None,
+    ):
+        """Strip a single cell, which is the `index`th cell kept in the notebook.
+
+        With `recompress_images`, the MIME bundles holding PNG images are appended to `images` to be re-compressed
+        together with those of other cells, or re-compressed right away if `images` isn't given."""
+        keep_output_this_cell = determine_keep_output(
+            cell=cell, default=keep_output, strip_init_cells=self.strip_init_cells
+        )
 
         # Remove the outputs, unless directed otherwise
         if 'outputs' in cell:
+            outputs = cell['outputs']
+            num_outputs = len(outputs)
+
+            # Prune and truncate outputs which may be kept, before their size is compared to max_size
+            if keep_output_this_cell or self.keep_output_types or self.max_size > 0:
+                if self.prunes_mime_types:
+                    outputs = [output for output in outputs if self.prune_mime_types(output, report)]
+                if self.truncates:
+                    for output in outputs:
+                        self.truncate_output(output, report)
+
             # Default behavior (max_size == 0) strips all outputs.
-            if not keep_output_this_cell or keep_output_types:
-                cell['outputs'] = [
+            if not keep_output_this_cell or self.keep_output_types:
+                outputs = [
                     output
-                    for output in cell['outputs']
-                    if get_size(output) <= max_size or any(match_output_type(output, ot) for ot in keep_output_types)
+                    for output in outputs
+                    if _match_output_types(output, self.keep_output_types)
+                    or (self.max_size > 0 and get_size(output, limit=self.max_size) <= self.max_size)
                 ]
 
             # Strip the counts from the outputs that were kept if not keep_count.
-            if not keep_count:
-                for output in cell['outputs']:
-                    if 'execution_count' in output:
+            if not self.keep_count:
+                for output in outputs:
+                    if output.get('execution_count') is not None:
                         output['execution_count'] = None
+                        report.counts_cleared += 1
 
             # Remove specific output types
-            if drop_output_types:
-                cell['outputs'] = [
-                    output
-                    for output in cell['outputs']
-                    if not any(match_output_type(output, ot) for ot in drop_output_types)
+            if self.drop_output_types:
+                outputs = [output for output in outputs if not _match_output_types(output, self.drop_output_types)]
+
+            if len(outputs) != num_outputs:
+                cell['outputs'] = outputs
+                report.outputs_removed += num_outputs - len(outputs)
+
+            if self.recompress_images:
+                bundles = [
+                    output['data']
+                    for output in outputs
+                    if isinstance(output.get('data'), dict) and isinstance(output['data'].get('image/png'), str)
                 ]
-
+                if images is None:
+                    _recompress_pngs(bundles, report)
+                else:
+                    images.extend(bundles)
             # If keep_output_this_cell and keep_count, do nothing.
 
         # Remove the prompt_number/execution_count, unless directed otherwise
-        if 'prompt_number' in cell and not keep_count:
-            cell['prompt_number'] = None
-        if 'execution_count' in cell and not keep_count:
-            cell['execution_count'] = None
+        if not self.keep_count:
+            for count in ('prompt_number', 'execution_count'):
+                if cell.get(count) is not None:
+                    cell[count] = None
+                    report.counts_cleared += 1
         # Replace the cell id with an incremental value that will be consistent across runs
-        if 'id' in cell and not keep_id:
-            cell['id'] = str(i)
-        for field in keys['cell']:
-            pop_recursive(cell, key=field)
-    return nb
+        if 'id' in cell and not self.keep_id and cell['id'] != str(index):
+            cell['id'] = str(index)
+            report.ids_renumbered += 1
+        if self.cell_keys:
+            self.cell_keys.pop(cell, report)
+
+    def apply(self, nb: 'NotebookNode', report: Optional[StripReport] = None) -> 'NotebookNode':
+        """Strip a notebook in-place, walking each cell once and recording any change in `report`."""
+        if report is None:
+            report = StripReport()
+
+        keep_output = self.notebook_keep_output(nb['metadata'])
+        self.metadata_keys.pop(nb['metadata'], report)
+
+        if 'nbformat' in nb and nb['nbformat'] < 4:
+            containers = nb['worksheets']
+        else:
+            containers = [nb]
+        images = [] if self.recompress_images else None
+        index = 0
+        for container in containers:
+            cells = []
+            for cell in container['cells']:
+                if not self.keep_cell(cell):
+                    report.cells_dropped += 1
+                    continue
+                self.strip_cell(cell, index, keep_output, report, images)
+                cells.append(cell)
+                index += 1
+            if len(cells) != len(container['cells']):
+                container['cells'] = cells
+        if images:
+            _recompress_pngs(images, report)
+        return nb
+
+    def strip_paragraph(self, paragraph: Dict, report: StripReport):
+        """Strip the results and keys of a single Zeppelin paragraph."""
+        results = paragraph.get('results')
+        if results:
+            messages = results.get('msg') if isinstance(results, dict) else None
+            if not isinstance(messages, list):
+                messages = []
+            kept = messages
+            if not self.keep_output or self.keep_output_types:
+                kept = [
+                    message
+                    for message in kept
+                    if _match_result_types(message, self.keep_output_types)
+                    or (self.max_size > 0 and get_size(message, limit=self.max_size) <= self.max_size)
+                ]
+            if self.drop_output_types:
+                kept = [message for message in kept if not _match_result_types(message, self.drop_output_types)]
+            if not kept and (messages or not self.keep_output):
+                paragraph['results'] = {}
+                report.outputs_removed += len(messages) or 1
+            elif len(kept) != len(messages):
+                results['msg'] = kept
+                report.outputs_removed += len(messages) - len(kept)
+        if self.paragraph_keys:
+            self.paragraph_keys.pop(paragraph, report)
+
+    def apply_zeppelin(self, nb: Dict, report: Optional[StripReport] = None) -> Dict:
+        """Strip a Zeppelin notebook in-place, recording any change in `report`.
+
+        Results are kept or stripped like the outputs of Jupyter notebooks, with output types matching the type of a
+        result, e.g. `TEXT`, `HTML` or `IMG`. Extra keys starting with `note.` and `paragraph.` are stripped from the
+        notebook and its paragraphs."""
+        if report is None:
+            report = StripReport()
+        for paragraph in _zeppelin_cells(nb):
+            self.strip_paragraph(paragraph, report)
+        if self.note_keys:
+            self.note_keys.pop(nb, report)
+        return nb
+
+
+def strip_output(
+    nb: 'NotebookNode',
+    keep_output: bool,
+    keep_count: bool,
+    keep_id: bool,
+    extra_keys: List[str] = [],
+    drop_empty_cells: bool = False,
+    drop_tagged_cells: List[str] = [],
+    strip_init_cells: bool = False,
+    drop_output_types: Set[str] = None,
+    keep_output_types: Set[str] = None,
+    max_size: int = 0,
+    report: Optional[StripReport] = None,
+    keep_mime_types: Iterable[str] = (),
+    drop_mime_types: Iterable[str] = (),
+    max_mime_sizes: Optional[Dict[str, int]] = None,
+    keep_smallest_mime_type: bool = False,
+    truncate_lines: int = 0,
+    truncate_size: int = 0,
+    recompress_images: bool = False,
+) -> 'NotebookNode':
+    """
+    Strip the outputs, execution count/prompt number and miscellaneous
+    metadata from a notebook object, unless specified to keep either the outputs
+    or counts.
+
+    `extra_keys` could be 'metadata.foo cell.metadata.bar metadata.baz'
+
+    The MIME bundles of the outputs which are kept can be pruned with `keep_mime_types`, `drop_mime_types` and
+    `max_mime_sizes`, which map MIME types to the largest representation kept, and with `keep_smallest_mime_type`. MIME
+    types are matched as glob patterns, e.g. 'image/*'. The stream text, tracebacks and `text/plain` data of the outputs
+    which are kept can be truncated to their first and last `truncate_lines` lines and `truncate_size` characters.
+    With `recompress_images`, PNG images in the outputs which are kept are re-compressed losslessly.
+
+    Works on `NotebookNode`s as well as plain `dict`s as returned by `json.load`.
+    Pass a `StripReport` as `report` to find out what, if anything, was changed.
+    To strip many notebooks with the same options, build a `StripPlan` once instead.
+    """
+    plan = StripPlan.from_options(
+        keep_output=keep_output,
+        keep_count=keep_count,
+        keep_id=keep_id,
+        extra_keys=extra_keys,
+        drop_empty_cells=drop_empty_cells,
+        drop_tagged_cells=drop_tagged_cells,
+        strip_init_cells=strip_init_cells,
+        drop_output_types=drop_output_types,
+        keep_output_types=keep_output_types,
+        max_size=max_size,
+        keep_mime_types=keep_mime_types,
+        drop_mime_types=drop_mime_types,
+        max_mime_sizes=max_mime_sizes,
+        keep_smallest_mime_type=keep_smallest_mime_type,
+        truncate_lines=truncate_lines,
+        truncate_size=truncate_size,
+        recompress_images=recompress_images,
+    )
+    return plan.apply(nb, report=report)
+
+
+def strip_zeppelin_output(
+    nb: dict,
+    report: Optional[StripReport] = None,
+    keep_output: bool = False,
+    extra_keys: Iterable[str] = (),
+    drop_output_types: Optional[Set[str]] = None,
+    keep_output_types: Optional[Set[str]] = None,
+    max_size: int = 0,
+) -> dict:
+    """Strip the results from a Zeppelin notebook, recording any change in `report`.
+
+    Results are kept with `keep_output`, or if their type is in `keep_output_types` or they are no larger than
+    `max_size`, unless their type is in `drop_output_types`. `extra_keys` could be 'note.info paragraph.dateStarted'.
+    """
+    plan = StripPlan.from_options(
+        keep_output=keep_output,
+        keep_count=False,
+        keep_id=False,
+        extra_keys=extra_keys,
+        drop_output_types=drop_output_types,
+        keep_output_types=keep_output_types,
+        max_size=max_size,
+    )
+    return plan.apply_zeppelin(nb, report=report)
@@ -0,0 +1,96 @@
+"""Machine-readable reports of `--verify` runs, for CI.
+
+Each notebook checked is recorded as a `FileResult`, which lists what stripping would change and how many bytes it
+would save. The results of a run are written as JSON with `to_json` or as JUnit XML with `to_junit`, which CI systems
+display as a test per notebook.
+"""
+
+import json
+from typing import Any, Dict, List, NamedTuple, Optional
+
+__all__ = ['CLEAN', 'DIRTY', 'ERROR', 'SKIPPED', 'FileResult', 'to_dict', 'to_json', 'to_junit']
+
+CLEAN = 'clean'
+DIRTY = 'dirty'
+ERROR = 'error'
+# Not checked, since --fail-fast stopped at an earlier notebook
+SKIPPED = 'skipped'
+
+
+class FileResult(NamedTuple):
+    file: str
+    status: str
+    size: Optional[int] = None
+    stripped_size: Optional[int] = None
+    # Number of cells dropped, outputs removed etc., as counted by `StripReport`
+    changes: Dict[str, int] = {}
+    error: Optional[str] = None
+
+    @property
+    def bytes_saved(self) -> Optional[int]:
+        if self.size is None or self.stripped_size is None:
+            return None
+        return self.size - self.stripped_size
+
+    def describe(self) -> str:
+        """Human readable summary of what stripping would change."""
+        if self.status == ERROR:
+            return self.error or 'Could not strip'
+        changes = ', '.join(f'{name.replace("_", " ")}: {count}' for name, count in self.changes.items())
+        return f'Would save {self.bytes_saved} bytes ({changes or "formatting only"})'
+
+
+def _counts(results: List[FileResult]) -> Dict[str, int]:
+    counts = {'files': len(results), CLEAN: 0, DIRTY: 0, ERROR: 0, SKIPPED: 0}
+    for result in results:
+        counts[result.status] += 1
+    return counts
+
+
+def to_dict(results: List[FileResult]) -> Dict[str, Any]:
+    files = []
+    for result in results:
+        entry = {'file': result.file, 'status': result.status}
+        if result.status == DIRTY:
+            entry.update(
+                size=result.size,
+                stripped_size=result.stripped_size,
+                bytes_saved=result.bytes_saved,
+                changes=result.changes,
+            )
+        elif result.status == ERROR:
+            entry['error'] = result.error
+        files.append(entry)
+    return {**_counts(results), 'bytes_saved': sum(r.bytes_saved or 0 for r in results), 'results': files}
+
+
+def to_json(results: List[FileResult]) -> str:
+    return json.dumps(to_dict(results), indent=2)
+
+
+def to_junit(results: List[FileResult]) -> str:
+    """JUnit XML report with a test case per notebook, which fails if the notebook isn't stripped."""
+    from xml.etree import ElementTree
+
+    counts = _counts(results)
+    suites = ElementTree.Element('testsuites')
+    suite = ElementTree.SubElement(
+        suites,
+        'testsuite',
+        name='nbstripout',
+        tests=str(counts['files']),
+        failures=str(counts[DIRTY]),
+        errors=str(counts[ERROR]),
+        skipped=str(counts[SKIPPED]),
+    )
+    for result in results:
+        case = ElementTree.SubElement(suite, 'testcase', classname='nbstripout', name=result.file, file=result.file)
+        if result.status == DIRTY:
+            failure = ElementTree.SubElement(case, 'failure', message=f'{result.file} is not stripped')
+            failure.text = result.describe()
+        elif result.status == ERROR:
+            ElementTree.SubElement(case, 'error', message=result.describe())
+        elif result.status == SKIPPED:
+            ElementTree.SubElement(case, 'skipped', message='Not checked after an earlier failure (--fail-fast)')
+    ElementTree.indent(suites)
+    return ElementTree.tostring(suites, encoding='unicode', xml_declaration=True)
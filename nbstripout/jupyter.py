@@ -0,0 +1,96 @@
+"""Strip notebooks when Jupyter saves them, inside Jupyter Server.
+
+Stripping happens in-process on the notebook Jupyter Server already parsed, so notebooks are neither read nor parsed
+again, and no subprocess is spawned. The copy on disk is stripped, while the notebook open in the browser keeps its
+outputs until it is reloaded.
+
+Enable the server extension to strip notebooks with the default options when saving them:
+
+    jupyter server extension enable nbstripout.jupyter
+
+or configure the hook in `jupyter_server_config.py`, optionally with the options of `strip_output`:
+
+    from nbstripout.jupyter import make_pre_save_hook
+    c.FileContentsManager.pre_save_hook = make_pre_save_hook(keep_count=True, extra_keys=['metadata.foo'])
+"""
+
+from typing import Any, Callable, Dict, Iterable, Optional, Set
+
+from nbstripout._utils import DEFAULT_EXTRA_KEYS, StripPlan
+
+__all__ = ['make_pre_save_hook', 'pre_save_hook']
+
+
+def make_pre_save_hook(
+    keep_output: Optional[bool] = None,
+    keep_count: bool = False,
+    keep_id: bool = False,
+    extra_keys: Iterable[str] = (),
+    keep_metadata_keys: Iterable[str] = (),
+    drop_empty_cells: bool = False,
+    drop_tagged_cells: Iterable[str] = (),
+    strip_init_cells: bool = False,
+    drop_output_types: Optional[Set[str]] = None,
+    keep_output_types: Optional[Set[str]] = None,
+    max_size: int = 0,
+    keep_mime_types: Iterable[str] = (),
+    drop_mime_types: Iterable[str] = (),
+    max_mime_sizes: Optional[Dict[str, int]] = None,
+    keep_smallest_mime_type: bool = False,
+    truncate_lines: int = 0,
+    truncate_size: int = 0,
+    recompress_images: bool = False,
+) -> Callable[..., None]:
+    """Make a `pre_save_hook` for Jupyter's contents manager stripping notebooks with the options of `strip_output`.
+
+    Like the command line interface, the default metadata keys are stripped in addition to `extra_keys`, unless they
+    are kept with `keep_metadata_keys`. The options are compiled once, and the hook holds no other state, so it can
+    strip any number of notebooks saved concurrently.
+    """
+    keep_metadata_keys = set(keep_metadata_keys)
+    plan = StripPlan.from_options(
+        keep_output=keep_output,
+        keep_count=keep_count,
+        keep_id=keep_id,
+        extra_keys=[key for key in (*DEFAULT_EXTRA_KEYS, *extra_keys) if key not in keep_metadata_keys],
+        drop_empty_cells=drop_empty_cells,
+        drop_tagged_cells=drop_tagged_cells,
+        strip_init_cells=strip_init_cells,
+        drop_output_types=drop_output_types,
+        keep_output_types=keep_output_types,
+        max_size=max_size,
+        keep_mime_types=keep_mime_types,
+        drop_mime_types=drop_mime_types,
+        max_mime_sizes=max_mime_sizes,
+        keep_smallest_mime_type=keep_smallest_mime_type,
+        truncate_lines=truncate_lines,
+        truncate_size=truncate_size,
+        recompress_images=recompress_images,
+    )
+
+    def pre_save_hook(model: Dict[str, Any], path: str = '', contents_manager: Any = None, **kwargs):
+        """Strip the notebook in `model` in-place, before Jupyter writes it to `path`."""
+        if model.get('type') != 'notebook' or not model.get('content'):
+            return
+        plan.apply(model['content'])
+
+    return pre_save_hook
+
+
+pre_save_hook = make_pre_save_hook()
+
+
+def _jupyter_server_extension_points():
+    return [{'module': 'nbstripout.jupyter'}]
+
+
+def _load_jupyter_server_extension(server_app):
+    contents_manager = server_app.contents_manager
+    if hasattr(contents_manager, 'register_pre_save_hook'):
+        contents_manager.register_pre_save_hook(pre_save_hook)
+    elif contents_manager.pre_save_hook is None:
+        contents_manager.pre_save_hook = pre_save_hook
+    else:
+        server_app.log.warning('nbstripout: not stripping notebooks on save, a pre_save_hook is configured already')
+        return
+    server_app.log.info('nbstripout: stripping notebooks on save')
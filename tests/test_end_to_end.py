@@ -1,14 +1,25 @@
+import io
+import json
 import os
 import sys
 from pathlib import Path
 import re
-from subprocess import run, PIPE
+from subprocess import Popen, run, PIPE
+import time
 
 # Note: typing.Pattern is deprecated, for removal in 3.13 in favour of re.Pattern introduced in 3.8
 from typing import List, Union, Pattern
 
 import pytest
 
+from nbstripout import StripPlan, _daemon, _streaming
+from nbstripout._nbstripout import (
+    DEFAULT_EXTRA_KEYS,
+    _build_parser,
+    process_notebook_auto,
+)
+from nbstripout._utils import get_size
+
 NOTEBOOKS_FOLDER = Path('tests/e2e_notebooks')
 
 TEST_CASES = [
@@ -30,6 +41,26 @@ TEST_CASES = [
     ('test_metadata.ipynb', 'test_metadata_keep_output.ipynb.expected', ['--keep-output']),
     ('test_metadata.ipynb', 'test_metadata_keep_output_keep_count.ipynb.expected', ['--keep-output', '--keep-count']),
     ('test_metadata_notebook.ipynb', 'test_metadata_notebook.ipynb.expected', []),
+    (
+        'test_mime_types.ipynb',
+        'test_mime_types_drop_images.ipynb.expected',
+        ['--keep-output', '--drop-mime-type', 'image/*'],
+    ),
+    (
+        'test_mime_types.ipynb',
+        'test_mime_types_keep_text.ipynb.expected',
+        ['--keep-output', '--keep-mime-type', 'text/plain'],
+    ),
+    (
+        'test_mime_types.ipynb',
+        'test_mime_types_max_size.ipynb.expected',
+        ['--max-size', '200', '--max-mime-size', 'image/*=100'],
+    ),
+    (
+        'test_mime_types.ipynb',
+        'test_mime_types_smallest.ipynb.expected',
+        ['--keep-output', '--keep-smallest-mime-type'],
+    ),
     (
         'test_keep_metadata_keys.ipynb',
         'test_keep_metadata_keys.ipynb.expected',
@@ -44,6 +75,9 @@ TEST_CASES = [
         ],
     ),
     ('test_strip_init_cells.ipynb', 'test_strip_init_cells.ipynb.expected', ['--strip-init-cells']),
+    ('test_truncate.ipynb', 'test_truncate_lines.ipynb.expected', ['--keep-output', '--truncate-lines', '3']),
+    ('test_truncate.ipynb', 'test_truncate_size.ipynb.expected', ['--keep-output', '--truncate-size', '40']),
+    ('test_truncate.ipynb', 'test_truncate_max_size.ipynb.expected', ['--max-size', '1K', '--truncate-lines', '2']),
     ('test_nbformat2.ipynb', 'test_nbformat2.ipynb.expected', []),
     ('test_nbformat45.ipynb', 'test_nbformat45.ipynb.expected', ['--keep-id']),
     ('test_nbformat45.ipynb', 'test_nbformat45.ipynb.expected_sequential_id', []),
@@ -51,6 +85,28 @@ TEST_CASES = [
     ('test_unicode.ipynb', 'test_unicode.ipynb.expected', []),
     ('test_widgets.ipynb', 'test_widgets.ipynb.expected', []),
     ('test_zeppelin.zpln', 'test_zeppelin.zpln.expected', ['--mode', 'zeppelin']),
+    ('test_zeppelin_results.zpln', 'test_zeppelin_results.zpln.expected', ['--mode', 'zeppelin']),
+    (
+        'test_zeppelin_results.zpln',
+        'test_zeppelin_results_keep_output.zpln.expected',
+        [
+            '--mode',
+            'zeppelin',
+            '--keep-output',
+            '--extra-keys',
+            'note.info paragraph.dateFinished paragraph.progress paragraph.runtimeInfos',
+        ],
+    ),
+    (
+        'test_zeppelin_results.zpln',
+        'test_zeppelin_results_keep_text.zpln.expected',
+        ['--mode', 'zeppelin', '--keep-output-type', 'TEXT'],
+    ),
+    (
+        'test_zeppelin_results.zpln',
+        'test_zeppelin_results_max_size.zpln.expected',
+        ['--mode', 'zeppelin', '--max-size', '100', '--drop-output-type', 'html'],
+    ),
 ]
 
 DRY_RUN_CASES = [
@@ -75,6 +131,7 @@ ERR_OUTPUT_CASES = [
         [],
     ),
     ('test_invalid_json.ipynb', ['No valid notebook detected on stdin'], []),
+    ('test_mime_types.ipynb', [re.compile(".*invalid MIME size 'image/png'")], ['--max-mime-size', 'image/png']),
 ]
 
 
@@ -140,6 +197,80 @@ def test_end_to_end_file(input_file: str, expected_file: str, args: List[str], t
         assert not pc.stdout and p.read_text() == expected
 
 
+@pytest.mark.parametrize('input_file, expected_file, args', TEST_CASES)
+@pytest.mark.parametrize('engine', ('json', 'nbformat'))
+def test_end_to_end_engine(input_file: str, expected_file: str, args: List[str], engine: str):
+    with open(NOTEBOOKS_FOLDER / expected_file, mode='r') as f:
+        expected = f.read()
+
+    with open(NOTEBOOKS_FOLDER / input_file, mode='r') as f:
+        pc = run([nbstripout_exe(), '--engine', engine] + args, stdin=f, stdout=PIPE, universal_newlines=True)
+
+    assert pc.stdout == expected
+    assert pc.returncode == 0
+
+
+@pytest.mark.parametrize(
+    'input_file, expected_file, args', [case for case in TEST_CASES if case[0] == 'test_truncate.ipynb']
+)
+def test_truncate_idempotent(input_file: str, expected_file: str, args: List[str]):
+    # Truncated text is not truncated again, such that the filter is idempotent
+    with open(NOTEBOOKS_FOLDER / expected_file, mode='r') as f:
+        expected = f.read()
+        f.seek(0)
+        pc = run([nbstripout_exe()] + args, stdin=f, stdout=PIPE, universal_newlines=True)
+    assert pc.stdout == expected
+
+
+def test_engine_missing_ids():
+    # nbformat assigns random ids to cells without one, which are then made sequential
+    with open(NOTEBOOKS_FOLDER / 'test_nbformat45.ipynb', mode='r') as f:
+        content = re.sub(r'\s*"id": "[^"]*",', '', f.read())
+
+    for engine in ('auto', 'nbformat'):
+        pc = run([nbstripout_exe(), '--engine', engine], input=content, stdout=PIPE, universal_newlines=True)
+        with open(NOTEBOOKS_FOLDER / 'test_nbformat45.ipynb.expected_sequential_id', mode='r') as f:
+            assert pc.stdout == f.read()
+
+
+@pytest.mark.parametrize('input_file, expected_file, args', TEST_CASES)
+def test_end_to_end_stream(input_file: str, expected_file: str, args: List[str], tmp_path: Path):
+    with open(NOTEBOOKS_FOLDER / expected_file, mode='r') as f:
+        expected = f.read()
+
+    with open(NOTEBOOKS_FOLDER / input_file, mode='r') as f:
+        pc = run([nbstripout_exe(), '--stream'] + args, stdin=f, stdout=PIPE, universal_newlines=True)
+    assert pc.stdout == expected
+    assert pc.returncode == 0
+
+    p = tmp_path / input_file
+    p.write_text((NOTEBOOKS_FOLDER / input_file).read_text())
+    pc = run([nbstripout_exe(), '--stream', p] + args, stdout=PIPE, universal_newlines=True)
+    assert pc.returncode == 0
+    assert not pc.stdout and p.read_text() == expected
+
+
+def test_stream_small_chunks(monkeypatch):
+    # Make sure values split across chunk boundaries are read correctly
+    monkeypatch.setattr(_streaming, 'CHUNK_SIZE', 7)
+    plan = StripPlan.from_options(
+        keep_output=None,
+        keep_count=False,
+        keep_id=False,
+        extra_keys=['metadata.widgets', 'cell.metadata.collapsed', 'cell.metadata.scrolled'],
+    )
+    for input_file, expected_file in (
+        ('test_unicode.ipynb', 'test_unicode.ipynb.expected'),
+        ('test_metadata.ipynb', 'test_metadata.ipynb.expected'),
+        ('test_widgets.ipynb', 'test_widgets.ipynb.expected'),
+    ):
+        output = io.StringIO()
+        with open(NOTEBOOKS_FOLDER / input_file, mode='r') as f:
+            assert _streaming.strip_jupyter_stream(f, output, plan)
+        with open(NOTEBOOKS_FOLDER / expected_file, mode='r') as f:
+            assert output.getvalue() == f.read()
+
+
 @pytest.mark.parametrize('input_file, extra_args, any_change', DRY_RUN_CASES)
 @pytest.mark.parametrize('verify', (True, False))
 def test_dry_run_stdin(input_file: str, extra_args: List[str], any_change: bool, verify: bool):
@@ -231,3 +362,359 @@ def test_newline_behavior(tmp_path: Path):
 
     pc = run([nbstripout_exe(), '--unix-newlines', '--textconv', to_lf_eol], stdout=PIPE)
     assert b'\r\n' not in pc.stdout
+
+
+def test_mode_auto(tmp_path: Path):
+    ipynb = tmp_path / 'notebook.ipynb'
+    zpln = tmp_path / 'notebook.zpln'
+    other = tmp_path / 'notebook.json'
+    ipynb.write_text((NOTEBOOKS_FOLDER / 'test_metadata.ipynb').read_text())
+    zpln.write_text((NOTEBOOKS_FOLDER / 'test_zeppelin.zpln').read_text())
+    other.write_text((NOTEBOOKS_FOLDER / 'test_zeppelin.zpln').read_text())
+
+    # Jupyter and Zeppelin notebooks are stripped in a single run
+    pc = run([nbstripout_exe(), ipynb, zpln])
+    assert pc.returncode == 0
+    assert ipynb.read_text() == (NOTEBOOKS_FOLDER / 'test_metadata.ipynb.expected').read_text()
+    assert zpln.read_text() == (NOTEBOOKS_FOLDER / 'test_zeppelin.zpln.expected').read_text()
+
+    # Other files and stdin are sniffed
+    pc = run([nbstripout_exe(), '--force', other])
+    assert pc.returncode == 0
+    assert other.read_text() == (NOTEBOOKS_FOLDER / 'test_zeppelin.zpln.expected').read_text()
+    for input_file, expected_file in (
+        ('test_zeppelin.zpln', 'test_zeppelin.zpln.expected'),
+        ('test_metadata.ipynb', 'test_metadata.ipynb.expected'),
+    ):
+        with open(NOTEBOOKS_FOLDER / input_file, 'r') as f:
+            pc = run([nbstripout_exe()], stdin=f, stdout=PIPE, universal_newlines=True)
+        assert pc.returncode == 0
+        assert pc.stdout == (NOTEBOOKS_FOLDER / expected_file).read_text()
+
+
+def test_mode_explicit(tmp_path: Path):
+    # An explicit mode applies whatever the extension, e.g. to a stripped Jupyter notebook saved as .zpln
+    zpln = tmp_path / 'notebook.zpln'
+    zpln.write_text((NOTEBOOKS_FOLDER / 'test_metadata.ipynb.expected').read_text())
+    for args in ([], ['--fail-fast']):
+        pc = run([nbstripout_exe(), '--verify', '--mode', 'jupyter', zpln] + args, stdout=PIPE, universal_newlines=True)
+        assert pc.returncode == 0
+        assert pc.stdout == ''
+        pc = run([nbstripout_exe(), '--verify', zpln] + args, stdout=PIPE, stderr=PIPE, universal_newlines=True)
+        assert pc.returncode == 1
+
+
+class _Pipe(io.StringIO):
+    """Input which can't seek, like stdin, and records how much was read at once."""
+
+    sizes: List[int]
+
+    def seekable(self) -> bool:
+        return False
+
+    def read(self, size=-1):
+        self.sizes.append(size)
+        return super().read(size)
+
+
+def test_mode_auto_stream_stdin():
+    expected = (NOTEBOOKS_FOLDER / 'test_metadata.ipynb.expected').read_text()
+    pc = run(
+        [nbstripout_exe(), '--stream'],
+        input=(NOTEBOOKS_FOLDER / 'test_metadata.ipynb').read_text(),
+        stdout=PIPE,
+        universal_newlines=True,
+    )
+    assert pc.returncode == 0
+    assert pc.stdout == expected
+
+    # Telling the notebook apart doesn't read stdin as a whole, which would defeat --stream
+    args = _build_parser().parse_args(['--stream'])
+    stdin = _Pipe((NOTEBOOKS_FOLDER / 'test_metadata.ipynb').read_text())
+    stdin.sizes = []
+    output = io.StringIO()
+    assert process_notebook_auto(stdin, output, args, list(DEFAULT_EXTRA_KEYS))
+    assert output.getvalue() == expected
+    assert all(size is not None and size >= 0 for size in stdin.sizes)
+
+
+@pytest.mark.parametrize('jobs', ('2', 'auto'))
+def test_jobs(tmp_path: Path, jobs: str):
+    input_files = ['test_metadata.ipynb', 'test_nochange.ipynb', 'test_widgets.ipynb', 'test_unicode.ipynb']
+    paths = []
+    for i, input_file in enumerate(input_files * 2):
+        p = tmp_path / f'{i}_{input_file}'
+        p.write_text((NOTEBOOKS_FOLDER / input_file).read_text())
+        paths.append(p)
+
+    # Dry run messages are printed in the order the files were given
+    pc = run([nbstripout_exe(), '--verify', '--jobs', jobs] + paths, stdout=PIPE, universal_newlines=True)
+    assert pc.returncode == 1
+    assert pc.stdout.splitlines() == [f'Dry run: would have stripped {p}' for p in paths if 'nochange' not in p.name]
+
+    pc = run([nbstripout_exe(), '--textconv', '--jobs', jobs] + paths, stdout=PIPE, universal_newlines=True)
+    assert pc.returncode == 0
+    sequential = run([nbstripout_exe(), '--textconv'] + paths, stdout=PIPE, universal_newlines=True)
+    assert pc.stdout == sequential.stdout
+
+    pc = run([nbstripout_exe(), '--jobs', jobs] + paths, stdout=PIPE, universal_newlines=True)
+    assert pc.returncode == 0
+    for p in paths:
+        expected = NOTEBOOKS_FOLDER / p.name.split('_', maxsplit=1)[1]
+        if 'nochange' not in p.name:
+            expected = expected.with_suffix('.ipynb.expected')
+        assert p.read_text() == expected.read_text()
+
+    pc = run([nbstripout_exe(), '--verify', '--jobs', jobs] + paths, stdout=PIPE, universal_newlines=True)
+    assert pc.returncode == 0
+    assert not pc.stdout
+
+
+def test_jobs_error(tmp_path: Path):
+    paths = []
+    for i, input_file in enumerate(['test_metadata.ipynb', 'test_invalid_json.ipynb', 'test_metadata.ipynb']):
+        p = tmp_path / f'{i}_{input_file}'
+        p.write_text((NOTEBOOKS_FOLDER / input_file).read_text())
+        paths.append(p)
+
+    pc = run([nbstripout_exe(), '--dry-run', '--jobs', '2'] + paths, stdout=PIPE, stderr=PIPE, universal_newlines=True)
+    assert pc.returncode == 1
+    assert pc.stdout == f'Dry run: would have stripped {paths[0]}\n'
+    assert pc.stderr == f"No valid notebook detected in '{paths[1]}'\n"
+
+
+def test_verify_report(tmp_path: Path):
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'sub' / 'dirty.ipynb').write_text((NOTEBOOKS_FOLDER / 'test_metadata.ipynb').read_text())
+    (tmp_path / 'clean.ipynb').write_text((NOTEBOOKS_FOLDER / 'test_nochange.ipynb').read_text())
+    (tmp_path / 'invalid.ipynb').write_text('not a notebook')
+    args = ['--verify', '--report', 'report.json', '--junit', 'report.xml', '--jobs', '2']
+
+    # Glob patterns are expanded by nbstripout, in sorted order
+    pc = run([nbstripout_exe(), '**/*.ipynb'] + args, stdout=PIPE, stderr=PIPE, universal_newlines=True, cwd=tmp_path)
+    assert pc.returncode == 1
+    assert pc.stdout == f'Dry run: would have stripped {os.path.join("sub", "dirty.ipynb")}\n'
+    assert pc.stderr == "No valid notebook detected in 'invalid.ipynb'\n"
+    expected = (NOTEBOOKS_FOLDER / 'test_metadata.ipynb.expected').read_text()
+    assert (tmp_path / 'sub' / 'dirty.ipynb').read_text() != expected
+
+    report = json.loads((tmp_path / 'report.json').read_text())
+    assert (report['files'], report['clean'], report['dirty'], report['error']) == (3, 1, 1, 1)
+    dirty = report['results'][2]
+    assert dirty['status'] == 'dirty'
+    assert dirty['size'] == (tmp_path / 'sub' / 'dirty.ipynb').stat().st_size
+    assert dirty['bytes_saved'] == dirty['size'] - dirty['stripped_size'] > 0
+    assert dirty['changes'] == {'outputs_removed': 1, 'counts_cleared': 5, 'keys_removed': 3}
+    junit = (tmp_path / 'report.xml').read_text()
+    assert '<testsuite name="nbstripout" tests="3" failures="1" errors="1" skipped="0">' in junit
+
+    # The remaining files are skipped after the first failure
+    pc = run([nbstripout_exe(), '*.ipynb', 'sub/*.ipynb'] + args + ['--fail-fast'], stdout=PIPE, cwd=tmp_path)
+    assert pc.returncode == 1
+    report = json.loads((tmp_path / 'report.json').read_text())
+    assert [r['status'] for r in report['results']] == ['clean', 'error', 'skipped']
+
+    pc = run([nbstripout_exe(), '--verify', '--fail-fast', 'clean.ipynb'], cwd=tmp_path)
+    assert pc.returncode == 0
+
+
+@pytest.mark.parametrize('jobs', ('1', '2'))
+def test_batch(jobs: str):
+    notebook = (NOTEBOOKS_FOLDER / 'test_metadata.ipynb').read_text()
+    requests = [
+        {'id': 'a', 'notebook': notebook},
+        {'id': 'b', 'notebook': json.loads(notebook), 'options': {'keep_count': True}},
+        {'id': 'c', 'notebook': (NOTEBOOKS_FOLDER / 'test_zeppelin.zpln').read_text(), 'mode': 'zeppelin'},
+        {'id': 'd', 'notebook': 'not a notebook'},
+        {'id': 'e', 'notebook': notebook, 'options': {'keep_everything': True}},
+        {'id': 'f', 'notebook': notebook, 'options': {'keep_count': 'false'}},
+    ]
+    stdin = ''.join(json.dumps(request) + '\n' for request in requests) + 'not a request\n'
+    pc = run([nbstripout_exe(), '--batch', '--jobs', jobs], input=stdin, stdout=PIPE, universal_newlines=True)
+    assert pc.returncode == 0
+    responses = [json.loads(line) for line in pc.stdout.splitlines()]
+    assert [(r['id'], r['status']) for r in responses] == [
+        ('a', 'ok'),
+        ('b', 'ok'),
+        ('c', 'ok'),
+        ('d', 'error'),
+        ('e', 'error'),
+        ('f', 'error'),
+        (None, 'error'),
+    ]
+    assert responses[0] == {
+        'id': 'a',
+        'status': 'ok',
+        'changed': True,
+        'notebook': (NOTEBOOKS_FOLDER / 'test_metadata.ipynb.expected').read_text(),
+    }
+    expected = (NOTEBOOKS_FOLDER / 'test_metadata_keep_count.ipynb.expected').read_text()
+    assert responses[1]['notebook'] == json.loads(expected)
+    assert responses[2]['notebook'] == (NOTEBOOKS_FOLDER / 'test_zeppelin.zpln.expected').read_text()
+    assert responses[4]['error'] == 'Unknown options: keep_everything'
+    assert responses[5]['error'] == 'Option keep_count must be true or false, not "false"'
+
+    # Length-prefixed messages, reporting changes only for a dry run
+    message = json.dumps(requests[0]).encode()
+    stdin = b'%d\n%s\n' % (len(message), message)
+    pc = run([nbstripout_exe(), '--batch=length', '--dry-run', '--jobs', jobs], input=stdin, stdout=PIPE)
+    assert pc.returncode == 0
+    length, response = pc.stdout.split(b'\n', 1)
+    assert int(length) == len(response) - 1
+    assert json.loads(response) == {'id': 'a', 'status': 'ok', 'changed': True}
+
+    pc = run([nbstripout_exe(), '--batch=length'], input=b'100\n{}', stdout=PIPE, stderr=PIPE)
+    assert pc.returncode == 1
+    assert pc.stderr == b'Could not read batch: Truncated message: expected 100 bytes, got 2\n'
+
+
+def test_cache(tmp_path: Path):
+    notebook = tmp_path / 'test_metadata.ipynb'
+    notebook.write_text((NOTEBOOKS_FOLDER / 'test_metadata.ipynb').read_text())
+    cache_args = ['--cache', '--cache-dir', str(tmp_path / 'cache')]
+
+    # The second run is served from the cache
+    for _ in range(2):
+        pc = run([nbstripout_exe(), '--verify', notebook] + cache_args, stdout=PIPE, universal_newlines=True)
+        assert pc.stdout == f'Dry run: would have stripped {notebook}\n'
+        assert pc.returncode == 1
+
+    pc = run([nbstripout_exe(), '-t', notebook] + cache_args, stdout=PIPE, universal_newlines=True)
+    expected = (NOTEBOOKS_FOLDER / 'test_metadata.ipynb.expected').read_text()
+    assert pc.stdout == expected
+
+    pc = run([nbstripout_exe(), notebook] + cache_args, stdout=PIPE, universal_newlines=True)
+    assert pc.returncode == 0
+    assert notebook.read_text() == expected
+
+    # Options are part of the cache key
+    notebook.write_text((NOTEBOOKS_FOLDER / 'test_metadata.ipynb').read_text())
+    pc = run([nbstripout_exe(), '--keep-count', '-t', notebook] + cache_args, stdout=PIPE, universal_newlines=True)
+    assert pc.stdout == (NOTEBOOKS_FOLDER / 'test_metadata_keep_count.ipynb.expected').read_text()
+
+    pc = run([nbstripout_exe(), '--cache-stats'] + cache_args, stdout=PIPE, universal_newlines=True)
+    assert pc.returncode == 0
+    assert 'Entries: 2 ' in pc.stdout
+    assert 'Hits: 3, misses: 2 (60.0% hit rate)' in pc.stdout
+
+
+def test_cache_eviction(tmp_path: Path):
+    cache_args = ['--cache', '--cache-dir', str(tmp_path / 'cache')]
+    with open(NOTEBOOKS_FOLDER / 'test_metadata.ipynb', mode='r') as f:
+        pc = run([nbstripout_exe(), '--cache-size', '1'] + cache_args, stdin=f, stdout=PIPE, universal_newlines=True)
+    assert pc.stdout == (NOTEBOOKS_FOLDER / 'test_metadata.ipynb.expected').read_text()
+
+    pc = run([nbstripout_exe(), '--cache-stats'] + cache_args, stdout=PIPE, universal_newlines=True)
+    assert 'Entries: 0 (0 bytes' in pc.stdout
+
+
+def test_analyze(tmp_path: Path):
+    for name in ('test_metadata.ipynb', 'test_widgets.ipynb'):
+        (tmp_path / name).write_text((NOTEBOOKS_FOLDER / name).read_text())
+    (tmp_path / 'invalid.ipynb').write_text('not a notebook')
+
+    pc = run([nbstripout_exe(), '--analyze', 'worktree', tmp_path, '--json'], stdout=PIPE, universal_newlines=True)
+    assert pc.returncode == 0
+    report = json.loads(pc.stdout)
+    assert report['notebooks'] == 2
+    assert report['invalid_notebooks'] == 1
+
+    outputs = [
+        output
+        for name in ('test_metadata.ipynb', 'test_widgets.ipynb')
+        for cell in json.loads((tmp_path / name).read_text())['cells']
+        for output in cell.get('outputs', [])
+    ]
+    assert report['output_size'] == sum(get_size(output) for output in outputs)
+    assert sum(t['outputs'] for t in report['output_types'].values()) == len(outputs)
+    policies = {policy['policy']: policy['saved'] for policy in report['policies']}
+    assert policies['--keep-output --drop-output-type stream:stdout'] == sum(
+        get_size(output) for output in outputs if output.get('name') == 'stdout'
+    )
+    assert policies['--keep-output --drop-mime-type text/plain'] == sum(
+        get_size(output['data']['text/plain']) for output in outputs if 'text/plain' in output.get('data', {})
+    )
+    assert report['largest_notebooks'][0]['notebook'] == str(tmp_path / 'test_metadata.ipynb')
+
+    pc = run([nbstripout_exe(), '--analyze', 'worktree', tmp_path, '-j', '2'], stdout=PIPE, universal_newlines=True)
+    assert pc.returncode == 0
+    assert pc.stdout.startswith('Analyzed 2 notebooks')
+    assert 'Savings of stripping policies' in pc.stdout
+
+
+@pytest.mark.parametrize('jobs', ('1', '2'))
+def test_stats(tmp_path: Path, jobs: str):
+    paths = []
+    for name in ('test_metadata.ipynb', 'test_widgets.ipynb'):
+        paths.append(tmp_path / name)
+        paths[-1].write_text((NOTEBOOKS_FOLDER / name).read_text())
+
+    args = ['--stats=json,memory', '--dry-run', '--jobs', jobs]
+    pc = run([nbstripout_exe()] + args + paths, stdout=PIPE, stderr=PIPE, universal_newlines=True)
+    assert pc.returncode == 0
+    *records, total = [json.loads(line) for line in pc.stderr.splitlines()]
+    assert [record['notebook'] for record in records] == [str(p) for p in paths]
+    for record, p in zip(records, paths):
+        assert record['bytes'] == p.stat().st_size
+        assert set(record['phases']) == {'read', 'strip'}
+        assert record['peak_memory'] > 0
+    total = total['total']
+    assert total['notebooks'] == 2
+    assert total['bytes'] == sum(p.stat().st_size for p in paths)
+    assert {'git', 'read', 'strip', 'other'} <= set(total['phases'])
+
+    # Git filters can enable statistics and profiling from the environment
+    profile = tmp_path / 'profile-{pid}'
+    env = dict(os.environ, NBSTRIPOUT_STATS='1', NBSTRIPOUT_PROFILE=str(profile))
+    with open(paths[0], mode='r') as f:
+        pc = run([nbstripout_exe()], stdin=f, stdout=PIPE, stderr=PIPE, universal_newlines=True, env=env)
+    assert pc.stdout == (NOTEBOOKS_FOLDER / 'test_metadata.ipynb.expected').read_text()
+    assert re.match(
+        r'nbstripout stats: input from stdin: [\d.]+ ms \(read [\d.]+ ms, strip [\d.]+ ms, write', pc.stderr
+    )
+    assert pc.stderr.splitlines()[-1].startswith('nbstripout stats: 1 notebooks: ')
+    assert len(list(tmp_path.glob('profile-*'))) == 1
+
+
+@pytest.mark.skipif(not _daemon.SUPPORTED, reason='The daemon requires Unix domain sockets and fork')
+def test_serve(tmp_path: Path):
+    socket_dir = tmp_path / 'daemon'
+    socket_dir.mkdir(mode=0o700)
+    socket_path = socket_dir / 'daemon.sock'
+    env = dict(os.environ, NBSTRIPOUT_SOCKET=str(socket_path))
+    client = [sys.executable, '-m', 'nbstripout._daemon']
+    notebook = tmp_path / 'test_metadata.ipynb'
+    notebook.write_text((NOTEBOOKS_FOLDER / 'test_metadata.ipynb').read_text())
+    expected = (NOTEBOOKS_FOLDER / 'test_metadata.ipynb.expected').read_text()
+
+    # Without a daemon, the client runs nbstripout itself
+    pc = run(client + ['-t', notebook], stdout=PIPE, universal_newlines=True, env=env)
+    assert pc.returncode == 0
+    assert pc.stdout == expected
+
+    with Popen([nbstripout_exe(), '--serve'], stderr=PIPE, env=env) as daemon:
+        try:
+            for _ in range(100):
+                if socket_path.exists():
+                    break
+                time.sleep(0.1)
+            pc = run(client + ['-t', notebook.name], stdout=PIPE, universal_newlines=True, env=env, cwd=tmp_path)
+            assert pc.returncode == 0
+            assert pc.stdout == expected
+
+            with open(notebook, mode='r') as f:
+                pc = run(client, stdin=f, stdout=PIPE, universal_newlines=True, env=env)
+            assert pc.stdout == expected
+
+            pc = run(client + ['--verify', notebook], stdout=PIPE, universal_newlines=True, env=env)
+            assert pc.returncode == 1
+            assert pc.stdout == f'Dry run: would have stripped {notebook}\n'
+
+            pc = run([nbstripout_exe(), '--serve'], stderr=PIPE, universal_newlines=True, env=env)
+            assert pc.returncode == 1
+            assert pc.stderr == f'nbstripout is already serving on {socket_path}\n'
+        finally:
+            daemon.terminate()
+        assert daemon.wait() == 0
+        assert daemon.stderr.read().decode() == f'Serving on {socket_path}\n'
+    assert not socket_path.exists()
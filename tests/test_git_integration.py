@@ -1,4 +1,5 @@
 from configparser import ConfigParser
+import json
 from pathlib import Path
 import re
 import sys
@@ -45,6 +46,117 @@ def test_install_different_python(pytester: pytest.Pytester):
     assert sys.executable not in config['diff "ipynb"']['textconv']
 
 
+def test_install_process(pytester: pytest.Pytester):
+    pytester.run('git', 'init')
+    pytester.run('nbstripout', '--install')
+    pytester.run('nbstripout', '--install', '--process')
+    assert pytester.run('nbstripout', '--is-installed').ret == 0
+
+    config = ConfigParser()
+    config.read('.git/config')
+    assert re.match(r'.*python.* -m nbstripout --process', config['filter "nbstripout"']['process'])
+    assert config['filter "nbstripout"']['required'] == 'true'
+    assert 'clean' not in config['filter "nbstripout"']
+    assert 'smudge' not in config['filter "nbstripout"']
+    assert re.match(r'.*python.* -m nbstripout -t', config['diff "ipynb"']['textconv'])
+
+    r = pytester.run('nbstripout', '--status')
+    assert r.ret == 0
+    r.stdout.re_match_lines([r'  process = .* -m nbstripout --process'])
+
+    pytester.run('nbstripout', '--uninstall')
+    assert pytester.run('nbstripout', '--is-installed').ret == 1
+    config = ConfigParser()
+    config.read('.git/config')
+    assert 'filter "nbstripout"' not in config
+
+
+def test_install_cache(pytester: pytest.Pytester):
+    pytester.run('git', 'init')
+    assert pytester.run('nbstripout', '--install', '--cache').ret == 0
+
+    config = ConfigParser()
+    config.read('.git/config')
+    assert re.match(r'.*python.* -m nbstripout --cache$', config['filter "nbstripout"']['clean'])
+    assert re.match(r'.*python.* -m nbstripout --cache -t', config['diff "ipynb"']['textconv'])
+
+    name = 'test_metadata.ipynb'
+    pytester.path.joinpath(name).write_bytes((NOTEBOOKS_FOLDER / 'e2e_notebooks' / name).read_bytes())
+    assert pytester.run('git', 'add', name).ret == 0
+    r = pytester.run('nbstripout', '--cache-stats')
+    assert r.ret == 0
+    r.stdout.re_match_lines([r'Entries: 1 .*', r'Hits: 0, misses: 1'])
+
+
+def test_install_cache_textconv(pytester: pytest.Pytester, monkeypatch: pytest.MonkeyPatch):
+    for var in ('GIT_AUTHOR_NAME', 'GIT_COMMITTER_NAME'):
+        monkeypatch.setenv(var, 'nbstripout')
+    for var in ('GIT_AUTHOR_EMAIL', 'GIT_COMMITTER_EMAIL'):
+        monkeypatch.setenv(var, 'nbstripout@example.com')
+    pytester.run('git', 'init')
+    assert pytester.run('nbstripout', '--install', '--cache').ret == 0
+    config = ConfigParser()
+    config.read('.git/config')
+    assert config['diff "ipynb"']['cachetextconv'] == 'true'
+
+    notebook = pytester.path.joinpath('notebook.ipynb')
+    for name in ('test_metadata.ipynb', 'test_widgets.ipynb'):
+        notebook.write_bytes((NOTEBOOKS_FOLDER / 'e2e_notebooks' / name).read_bytes())
+        pytester.run('git', 'add', 'notebook.ipynb')
+        assert pytester.run('git', 'commit', '-m', name).ret == 0
+        # Keep the stripped notebook, such that it is not changed in the working tree
+        pytester.run('git', 'checkout', 'notebook.ipynb')
+
+    # Diffs are cached by git, such that the second log doesn't run nbstripout
+    first = pytester.run('git', 'log', '-p').stdout.str()
+    r = pytester.run('nbstripout', '--status')
+    r.stdout.re_match_lines([r'Cache:', r'  directory = .*nbstripout-cache', r'  Hits: \d+, misses: \d+.*'])
+    hits_and_misses = [line for line in r.stdout.lines if line.startswith('  Hits')]
+    r.stdout.re_match_lines([r'  Diffs cached by git: 2'])
+    assert pytester.run('git', 'log', '-p').stdout.str() == first
+    r = pytester.run('nbstripout', '--status')
+    assert [line for line in r.stdout.lines if line.startswith('  Hits')] == hits_and_misses
+
+    # Installing globally leaves the diffs cached for the repository it is run in alone
+    home = pytester.mkdir('home')
+    monkeypatch.setenv('HOME', str(home))
+    monkeypatch.delenv('XDG_CONFIG_HOME', raising=False)
+    assert pytester.run('nbstripout', '--install', '--global').ret == 0
+    assert pytester.run('git', 'show-ref', '--verify', '--quiet', 'refs/notes/textconv/ipynb').ret == 0
+
+    # Reinstalling drops the cached diffs, e.g. to refresh them after changing options in the git config
+    assert pytester.run('nbstripout', '--install').ret == 0
+    assert pytester.run('git', 'show-ref', '--verify', '--quiet', 'refs/notes/textconv/ipynb').ret == 1
+    config = ConfigParser()
+    config.read('.git/config')
+    assert 'cachetextconv' not in config['diff "ipynb"']
+
+
+def test_process_filter(pytester: pytest.Pytester):
+    pytester.run('git', 'init')
+    pytester.run('nbstripout', '--install', '--process')
+    for name in ('test_metadata.ipynb', 'test_zeppelin.zpln'):
+        pytester.path.joinpath(name).write_bytes((NOTEBOOKS_FOLDER / 'e2e_notebooks' / name).read_bytes())
+
+    assert pytester.run('git', 'add', 'test_metadata.ipynb', 'test_zeppelin.zpln').ret == 0
+    for name in ('test_metadata.ipynb', 'test_zeppelin.zpln'):
+        r = pytester.run('git', 'show', f':{name}')
+        expected = (NOTEBOOKS_FOLDER / 'e2e_notebooks' / f'{name}.expected').read_text()
+        assert r.stdout.str() + '\n' == expected
+
+    # The working copy is not modified
+    assert (
+        pytester.path.joinpath('test_metadata.ipynb').read_bytes()
+        == (NOTEBOOKS_FOLDER / 'e2e_notebooks' / 'test_metadata.ipynb').read_bytes()
+    )
+
+    # An invalid notebook makes the (required) filter fail
+    pytester.path.joinpath('invalid.ipynb').write_text('not a notebook')
+    r = pytester.run('git', 'add', 'invalid.ipynb')
+    assert r.ret != 0
+    r.stderr.fnmatch_lines(["Could not strip 'invalid.ipynb'*"])
+
+
 def test_uninstall(pytester: pytest.Pytester):
     pytester.run('git', 'init')
     # add extra filter at the start, so we can check we don't remove it
@@ -258,3 +370,75 @@ def test_git_diff_keepmetadatakeys(pytester: pytest.Pytester):
 """.splitlines()
     )
     assert len(r.outlines) == 28  # 12 lines + new line at end
+
+
+def test_staged(pytester: pytest.Pytester):
+    pytester.run('git', 'init')
+    for name in ('test_metadata.ipynb', 'test_nochange.ipynb', 'test_zeppelin.zpln'):
+        pytester.path.joinpath(name).write_bytes((NOTEBOOKS_FOLDER / 'e2e_notebooks' / name).read_bytes())
+    assert pytester.run('git', 'add', '.').ret == 0
+
+    r = pytester.run('nbstripout', '--staged', '--verify')
+    assert r.ret == 1
+    r.stdout.fnmatch_lines(['Dry run: would have stripped test_metadata.ipynb', '*test_zeppelin.zpln'])
+
+    assert pytester.run('nbstripout', '--staged').ret == 0
+    for name in ('test_metadata.ipynb', 'test_zeppelin.zpln'):
+        r = pytester.run('git', 'show', f':{name}')
+        expected = (NOTEBOOKS_FOLDER / 'e2e_notebooks' / f'{name}.expected').read_text()
+        assert r.stdout.str() + '\n' == expected
+        # The working tree is left alone
+        assert pytester.path.joinpath(name).read_bytes() == (NOTEBOOKS_FOLDER / 'e2e_notebooks' / name).read_bytes()
+    assert pytester.run('nbstripout', '--staged', '--verify').ret == 0
+
+    # Only notebooks without unstaged changes are stripped in the working tree
+    assert pytester.run('git', 'add', '.').ret == 0
+    pytester.path.joinpath('test_zeppelin.zpln').write_text('{"paragraphs": []}\n')
+    r = pytester.run('nbstripout', '--staged', '--worktree')
+    assert r.ret == 0
+    r.stderr.fnmatch_lines(["Not stripping 'test_zeppelin.zpln' in the working tree: it has unstaged changes"])
+    expected = (NOTEBOOKS_FOLDER / 'e2e_notebooks' / 'test_metadata.ipynb.expected').read_text()
+    assert pytester.path.joinpath('test_metadata.ipynb').read_text() == expected
+    assert pytester.path.joinpath('test_zeppelin.zpln').read_text() == '{"paragraphs": []}\n'
+
+
+def test_rewrite_history(pytester: pytest.Pytester, monkeypatch: pytest.MonkeyPatch):
+    for var in ('GIT_AUTHOR_NAME', 'GIT_COMMITTER_NAME'):
+        monkeypatch.setenv(var, 'nbstripout')
+    for var in ('GIT_AUTHOR_EMAIL', 'GIT_COMMITTER_EMAIL'):
+        monkeypatch.setenv(var, 'nbstripout@example.com')
+    pytester.run('git', 'init')
+    notebooks = NOTEBOOKS_FOLDER / 'e2e_notebooks'
+    for i, name in enumerate(('test_metadata.ipynb', 'test_widgets.ipynb')):
+        pytester.path.joinpath('notebook.ipynb').write_bytes((notebooks / name).read_bytes())
+        # The same notebook at another path is only stripped once
+        pytester.path.joinpath(f'copy{i}.ipynb').write_bytes((notebooks / name).read_bytes())
+        pytester.run('git', 'add', '.')
+        assert pytester.run('git', 'commit', '-m', f'Commit {i}').ret == 0
+    pytester.run('git', 'tag', 'v1', 'HEAD~1')
+
+    # Unique notebooks in the history
+    r = pytester.run('nbstripout', '--analyze', 'history', '--json')
+    assert r.ret == 0
+    assert json.loads(r.stdout.str())['notebooks'] == 2
+
+    r = pytester.run('nbstripout', '--rewrite-history', '--verify')
+    assert r.ret == 1
+    r.stdout.fnmatch_lines(['Would have stripped 2 of 2 unique notebook blobs in 2 commits, saving * bytes'])
+
+    r = pytester.run('nbstripout', '--rewrite-history', '--jobs', '2')
+    assert r.ret == 0
+    r.stdout.fnmatch_lines(['Stripped 2 of 2 unique notebook blobs in 2 commits, saving * bytes'])
+    for rev, name in (('v1', 'test_metadata.ipynb'), ('HEAD', 'test_widgets.ipynb')):
+        expected = (notebooks / f'{name}.expected').read_text()
+        for path in ('notebook.ipynb', f'copy{0 if rev == "v1" else 1}.ipynb'):
+            assert pytester.run('git', 'show', f'{rev}:{path}').stdout.str() + '\n' == expected
+    assert (
+        pytester.run('git', 'show', 'HEAD:copy0.ipynb').stdout.str() + '\n'
+        == (notebooks / 'test_metadata.ipynb.expected').read_text()
+    )
+    # The index follows the rewritten HEAD, the working tree is left alone
+    assert pytester.run('git', 'diff', '--cached', '--quiet').ret == 0
+    assert pytester.path.joinpath('notebook.ipynb').read_bytes() == (notebooks / 'test_widgets.ipynb').read_bytes()
+
+    assert pytester.run('nbstripout', '--rewrite-history', '--verify').ret == 0
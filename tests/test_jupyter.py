@@ -0,0 +1,62 @@
+from concurrent.futures import ThreadPoolExecutor
+import copy
+from pathlib import Path
+
+import nbformat
+
+from nbstripout.jupyter import _load_jupyter_server_extension, make_pre_save_hook, pre_save_hook
+
+NOTEBOOKS_FOLDER = Path('tests/e2e_notebooks')
+
+
+def read_model(name: str) -> dict:
+    content = nbformat.read(NOTEBOOKS_FOLDER / name, as_version=nbformat.NO_CONVERT)
+    return {'type': 'notebook', 'format': 'json', 'content': content}
+
+
+def test_pre_save_hook():
+    model = read_model('test_metadata.ipynb')
+    pre_save_hook(model=model, path='test_metadata.ipynb', contents_manager=None)
+    expected = (NOTEBOOKS_FOLDER / 'test_metadata.ipynb.expected').read_text()
+    assert nbformat.writes(model['content']) + '\n' == expected
+
+    # Other files are left alone
+    model = {'type': 'file', 'format': 'text', 'content': '{"cells": []}'}
+    pre_save_hook(model=model, path='notebook.json', contents_manager=None)
+    assert model['content'] == '{"cells": []}'
+
+
+def test_make_pre_save_hook():
+    model = read_model('test_metadata.ipynb')
+    make_pre_save_hook(keep_count=True)(model=model, path='test_metadata.ipynb', contents_manager=None)
+    expected = (NOTEBOOKS_FOLDER / 'test_metadata_keep_count.ipynb.expected').read_text()
+    assert nbformat.writes(model['content']) + '\n' == expected
+
+
+def test_concurrent_saves():
+    models = [read_model('test_widgets.ipynb') for _ in range(32)]
+    expected = copy.deepcopy(models[0])
+    pre_save_hook(model=expected, path='test_widgets.ipynb', contents_manager=None)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda model: pre_save_hook(model=model, path='', contents_manager=None), models))
+    assert all(model == expected for model in models)
+
+
+def test_server_extension():
+    class ContentsManager:
+        def __init__(self):
+            self.hooks = []
+
+        def register_pre_save_hook(self, hook):
+            self.hooks.append(hook)
+
+    class Log:
+        def info(self, message):
+            pass
+
+    class ServerApp:
+        contents_manager = ContentsManager()
+        log = Log()
+
+    _load_jupyter_server_extension(ServerApp)
+    assert ServerApp.contents_manager.hooks == [pre_save_hook]
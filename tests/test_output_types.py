@@ -4,7 +4,8 @@ from copy import deepcopy
 import nbformat
 import pytest
 
-from nbstripout import strip_output
+from nbstripout import StripReport, strip_output
+from nbstripout import _json_engine
 
 directory = os.path.dirname(__file__)
 
@@ -90,3 +91,39 @@ def test_output_format_tags(orig_nb):
 
     # Third cell should have only the execute_result
     assert len(nb_stripped.cells[2].outputs) == 1
+
+
+def test_strip_report(orig_nb):
+    """
+    Confirm that the report records what was changed.
+    """
+    report = StripReport()
+    strip_output(deepcopy(orig_nb), keep_output=True, keep_count=False, keep_id=False, report=report)
+    assert report
+    # Both execute_result outputs as well as both code cells had an execution count
+    assert report.counts_cleared == 4
+    assert report.outputs_removed == 0
+
+    report = StripReport()
+    strip_output(
+        deepcopy(orig_nb), keep_output=True, keep_count=True, keep_id=True, drop_output_types={'error'}, report=report
+    )
+    assert report == StripReport(outputs_removed=1)
+
+    nb_stripped = strip_output(deepcopy(orig_nb), keep_output=False, keep_count=False, keep_id=False)
+    report = StripReport()
+    strip_output(nb_stripped, keep_output=False, keep_count=False, keep_id=False, report=report)
+    assert not report
+
+
+def test_plain_dict(orig_nb):
+    """
+    Confirm that strip_output works the same on plain dicts as on NotebookNodes.
+    """
+    with open(os.path.join(directory, 'test_output_types.ipynb')) as f:
+        nb = _json_engine.reads(f.read())
+    assert not isinstance(nb, nbformat.NotebookNode)
+
+    for kwargs in (dict(keep_output=False), dict(keep_output=True, drop_output_types={'error'})):
+        expected = strip_output(deepcopy(orig_nb), keep_count=False, keep_id=False, **kwargs)
+        assert strip_output(deepcopy(nb), keep_count=False, keep_id=False, **kwargs) == expected
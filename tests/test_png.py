@@ -0,0 +1,95 @@
+import base64
+import json
+from pathlib import Path
+import struct
+from subprocess import PIPE, run
+import zlib
+
+import nbformat
+from nbformat.v4 import new_code_cell, new_notebook, new_output
+
+from nbstripout._png import recompress_base64_png, recompress_png
+
+
+def make_png(width: int = 64, height: int = 64, level: int = 1, split: int = 0) -> bytes:
+    """A gradient image compressed at zlib `level`, with the image data split into IDAT chunks of `split` bytes."""
+
+    def chunk(chunk_type: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data))
+
+    raw = b''.join(b'\x00' + bytes((x * 4 + y) % 256 for x in range(width * 3)) for y in range(height))
+    data = zlib.compress(raw, level)
+    parts = [data[i : i + split] for i in range(0, len(data), split)] if split else [data]
+    return b''.join(
+        [
+            b'\x89PNG\r\n\x1a\n',
+            chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)),
+            chunk(b'tEXt', b'Software\x00matplotlib'),
+            *(chunk(b'IDAT', part) for part in parts),
+            chunk(b'IEND', b''),
+        ]
+    )
+
+
+def image_data(png: bytes) -> bytes:
+    """The decompressed image data, i.e. the pixels, and the other chunks of `png`."""
+    offset, idat, other = 8, b'', []
+    while offset < len(png):
+        length, chunk_type = struct.unpack_from('>I4s', png, offset)
+        data = png[offset + 8 : offset + 8 + length]
+        if chunk_type == b'IDAT':
+            idat += data
+        else:
+            other.append((chunk_type, data))
+        offset += 12 + length
+    return zlib.decompress(idat), other
+
+
+def test_recompress_png():
+    for split in (0, 100):
+        png = make_png(split=split)
+        recompressed = recompress_png(png)
+        assert len(recompressed) < len(png)
+        # Pixels and other chunks are unchanged
+        assert image_data(recompressed) == image_data(png)
+        assert recompress_png(recompressed) is None
+
+    assert recompress_png(make_png(level=9)) is None
+    assert recompress_png(b'not a png') is None
+    assert recompress_png(make_png()[:-20]) is None
+
+    value = base64.b64encode(make_png()).decode() + '\n'
+    recompressed = recompress_base64_png(value)
+    assert recompressed.endswith('\n')
+    assert recompress_base64_png(recompressed) is None
+    assert recompress_base64_png('not base64!') is None
+
+
+def test_recompress_images(tmp_path: Path):
+    nb = new_notebook()
+    images = [base64.b64encode(make_png(width=16 * (i + 1))).decode() + '\n' for i in range(3)]
+    nb.cells = [
+        new_code_cell(
+            'plot()',
+            outputs=[
+                new_output('display_data', data={'image/png': image, 'text/plain': '<Figure>'}) for image in images
+            ],
+        ),
+        new_code_cell('plot()', outputs=[new_output('display_data', data={'image/png': images[0]})]),
+    ]
+    path = tmp_path / 'plots.ipynb'
+    path.write_text(nbformat.writes(nb))
+
+    pc = run(['nbstripout', '--keep-output', '--recompress-images', str(path)])
+    assert pc.returncode == 0
+    stripped = json.loads(path.read_text())
+    recompressed = [output['data']['image/png'] for cell in stripped['cells'] for output in cell['outputs']]
+    assert len(recompressed) == 4
+    for image, original in zip(recompressed, images + images[:1]):
+        png, original_png = base64.b64decode(image), base64.b64decode(original)
+        assert len(png) < len(original_png)
+        assert image_data(png) == image_data(original_png)
+
+    # Stripping again changes nothing
+    pc = run(['nbstripout', '--keep-output', '--recompress-images', '--verify', str(path)], stdout=PIPE)
+    assert pc.returncode == 0
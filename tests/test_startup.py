@@ -0,0 +1,82 @@
+import os
+from pathlib import Path
+import re
+from subprocess import run, PIPE
+import sys
+from typing import List
+
+import pytest
+
+from nbstripout import _daemon
+
+# Modules which must only be imported on the code paths that need them
+LAZY_MODULES = [
+    'nbformat',
+    'jsonschema',
+    'concurrent.futures',
+    'multiprocessing',
+    'nbstripout._analyze',
+    'nbstripout._batch',
+    'nbstripout._daemon',
+    'nbstripout._git_index',
+    'nbstripout._history',
+    'nbstripout._png',
+    'nbstripout._streaming',
+    'nbstripout._verify',
+]
+
+# Importing nbstripout must take less than this many times as long as importing nbformat on top of it. Importing
+# nbstripout takes less time than importing nbformat, so this leaves plenty of room for slow or loaded machines, while
+# importing nbformat along with nbstripout leaves next to nothing to import afterwards and always fails the test
+IMPORT_RATIO = 2
+
+
+def test_lazy_imports():
+    code = 'import sys, nbstripout._nbstripout; print("\\n".join(sys.modules))'
+    pc = run([sys.executable, '-c', code], stdout=PIPE, universal_newlines=True, check=True)
+    modules = set(pc.stdout.split())
+    assert 'nbstripout._nbstripout' in modules
+    assert not modules.intersection(LAZY_MODULES)
+
+
+def test_client_imports():
+    code = 'import sys, nbstripout._daemon; print("\\n".join(sys.modules))'
+    pc = run([sys.executable, '-c', code], stdout=PIPE, universal_newlines=True, check=True)
+    assert 'nbstripout._nbstripout' not in pc.stdout.split()
+
+
+@pytest.mark.skipif(not _daemon.SUPPORTED, reason='The daemon requires Unix domain sockets and fork')
+def test_serve_imports(tmp_path: Path):
+    # The daemon imports everything before serving, such that the children it forks don't
+    code = (
+        'import socketserver, sys; '
+        'socketserver.BaseServer.serve_forever = lambda self: print("\\n".join(sys.modules)); '
+        'from nbstripout._nbstripout import main; sys.argv = ["nbstripout", "--serve"]; main()'
+    )
+    env = dict(os.environ, NBSTRIPOUT_SOCKET=str(tmp_path / 'daemon' / 'daemon.sock'))
+    pc = run([sys.executable, '-c', code], stdout=PIPE, universal_newlines=True, env=env)
+    assert pc.returncode == 0
+    assert set(LAZY_MODULES) <= set(pc.stdout.split())
+
+
+def test_import_time():
+    code = (
+        'import time; start = time.perf_counter(); import nbstripout._nbstripout; middle = time.perf_counter(); '
+        'import nbformat; print(middle - start, time.perf_counter() - middle)'
+    )
+
+    def import_times() -> List[float]:
+        pc = run([sys.executable, '-c', code], stdout=PIPE, universal_newlines=True, check=True)
+        return [float(seconds) * 1000 for seconds in pc.stdout.split()]
+
+    # Take the best of a few runs to be robust against noise. Both imports are timed in the same interpreter, such that
+    # the bound is relative to the speed of the machine
+    nbstripout_ms, nbformat_ms = (min(times) for times in zip(*(import_times() for _ in range(3))))
+    assert nbstripout_ms < IMPORT_RATIO * nbformat_ms, (
+        f'Importing nbstripout took {nbstripout_ms:.1f} ms, importing nbformat on top of it {nbformat_ms:.1f} ms'
+    )
+
+
+def test_version():
+    pc = run([sys.executable, '-m', 'nbstripout', '--version'], stdout=PIPE, universal_newlines=True, check=True)
+    assert re.fullmatch(r'\d+\.\d+\.\d+\n', pc.stdout)
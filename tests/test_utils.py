@@ -1,6 +1,6 @@
 import pytest
 
-from nbstripout._utils import pop_recursive
+from nbstripout._utils import StripPlan, StripReport, _KeyTrie, get_size, pop_recursive
 
 
 def make_dict():
@@ -35,3 +35,60 @@ def test_pop_recursive(d, key, res, remainder):
 def test_pop_recursive_default(d, key, res, remainder):
     assert pop_recursive(d, key, default=0) == res
     assert d == remainder
+
+
+@pytest.mark.parametrize(
+    'keys',
+    [
+        [key for key, _, _ in make_data()],
+        ['a.f', 'a.f.g', 'a.b'],
+        ['a.d', 'a.d.e'],
+        ['a.f.g', 'notfound', 'a.b', 'a.b'],
+    ],
+)
+def test_key_trie(d, keys):
+    # Popping all keys at once is the same as popping them one after the other
+    expected = make_dict()
+    missing = object()
+    num_removed = sum(pop_recursive(expected, key, default=missing) is not missing for key in dict.fromkeys(keys))
+    report = StripReport()
+    _KeyTrie(keys).pop(d, report)
+    assert d == expected
+    # Keys nested in keys removed as a whole are not counted separately
+    assert 0 < report.keys_removed <= num_removed
+
+
+def test_drop_tagged_cells():
+    nb = {
+        'nbformat': 4,
+        'metadata': {},
+        'cells': [
+            {'cell_type': 'markdown', 'id': 'a', 'metadata': {'tags': ['foo']}, 'source': []},
+            {'cell_type': 'markdown', 'id': 'b', 'metadata': {'tags': ['bar']}, 'source': []},
+            {'cell_type': 'markdown', 'id': 'c', 'metadata': {}, 'source': []},
+        ],
+    }
+    plan = StripPlan.from_options(keep_output=False, keep_count=False, keep_id=False, drop_tagged_cells=['foo', 'bar'])
+    report = StripReport()
+    plan.apply(nb, report)
+    assert nb['cells'] == [{'cell_type': 'markdown', 'id': '0', 'metadata': {}, 'source': []}]
+    assert report == StripReport(cells_dropped=2, ids_renumbered=1)
+
+
+@pytest.mark.parametrize(
+    'item, size', [('abc', 3), (['ab', {'c': 'de', 'f': 12}], 6), ({'a': ['b', None, 1.5]}, 8), ({}, 0)]
+)
+def test_get_size(item, size):
+    assert get_size(item) == size
+    assert get_size(item, limit=size) == size
+    if size:
+        assert get_size(item, limit=size - 1) > size - 1
+
+
+def test_get_size_stops_early():
+    class Unmeasurable:
+        def __str__(self):
+            raise AssertionError('measured beyond the limit')
+
+    # The string exceeds the limit before the other item is measured
+    assert get_size([Unmeasurable(), 'a' * 10], limit=5) > 5